@@ -0,0 +1,239 @@
+# client/archive.py
+"""
+Folder / multi-file transfers as a tar stream.
+
+The sender never builds the archive on disk: ArchiveWriter runs tarfile in
+stream mode on a thread, writing into an OS pipe that the relay sender reads
+like a file. The receiver feeds relayed bytes into ArchiveExtractor, whose
+thread unpacks members as soon as they are complete. Thousands of small
+files therefore travel as full-size chunks of one transfer, with one offer,
+one completion and one progress bar.
+"""
+
+import os
+import shutil
+import sys
+import tarfile
+import threading
+import time
+
+ARCHIVE_KIND = "tar"
+PIPE_SIZE = 1024 * 1024  # Linux lets us grow the pipe so one read can fill a whole chunk
+STREAM_BUFSIZE = 256 * 1024  # tarfile reads/writes the stream in 10 KB records by default
+_F_SETPIPE_SZ = 1031
+_FILTER_ERRORS = (tarfile.FilterError,) if hasattr(tarfile, "FilterError") else ()
+
+
+def collect_entries(paths):
+    """
+    Expand the selected files/folders into (abs_path, arcname, size) entries;
+    size is None for directories. A single folder is archived by its contents;
+    loose files go to the top level. Returns (display_name, entries).
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    if len(paths) == 1 and os.path.isdir(paths[0]):
+        name = os.path.basename(paths[0].rstrip(os.sep)) or "folder"
+        roots = [(paths[0], "")]
+    else:
+        name = f"files-{time.strftime('%Y%m%d-%H%M%S')}"
+        roots = [(p, os.path.basename(p)) for p in paths]
+
+    entries = []
+    seen = set()
+    for path, arcname in roots:
+        if arcname:
+            arcname = _unique(arcname, seen)
+        if not os.path.isdir(path):
+            entries.append((path, arcname, os.path.getsize(path)))
+            continue
+        if arcname:
+            entries.append((path, arcname, None))
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            rel = os.path.relpath(dirpath, path)
+            prefix = arcname if rel == "." else (f"{arcname}/{rel}" if arcname else rel).replace(os.sep, "/")
+            for d in dirnames:
+                full = os.path.join(dirpath, d)
+                if not os.path.islink(full):
+                    entries.append((full, f"{prefix}/{d}" if prefix else d, None))
+            for f in sorted(filenames):
+                full = os.path.join(dirpath, f)
+                if os.path.isfile(full) and not os.path.islink(full):
+                    entries.append((full, f"{prefix}/{f}" if prefix else f, os.path.getsize(full)))
+    return name, entries
+
+
+def _unique(arcname, seen):
+    base, ext = os.path.splitext(arcname)
+    candidate, counter = arcname, 1
+    while candidate in seen:
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    seen.add(candidate)
+    return candidate
+
+
+def estimate_size(entries):
+    """
+    Size of the tar stream: a 512-byte header per member plus data padded to
+    512, the end marker and the final record padding. Exact unless a name
+    needs a PAX extension header; progress only needs it to be close.
+    """
+    total = 0
+    for _path, arcname, size in entries:
+        total += tarfile.BLOCKSIZE
+        if len(arcname.encode("utf-8")) > 100 or not arcname.isascii():
+            total += 2 * tarfile.BLOCKSIZE  # PAX extended header + its record
+        if size:
+            total += -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    total += 2 * tarfile.BLOCKSIZE
+    return -(-total // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+
+
+class ArchiveWriter:
+    """Produce the tar stream for entries on a thread; read it from .reader (readinto)."""
+
+    def __init__(self, entries):
+        rfd, wfd = os.pipe()
+        _grow_pipe(wfd)
+        self.reader = _PipeReader(os.fdopen(rfd, "rb", buffering=0), self)
+        self._wfile = os.fdopen(wfd, "wb", buffering=PIPE_SIZE)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, args=(entries,), daemon=True)
+        self._thread.start()
+
+    def _run(self, entries):
+        try:
+            with tarfile.open(fileobj=self._wfile, mode="w|", format=tarfile.PAX_FORMAT,
+                              bufsize=STREAM_BUFSIZE, copybufsize=STREAM_BUFSIZE) as tar:
+                for path, arcname, size in entries:
+                    info = tar.gettarinfo(path, arcname)
+                    info.mtime = int(info.mtime)  # a float mtime costs a PAX header per member
+                    if size is None:
+                        tar.addfile(info)
+                        continue
+                    try:
+                        f = open(path, "rb")
+                    except OSError as e:
+                        print(f"[ARCHIVE] skipping {path}: {e}")
+                        continue
+                    with f:
+                        tar.addfile(info, f)
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self._wfile.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop reading; a producer still writing gets a broken pipe and exits."""
+        self.reader.close()
+        self._thread.join()
+
+    def check(self):
+        if self.error:
+            raise self.error
+
+
+class _PipeReader:
+    # EOF on the pipe only means success if the producer did not fail
+    def __init__(self, raw, writer):
+        self._raw = raw
+        self._writer = writer
+
+    def readinto(self, view):
+        n = self._raw.readinto(view)
+        if not n:
+            self._writer._thread.join()
+            if self._writer.error:
+                raise self._writer.error
+        return n
+
+    def close(self):
+        self._raw.close()
+
+
+def _grow_pipe(fd):
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            fcntl.fcntl(fd, _F_SETPIPE_SZ, PIPE_SIZE)
+        except OSError:
+            pass
+
+
+class ArchiveExtractor:
+    """
+    Unpack a tar stream into dest as bytes are fed in (from the disk writer
+    thread). Only regular files and directories inside dest are extracted;
+    links, devices and paths escaping dest are skipped.
+    """
+
+    def __init__(self, dest):
+        self.dest = os.path.realpath(dest)
+        os.makedirs(self.dest, exist_ok=True)
+        self.files = 0
+        self.bytes = 0
+        self.error = None
+        rfd, wfd = os.pipe()
+        _grow_pipe(wfd)
+        self._rfile = os.fdopen(rfd, "rb")
+        self._wfile = os.fdopen(wfd, "wb", buffering=0)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, data):
+        if self.error is None:
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[self._wfile.write(view):]
+            except OSError as e:  # the extractor died; keep its error
+                self.error = self.error or e
+
+    def _run(self):
+        try:
+            with tarfile.open(fileobj=self._rfile, mode="r|", bufsize=STREAM_BUFSIZE,
+                              copybufsize=STREAM_BUFSIZE) as tar:
+                for member in tar:
+                    if not (member.isfile() or member.isdir()):
+                        continue
+                    target = os.path.realpath(os.path.join(self.dest, member.name))
+                    if os.path.commonpath([target, self.dest]) != self.dest or target == self.dest:
+                        continue
+                    try:
+                        if hasattr(tarfile, "data_filter"):
+                            tar.extract(member, self.dest, set_attrs=member.isfile(), filter="data")
+                        else:
+                            tar.extract(member, self.dest, set_attrs=member.isfile())
+                    except _FILTER_ERRORS as e:
+                        print(f"[ARCHIVE] skipping {member.name}: {e}")
+                        continue
+                    if member.isfile():
+                        self.files += 1
+                        self.bytes += member.size
+        except Exception as e:
+            self.error = e
+        finally:
+            # drain, so a feed() blocked on a full pipe cannot hang the writer
+            while self._rfile.read(PIPE_SIZE):
+                pass
+            self._rfile.close()
+
+    def close(self):
+        """All data fed: wait for the last members. Returns (files, bytes) or raises."""
+        self._wfile.close()
+        self._thread.join()
+        if self.error:
+            raise self.error
+        return self.files, self.bytes
+
+    def abort(self):
+        try:
+            self._wfile.close()
+        except OSError:
+            pass
+        self._thread.join()
+        shutil.rmtree(self.dest, ignore_errors=True)
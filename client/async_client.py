@@ -0,0 +1,390 @@
+# client/async_client.py
+"""
+asyncio client for bots and integrations.
+
+Speaks the same newline-delimited JSON protocol as client.main.Client, but
+without threads, the outbound scheduler or the GUI state, so a single event
+loop can run hundreds of sessions:
+
+    client = AsyncClient("127.0.0.1", 5555, username="buildbot")
+    await client.connect()
+    ok, msg = await client.join("team", "secret")
+    await client.send("build #42 passed")
+    async for event in client:
+        if event["type"] == "chat":
+            ...
+
+Events are the server packets as {"type": ..., "data": {...}} dicts. With
+accept_files=True a "file_offer" event also carries event["file"], an
+IncomingFile whose chunks can be streamed (async for) or saved to disk;
+file_chunk/file_complete packets are routed to it and not yielded.
+"""
+
+import asyncio
+import base64
+import os
+import time
+
+from core.utils import create_message, create_blob_message, parse_message
+from core.trace import tracer
+from client.main import DEFAULT_HOST, DEFAULT_PORT, CONNECT_TIMEOUT, AUTH_TIMEOUT, sha256_hex
+from client.file_transfer import CHUNK_SIZE, MAX_CHUNK_SIZE
+
+# a relayed file chunk is up to MAX_CHUNK_SIZE bytes as base64 plus its JSON fields, about 1.4 MB
+MAX_CHUNK_LINE = (MAX_CHUNK_SIZE + 2) // 3 * 4 + 4096
+STREAM_LIMIT = max(4 * 1024 * 1024, 2 * MAX_CHUNK_LINE)  # longest accepted line, with room to spare
+EVENT_QUEUE_LIMIT = 10000       # unread events kept per session; the oldest are dropped beyond this
+FILE_QUEUE_CHUNKS = 64          # chunks buffered per incoming file before the reader waits
+FILE_CHUNK_PREFIX = create_message("file_chunk", {})[:-3].encode("utf-8")  # b'{"type": "file_chunk", "data": '
+
+
+class IncomingFile:
+    """
+    One file being relayed to us. Iterate it for raw byte chunks, or save() it.
+    Chunks the caller does not read back-pressure this session's socket, so
+    unwanted files should be discard()ed.
+    """
+
+    def __init__(self, sender, filename, filesize):
+        self.sender = sender
+        self.filename = filename
+        self.filesize = filesize
+        self.received = 0
+        self.discarded = False
+        self._chunks = asyncio.Queue(maxsize=FILE_QUEUE_CHUNKS)
+
+    async def _feed(self, data):
+        # data=None marks the end of the file
+        if not self.discarded:
+            await self._chunks.put(data)
+
+    def discard(self):
+        self.discarded = True
+        while not self._chunks.empty():
+            self._chunks.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.discarded:
+            raise StopAsyncIteration
+        data = await self._chunks.get()
+        if data is None:
+            raise StopAsyncIteration
+        self.received += len(data)
+        return data
+
+    async def save(self, path, progress=None):
+        """
+        Write the file to path (a directory keeps the original filename).
+        progress(percent) is optional. Returns the written path.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, os.path.basename(self.filename))
+        loop = asyncio.get_running_loop()
+        fh = await loop.run_in_executor(None, open, path, "wb")
+        try:
+            async for data in self:
+                await loop.run_in_executor(None, fh.write, data)
+                if progress:
+                    progress(int(self.received * 100 / self.filesize) if self.filesize else 100)
+        finally:
+            await loop.run_in_executor(None, fh.close)
+        return path
+
+
+class AsyncClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, username=None, accept_files=False, trace=False):
+        self.address = (host, port)  # not self.host: host() is the "create a room" call
+        self.username = username
+        self.accept_files = accept_files
+        self.trace = trace  # stamp sent chat for latency tracing (see core/trace.py)
+        self.connected = False
+        self.resume_token = None
+        self.last_seq = 0
+        self.dropped_events = 0
+
+        self._reader = None
+        self._writer = None
+        self._write_lock = None
+        self._reader_task = None
+        self._events = None
+        self._auth_future = None
+        self._incoming = {}  # (sender, filename) -> IncomingFile
+        self._searches = {}  # request_id -> Future for the search_result
+
+    # ---------- connection ----------
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        if self.connected:
+            return
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(*self.address, limit=STREAM_LIMIT), timeout)
+        self._write_lock = asyncio.Lock()
+        self._events = asyncio.Queue()
+        self.connected = True
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def close(self):
+        if not self.connected:
+            return
+        self.connected = False
+        if self._reader_task and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+        self._finish()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- handshake ----------
+    async def host(self, server_name, password, timeout=AUTH_TIMEOUT):
+        """Create a room. Returns (ok, message) like Client.authenticate()."""
+        return await self._authenticate("host", server_name, password, timeout)
+
+    async def join(self, server_name, password, timeout=AUTH_TIMEOUT):
+        """Join a room. Returns (ok, message) like Client.authenticate()."""
+        return await self._authenticate("join", server_name, password, timeout)
+
+    async def _authenticate(self, kind, server_name, password, timeout):
+        self._auth_future = asyncio.get_running_loop().create_future()
+        await self.send_packet(kind, {
+            "server_name": server_name,
+            "password_hash": sha256_hex(password),
+            "username": self.username,
+        })
+        try:
+            reply = await asyncio.wait_for(self._auth_future, timeout)
+        except asyncio.TimeoutError:
+            return False, "timeout"
+        finally:
+            self._auth_future = None
+        return bool(reply.get("ok")), reply.get("message") or reply.get("reason")
+
+    # ---------- sending ----------
+    async def send_packet(self, ptype, data):
+        """Write one protocol frame; waits while the socket buffer is full."""
+        await self._write_frame((create_message(ptype, data) + "\n").encode("utf-8"))
+
+    async def _write_frame(self, payload):
+        if not self.connected:
+            raise ConnectionError("not connected")
+        async with self._write_lock:
+            self._writer.write(payload)
+            await self._writer.drain()
+
+    async def send(self, message):
+        """Send a chat message to the room."""
+        data = {"message": message}
+        if self.trace:
+            data["trace"] = {"c_send": time.time()}
+        await self.send_packet("chat", data)
+
+    async def send_stream(self, filename, filesize, chunks, target="all", progress=None):
+        """
+        Relay a file whose bytes come from an (async) iterable of chunks.
+        Frames are written one at a time, so chat sent meanwhile goes out
+        between them. progress(percent) is optional.
+        """
+        await self.send_packet("file_offer", {"filename": filename, "filesize": filesize, "target": target})
+        sent = 0
+        if hasattr(chunks, "__aiter__"):
+            async for chunk in chunks:
+                sent = await self._send_chunk(filename, filesize, target, chunk, sent, progress)
+        else:
+            for chunk in chunks:
+                sent = await self._send_chunk(filename, filesize, target, chunk, sent, progress)
+        await self.send_packet("file_complete", {"filename": filename, "target": target})
+        return filename
+
+    async def _send_chunk(self, filename, filesize, target, chunk, sent, progress):
+        # the server relays whole frames; keep each one at the threaded client's chunk size
+        for i in range(0, len(chunk), CHUNK_SIZE):
+            part = chunk[i:i + CHUNK_SIZE]
+            frame = create_blob_message("file_chunk", {
+                "filename": filename,
+                "filesize": filesize,
+                "target": target,
+                "offset": sent,
+            }, "chunk", base64.b64encode(part).decode("ascii"))
+            await self._write_frame((frame + "\n").encode("utf-8"))
+            sent += len(part)
+            if progress:
+                progress(int(sent * 100 / filesize) if filesize else 100)
+        return sent
+
+    async def send_file(self, filepath, target="all", progress=None):
+        """Relay a file from disk; reads happen in the default executor."""
+        loop = asyncio.get_running_loop()
+        filesize = os.path.getsize(filepath)
+        fh = await loop.run_in_executor(None, open, filepath, "rb")
+
+        async def _chunks():
+            while chunk := await loop.run_in_executor(None, fh.read, CHUNK_SIZE):
+                yield chunk
+
+        try:
+            return await self.send_stream(os.path.basename(filepath), filesize, _chunks(), target, progress)
+        finally:
+            fh.close()
+
+    async def search(self, query, before=None, limit=None, timeout=AUTH_TIMEOUT):
+        """
+        Search the room's chat and file names. Returns the search_result data
+        ({"results": [...], "next": cursor, ...}) or None on timeout.
+        """
+        request_id = os.urandom(4).hex()
+        future = self._searches[request_id] = asyncio.get_running_loop().create_future()
+        data = {"request_id": request_id, "query": query, "before": before}
+        if limit is not None:
+            data["limit"] = limit
+        try:
+            await self.send_packet("search", data)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._searches.pop(request_id, None)
+
+    # ---------- receiving ----------
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.next_event()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def next_event(self, timeout=None):
+        """Next event dict, or None once the connection is gone (or the timeout passed)."""
+        if self._events is None:
+            return None
+        if not self.connected and self._events.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self._events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _push(self, event):
+        if self._events.qsize() >= EVENT_QUEUE_LIMIT:
+            self._events.get_nowait()
+            self.dropped_events += 1
+        self._events.put_nowait(event)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                try:
+                    line = await self._reader.readline()
+                except ValueError:
+                    print("[ERROR] async client: oversized frame from server")
+                    break
+                if not line:
+                    break
+                if not self.accept_files and line.startswith(FILE_CHUNK_PREFIX):
+                    continue  # don't pay for decoding file data nobody will read
+                line = line.decode("utf-8").strip()
+                if not line:
+                    continue
+                packet = parse_message(line)
+                if packet.get("type") == "error":
+                    print("[DEBUG] Received invalid JSON from server:", packet.get("data", {}))
+                    continue
+                await self._handle_incoming(packet)
+        except (ConnectionError, OSError) as e:
+            print("[ERROR] async client listening:", e)
+        finally:
+            self.connected = False
+            self._finish()
+
+    def _finish(self):
+        if self._auth_future and not self._auth_future.done():
+            self._auth_future.set_result({"ok": False, "message": "disconnected"})
+        for incoming in self._incoming.values():
+            incoming.discard()
+        self._incoming.clear()
+        if self._events is not None:
+            self._events.put_nowait(None)  # wakes a waiting iterator; next_event() then sees connected=False
+
+    async def _handle_incoming(self, packet):
+        ptype = packet.get("type")
+        pdata = packet.get("data", {}) or {}
+
+        if ptype == "auth_result":
+            if pdata.get("ok"):
+                self.resume_token = pdata.get("resume_token", self.resume_token)
+                self.last_seq = max(self.last_seq, pdata.get("seq", 0))
+            if self._auth_future and not self._auth_future.done():
+                self._auth_future.set_result(pdata)
+
+        elif ptype in ("chat", "system"):
+            if "trace" in pdata:
+                tracer.received(pdata["trace"])
+            seq = pdata.get("seq")
+            if isinstance(seq, int) and seq > self.last_seq:
+                self.last_seq = seq
+
+        elif ptype == "search_result":
+            future = self._searches.get(pdata.get("request_id"))
+            if future and not future.done():
+                future.set_result(pdata)
+                return
+
+        elif ptype in ("file_offer", "file_chunk", "file_complete"):
+            if self.accept_files:
+                await self._handle_file(ptype, pdata)
+            return
+
+        elif ptype == "p2p_offer":
+            # no direct pulls here: ask the sender to relay it through the server instead
+            if self.accept_files:
+                await self.send_packet("p2p_fallback", {"transfer_id": pdata.get("transfer_id"), "from": pdata.get("from")})
+            return
+
+        elif ptype == "delta_offer":
+            # no prior versions kept here; the sender waits for every receiver's
+            # answer, so decline at once and get the whole file
+            await self.send_packet("delta_fallback", {"transfer_id": pdata.get("transfer_id"), "from": pdata.get("from")})
+            return
+
+        elif ptype == "mcast_offer":
+            # no multicast socket here either: ask for the relay before the pass starts
+            await self.send_packet("mcast_fallback", {"transfer_id": pdata.get("transfer_id"), "from": pdata.get("from")})
+            return
+
+        self._push(packet)
+
+    async def _handle_file(self, ptype, pdata):
+        key = (pdata.get("from", "unknown"), pdata.get("filename"))
+        if not key[1]:
+            return
+
+        if ptype == "file_offer":
+            incoming = IncomingFile(key[0], key[1], pdata.get("filesize", 0))
+            self._incoming[key] = incoming
+            self._push({"type": "file_offer", "data": pdata, "file": incoming})
+
+        elif ptype == "file_chunk":
+            incoming = self._incoming.get(key)
+            if incoming is None:
+                return
+            try:
+                data = base64.b64decode(pdata.get("chunk", ""))
+            except Exception:
+                data = b""
+            await incoming._feed(data)
+
+        else:
+            incoming = self._incoming.pop(key, None)
+            if incoming is not None:
+                await incoming._feed(None)
@@ -0,0 +1,310 @@
+# client/delta.py
+"""
+rsync-style delta transfer of re-shared files.
+
+Teams re-send slightly edited versions of the same file; receivers usually
+still hold the previous version in ~/.Hiena-Downloads. Instead of relaying
+every byte again:
+
+  1. The sender sends "delta_offer" {transfer_id, filename, filesize}. The
+     server forwards it to the room (or the users in "target") and tells the
+     sender who was asked ("delta_receivers").
+  2. Each receiver looks for a prior version of the file (same name, newest
+     copy). If it has one it answers "delta_signatures": the basis is cut
+     into blocks and every block is described by a weak rolling checksum
+     (adler32) and a strong one (8 bytes of blake2b). Otherwise it answers
+     "delta_fallback".
+  3. The sender slides a window over the new file, rolling the weak checksum
+     one byte at a time, and checks the strong checksum only on weak hits.
+     The result is a list of "copy basis bytes [src, src+length)" and
+     "literal bytes" operations in file order. They go through the normal
+     relay: a file_offer marked "delta", then file_chunk frames carrying
+     either a literal chunk or a "copy": [src, length] and no data. Receivers
+     that sent the same signatures share one stream.
+  4. The receiver rebuilds the file on its disk writer thread, reading the
+     copied ranges from the basis, and checks the sha256 sent in
+     file_complete. A mismatch (basis changed meanwhile, checksum collision)
+     deletes the copy and asks again with "delta_fallback".
+  5. Receivers that answered delta_fallback (or have not answered within
+     DELTA_ANSWER_WAIT) get the file the usual way: a direct offer, or the
+     relay. Answers arriving after that are ignored.
+
+The rolling checksum runs in Python, so literal regions are scanned at a
+few MB/s while matching regions advance a whole block per step at C speed.
+A literal run longer than DELTA_MAX_LITERAL_RUN means the files have little
+in common; the rest of the file is then sent verbatim without scanning.
+
+tools/delta_bench.py reports the bytes saved on typical edit patterns.
+"""
+
+import base64
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+DELTA_MIN_SIZE = 1024 * 1024            # smaller files are not worth the round trip
+DELTA_MIN_BLOCK = 2 * 1024
+DELTA_MAX_BLOCK = 64 * 1024
+DELTA_LITERAL_CHUNK = 64 * 1024         # literal bytes per file_chunk frame
+DELTA_MAX_LITERAL_RUN = 4 * 1024 * 1024  # unmatched bytes in a row before the rest goes verbatim
+DELTA_ANSWER_WAIT = 30.0                # receivers hash their whole basis before answering
+DELTA_KEEP = 3600.0                     # the sender still serves late answers this long
+_STRONG_SIZE = 8
+_MOD = 65521                            # adler32 modulus
+
+
+def block_size_for(size):
+    """Block size for a basis of size bytes: about sqrt(size), like rsync, rounded to 1 KB."""
+    block = (math.isqrt(size) + 1023) // 1024 * 1024
+    return min(DELTA_MAX_BLOCK, max(DELTA_MIN_BLOCK, block))
+
+
+def strong_sum(data):
+    return hashlib.blake2b(data, digest_size=_STRONG_SIZE).digest()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Signatures:
+    """Per-block checksums of a receiver's basis file."""
+    __slots__ = ("block", "size", "weak", "strong")
+
+    def __init__(self, block, size, weak, strong):
+        self.block = block
+        self.size = size
+        self.weak = weak        # list of adler32 values, one per block (the last one may be short)
+        self.strong = strong    # bytes, _STRONG_SIZE per block
+
+    @classmethod
+    def of_file(cls, path, block=None):
+        size = os.path.getsize(path)
+        block = block or block_size_for(size)
+        weak = []
+        strong = bytearray()
+        with open(path, "rb") as f:
+            while data := f.read(block):
+                weak.append(zlib.adler32(data))
+                strong += strong_sum(data)
+        return cls(block, size, weak, bytes(strong))
+
+    def to_dict(self):
+        return {
+            "block": self.block,
+            "size": self.size,
+            "weak": base64.b64encode(struct.pack(f"!{len(self.weak)}I", *self.weak)).decode("ascii"),
+            "strong": base64.b64encode(self.strong).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Raises ValueError for malformed signatures."""
+        try:
+            block, size = int(d["block"]), int(d["size"])
+            weak_raw = base64.b64decode(d["weak"])
+            strong = base64.b64decode(d["strong"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"bad delta signatures: {e}")
+        count = (size + block - 1) // block if block > 0 else -1
+        if block <= 0 or size < 0 or len(weak_raw) != 4 * count or len(strong) != _STRONG_SIZE * count:
+            raise ValueError("bad delta signatures: sizes do not match")
+        return cls(block, size, list(struct.unpack(f"!{count}I", weak_raw)), strong)
+
+    def key(self):
+        """Identical bases give identical keys; their receivers can share one delta stream."""
+        return hashlib.sha256(b"%d:%d:" % (self.block, self.size) + self.strong).hexdigest()
+
+
+def delta_ops(path, sigs, literal_chunk=DELTA_LITERAL_CHUNK):
+    """
+    Yield the operations that turn the basis described by sigs into the file
+    at path, in file order:
+        ("copy", offset, src, length)   basis bytes [src, src+length) go to offset
+        ("data", offset, bytes)         literal bytes (at most literal_chunk)
+    """
+    block = sigs.block
+    full = sigs.size // block
+    table = {}
+    for i in range(full):
+        table.setdefault(sigs.weak[i], []).append(i)
+    strong = sigs.strong
+    tail_len = sigs.size - full * block   # short last basis block, matched only at the end of the file
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            copy = None     # pending [offset, src, length], grown while blocks match in sequence
+            lit = 0         # start of the pending literal run
+            p = 0
+            weak = None
+            last = -1       # basis block matched last; its successor is preferred
+            while p + block <= size and table:
+                if weak is None:
+                    weak = zlib.adler32(data[p:p + block])
+                hits = table.get(weak)
+                if hits:
+                    digest = strong_sum(data[p:p + block])
+                    match = None
+                    if last + 1 in hits and strong[(last + 1) * _STRONG_SIZE:(last + 2) * _STRONG_SIZE] == digest:
+                        match = last + 1
+                    else:
+                        for i in hits:
+                            if strong[i * _STRONG_SIZE:(i + 1) * _STRONG_SIZE] == digest:
+                                match = i
+                                break
+                    if match is not None:
+                        if lit < p:
+                            if copy:
+                                yield ("copy", *copy)
+                                copy = None
+                            yield from _literal(data, lit, p, literal_chunk)
+                        src = match * block
+                        if copy and copy[1] + copy[2] == src:
+                            copy[2] += block
+                        else:
+                            if copy:
+                                yield ("copy", *copy)
+                            copy = [p, src, block]
+                        p += block
+                        lit = p
+                        last = match
+                        weak = None
+                        continue
+
+                # past a long literal run there is little in common: the rest goes as it is
+                stop = min(size - block, lit + DELTA_MAX_LITERAL_RUN)
+                if p >= stop:
+                    break
+                p, weak = _roll(data, table, p, weak, block, stop)
+
+            end = size
+            if tail_len and size - tail_len >= lit:
+                q = size - tail_len
+                if zlib.adler32(data[q:size]) == sigs.weak[-1] and strong_sum(data[q:size]) == strong[-_STRONG_SIZE:]:
+                    end = q
+            if lit < end and copy:
+                yield ("copy", *copy)
+                copy = None
+            yield from _literal(data, lit, end, literal_chunk)
+            if copy and copy[1] + copy[2] == full * block and end < size:
+                copy[2] += tail_len
+            else:
+                if copy:
+                    yield ("copy", *copy)
+                copy = [end, full * block, tail_len] if end < size else None
+            if copy:
+                yield ("copy", *copy)
+        finally:
+            data.close()
+
+
+def _roll(data, table, p, weak, block, stop):
+    """
+    Slide the window from p one byte at a time until its weak checksum is in
+    table or the window starts at stop. Returns (p, weak). The hot loop of a
+    delta: it runs for every byte that does not match the basis.
+    """
+    a = weak & 0xFFFF
+    b = weak >> 16
+    while p < stop:
+        n = min(stop - p, 1024 * 1024)
+        # drop data[p], add data[p + block]
+        for out, new in zip(data[p:p + n], data[p + block:p + block + n]):
+            a = (a - out + new) % _MOD
+            b = (b - block * out + a - 1) % _MOD
+            p += 1
+            if (b << 16 | a) in table:
+                return p, b << 16 | a
+    return p, b << 16 | a
+
+
+def _literal(data, start, end, chunk):
+    for i in range(start, end, chunk):
+        yield ("data", i, data[i:min(i + chunk, end)])
+
+
+class DeltaOffer:
+    """The sender's side of one delta offer: who was asked and what each receiver answered."""
+
+    def __init__(self, filepath, transfer_id, background=False):
+        self.filepath = filepath
+        self.transfer_id = transfer_id
+        self.filesize = os.path.getsize(filepath)
+        self.background = background
+        self.created = time.monotonic()
+        self._lock = threading.Lock()
+        self._receivers_known = threading.Event()
+        self._answered = threading.Event()
+        self._pending = set()
+        self._signatures = {}   # username -> Signatures
+        self._fallback = []     # usernames that need the whole file
+        self._batched = False   # wait() returned; the whole file went to everyone else
+        self._rebuilding = set()  # got a delta; may still ask for the whole file if it does not check out
+
+    def offer(self):
+        return {"transfer_id": self.transfer_id, "filename": os.path.basename(self.filepath),
+                "filesize": self.filesize}
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.created > DELTA_KEEP
+
+    def set_receivers(self, usernames):
+        with self._lock:
+            self._pending = set(usernames)
+            if not self._pending:
+                self._answered.set()
+        self._receivers_known.set()
+
+    def answer(self, username, sigs=None):
+        """
+        Record a receiver's signatures (None: it needs the whole file). Returns
+        False if the caller has to send this receiver the whole file itself:
+        its delta-rebuilt copy did not check out. Answers after wait() are
+        otherwise ignored, since late receivers were sent the whole file.
+        """
+        with self._lock:
+            if self._batched:
+                if sigs is None and username in self._rebuilding:
+                    self._rebuilding.discard(username)
+                    return False
+                return True
+            if sigs is None:
+                self._fallback.append(username)
+            else:
+                self._signatures[username] = sigs
+            self._pending.discard(username)
+            if not self._pending:
+                self._answered.set()
+            return True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the receivers' answers. Returns (groups, fallback, late):
+        groups maps a signature key to (Signatures, [usernames]); fallback and
+        late receivers (no answer within timeout) both need the whole file.
+        """
+        timeout = DELTA_ANSWER_WAIT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._receivers_known.wait(timeout)
+        self._answered.wait(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            self._batched = True
+            groups = {}
+            for username, sigs in sorted(self._signatures.items()):
+                groups.setdefault(sigs.key(), (sigs, []))[1].append(username)
+            self._rebuilding = set(self._signatures)
+            return groups, list(self._fallback), sorted(self._pending)
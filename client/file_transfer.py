@@ -1,117 +1,526 @@
 # client/file_transfer.py
 import os
+import sys
 import base64
+import queue
 import shutil
-from PyQt5.QtCore import QThread, pyqtSignal, QObject
-from core.utils import create_message
-
-CHUNK_SIZE = 64 * 1024  # 64 KB
-
-
-class FileSenderThread(QThread):
-    """Send a file in chunks via a connected client."""
-    progress = pyqtSignal(int)      # emits percentage
-    finished = pyqtSignal(str)      # emits filename when done
-    error = pyqtSignal(str)         # emits error string
+import threading
+import time
+from collections import deque
+from core.utils import create_message, create_blob_message, ProgressThrottle
+from client.outbound import LANE_BULK
+from client.delta import delta_ops, file_sha256
+
+CHUNK_SIZE = 64 * 1024           # 64 KB; first (and smallest) relay chunk size
+MAX_CHUNK_SIZE = 1024 * 1024     # adaptive chunks grow up to this on fast links
+FRAME_TARGET_SECONDS = 0.01      # aim for one relay frame per ~10 ms on the wire
+RATE_WINDOW = 0.25               # seconds of send-rate measurement per chunk size decision
+READ_AHEAD_BUFFERS = 4           # pooled read buffers (the read-ahead queue bound)
+WRITE_QUEUE_BYTES = 16 * 1024 * 1024  # received data waiting for the disk before the listener blocks
+
+
+class ChunkSizer:
+    """
+    Pick the relay chunk size from the measured send rate: big enough that
+    per-frame overhead vanishes on fast links, small enough that one frame
+    takes about FRAME_TARGET_SECONDS on the wire, since chat can only overtake
+    file data between frames.
+    """
+    def __init__(self, size=CHUNK_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def on_sent(self, nbytes):
+        with self._lock:
+            self._window_bytes += nbytes
+            elapsed = time.monotonic() - self._window_start
+            if elapsed < RATE_WINDOW:
+                return
+            rate = self._window_bytes / elapsed
+            self._window_start += elapsed
+            self._window_bytes = 0
+            size = CHUNK_SIZE
+            while size < MAX_CHUNK_SIZE and size * 2 <= rate * FRAME_TARGET_SECONDS:
+                size *= 2
+            self.size = size
+
+
+def _read_ahead(f, sizer, free, filled, stop):
+    """
+    Read stage: fill pooled buffers with readinto and hand them over in order.
+    Runs on its own thread so disk reads overlap encoding and sending.
+    """
+    try:
+        offset = 0
+        while not stop.is_set():
+            buf = free.get()
+            view = memoryview(buf)[:sizer.size]
+            n = 0
+            # a pipe (archive stream) returns short reads; fill the whole chunk anyway
+            while n < len(view) and (got := f.readinto(view[n:])):
+                n += got
+            if not n:
+                break
+            filled.put((buf, offset, n))
+            offset += n
+        filled.put(None)
+    except Exception as e:
+        filled.put(e)
+
+
+def send_file_chunks(client, filepath, target="all", progress=None, transfer_id=None, background=False):
+    """
+    Relay a file through the server as offer/chunk/complete packets.
+
+    Three stages overlap: a read-ahead thread fills pooled buffers, this
+    thread base64/JSON-encodes them, and the client's writer thread sends
+    them (bulk lane, so chat can overtake). Both hand-offs are bounded. The
+    chunk size follows the measured send rate (see ChunkSizer).
+    progress(percent) is called as chunks actually reach the socket.
+    transfer_id marks the relay of an earlier direct (p2p) offer.
+    Chunks are paced by client.shaper as the writer sends them (see
+    client/shaping.py); background transfers only use bandwidth the others
+    leave idle.
+    Returns the filename once the last frame has been written.
+    """
+    meta = {"filename": os.path.basename(filepath), "filesize": os.path.getsize(filepath)}
+    if transfer_id:
+        meta["transfer_id"] = transfer_id
+    with open(filepath, "rb", buffering=0) as f:
+        return _send_stream(client, f, meta, target, progress, background)
 
-    def __init__(self, client, filepath, target="all"):
-        super().__init__()
-        self.client = client
-        self.filepath = filepath
-        self.target = target
 
-    def run(self):
+def send_file_ranges(client, filepath, ranges, target, transfer_id=None, background=False):
+    """
+    Relay only the [start, end) byte ranges of a file, as chunks with offsets
+    between the usual offer and complete (multicast repairs, see
+    client/multicast.py). The receiver already holds the rest of the file.
+    Returns the number of bytes sent.
+    """
+    filename = os.path.basename(filepath)
+    filesize = os.path.getsize(filepath)
+    meta = {"filename": filename, "filesize": filesize, "target": target}
+    if transfer_id:
+        meta["transfer_id"] = transfer_id
+    done = threading.Event()
+    sizer = ChunkSizer()
+    total = 0
+
+    # every frame carries shaped: the writer charges it as it sends them, and keeps them in order
+    with open(filepath, "rb", buffering=0) as f, client.shaper.transfer(background) as shaped:
+        client.send(create_message("file_offer", meta), lane=LANE_BULK, shaped=shaped)
+        for start, end in ranges:
+            offset = max(0, start)
+            end = min(end, filesize)
+            f.seek(offset)
+            while offset < end:
+                data = f.read(min(sizer.size, end - offset))
+                if not data:
+                    break
+                packet = {"filename": filename, "filesize": filesize, "target": target, "offset": offset}
+                frame = create_blob_message("file_chunk", packet, "chunk", base64.b64encode(data).decode("ascii"))
+                if not client.send(frame, lane=LANE_BULK, on_sent=sizer.on_sent, shaped=shaped):
+                    raise ConnectionError("client closed during transfer")
+                offset += len(data)
+                total += len(data)
+
+        client.send(create_message("file_complete", {"filename": filename, "target": target}),
+                    lane=LANE_BULK, on_sent=lambda _n: done.set(), shaped=shaped)
+        while not done.wait(0.5):
+            if not client.listening:
+                raise ConnectionError("client closed during transfer")
+    return total
+
+
+def send_file_delta(client, filepath, sigs, target, transfer_id, progress=None, background=False):
+    """
+    Relay only what changed against the receivers' prior version, described
+    by their block signatures (see client/delta.py): a file_offer marked
+    "delta", file_chunk frames holding either literal data or a "copy" of a
+    basis range, and a file_complete carrying the new file's sha256.
+    Returns (literal bytes, copied bytes).
+    """
+    filename = os.path.basename(filepath)
+    filesize = os.path.getsize(filepath)
+    digest = file_sha256(filepath)
+    meta = {"filename": filename, "filesize": filesize, "target": target, "transfer_id": transfer_id,
+            "delta": True}
+    done = threading.Event()
+    sizer = ChunkSizer()
+    report = ProgressThrottle(progress) if progress else None
+    literal = copied = 0
+
+    with client.shaper.transfer(background) as shaped:
+        client.send(create_message("file_offer", meta), lane=LANE_BULK, shaped=shaped)
+        for op in delta_ops(filepath, sigs):
+            packet = {"filename": filename, "filesize": filesize, "target": target, "offset": op[1]}
+            if op[0] == "copy":
+                packet["copy"] = [op[2], op[3]]
+                frame = create_message("file_chunk", packet)
+                copied += op[3]
+                end = op[1] + op[3]
+            else:
+                frame = create_blob_message("file_chunk", packet, "chunk", base64.b64encode(op[2]).decode("ascii"))
+                literal += len(op[2])
+                end = op[1] + len(op[2])
+            if not client.send(frame, lane=LANE_BULK, on_sent=sizer.on_sent, shaped=shaped):
+                raise ConnectionError("client closed during transfer")
+            if report:
+                report(min(int(end * 100 / filesize), 100) if filesize else 100)
+
+        client.send(create_message("file_complete", {"filename": filename, "target": target,
+                                                     "transfer_id": transfer_id, "sha256": digest}),
+                    lane=LANE_BULK, on_sent=lambda _n: done.set(), shaped=shaped)
+        while not done.wait(0.5):
+            if not client.listening:
+                raise ConnectionError("client closed during transfer")
+    return literal, copied
+
+
+def send_archive_chunks(client, paths, target="all", progress=None, collected=None, background=False):
+    """
+    Relay several files and/or folders as one transfer: a tar stream built on
+    the fly (no temp file) that receivers extract as it arrives (see
+    client/archive.py). Older clients simply save it as a .tar file.
+    collected is an earlier archive.collect_entries(paths) result, if any.
+    Returns the archive's display name.
+    """
+    from client import archive
+
+    name, entries = collected or archive.collect_entries(paths)
+    stream = archive.ArchiveWriter(entries)
+    meta = {"filename": name + ".tar", "filesize": archive.estimate_size(entries),
+            "kind": archive.ARCHIVE_KIND, "files": sum(1 for e in entries if e[2] is not None)}
+    try:
+        _send_stream(client, stream.reader, meta, target, progress, background)
+    finally:
+        stream.close()
+    stream.check()
+    return name
+
+
+def _send_stream(client, source, meta, target, progress, background=False):
+    # source supports readinto(); meta holds filename/filesize (+ archive fields)
+    filename = meta["filename"]
+    filesize = meta["filesize"]
+    sent_bytes = 0
+    done = threading.Event()
+    sizer = ChunkSizer()
+    if progress:
+        progress = ProgressThrottle(progress)
+
+    def _on_chunk_sent(nbytes, size):
+        nonlocal sent_bytes
+        sent_bytes += size
+        sizer.on_sent(nbytes)
+        if progress:
+            pct = int((sent_bytes / filesize) * 100) if filesize > 0 else 100
+            progress(min(pct, 100))
+
+    # 2) Send file data in base64 chunks; include filesize so receiver always knows total
+    free = queue.Queue()
+    for _ in range(READ_AHEAD_BUFFERS):
+        free.put(bytearray(MAX_CHUNK_SIZE))
+    filled = queue.Queue()
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_ahead, args=(source, sizer, free, filled, stop), daemon=True)
+    reader.start()
+    # every frame carries shaped: the writer charges it as it sends them, and keeps them in order
+    with client.shaper.transfer(background) as shaped:
+        # 1) Send file metadata (offer)
+        client.send(create_message("file_offer", dict(meta, target=target)), lane=LANE_BULK, shaped=shaped)
         try:
-            filesize = os.path.getsize(self.filepath)
-            filename = os.path.basename(self.filepath)
-
-            # 1) Send file metadata (offer)
-            meta = {"filename": filename, "filesize": filesize, "target": self.target}
-            self.client.send(create_message("file_offer", meta))
-
-            # 2) Send file data in base64 chunks; include filesize so receiver always knows total
-            sent_bytes = 0
-            with open(self.filepath, "rb") as f:
-                while chunk := f.read(CHUNK_SIZE):
-                    encoded = base64.b64encode(chunk).decode("utf-8")
-                    packet = {"filename": filename, "chunk": encoded, "filesize": filesize, "target": self.target}
-                    self.client.send(create_message("file_chunk", packet))
-
-                    sent_bytes += len(chunk)
-                    pct = int((sent_bytes / filesize) * 100) if filesize > 0 else 100
-                    self.progress.emit(pct)
-
-            # 3) Signal completion
-            self.client.send(create_message("file_complete", {"filename": filename, "target": self.target}))
-            self.finished.emit(filename)
-
-        except Exception as e:
-            self.error.emit(str(e))
-
-
-class DownloadThread(QThread):
-    """Copy a saved file from hidden folder into ~/Downloads (with progress)."""
-    progress = pyqtSignal(int)    # percent
-    finished = pyqtSignal(str)    # destination path
-    error = pyqtSignal(str)
-
-    def __init__(self, src_path, dst_dir=None):
-        super().__init__()
-        self.src_path = src_path
-        self.dst_dir = dst_dir or os.path.join(os.path.expanduser("~"), "Downloads")
-
-    def run(self):
+            while (item := filled.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                buf, offset, n = item
+                encoded = base64.b64encode(memoryview(buf)[:n]).decode("ascii")
+                free.put(buf)  # the encoded copy is all we need now
+                packet = {"filename": filename, "filesize": filesize, "target": target, "offset": offset}
+                frame = create_blob_message("file_chunk", packet, "chunk", encoded)
+                if not client.send(frame, lane=LANE_BULK, on_sent=lambda nbytes, size=n: _on_chunk_sent(nbytes, size),
+                                   shaped=shaped):
+                    raise ConnectionError("client closed during transfer")
+        finally:
+            stop.set()
+            free.put(bytearray(0))  # unblock the reader if it waits for a buffer
+            reader.join()
+
+        # 3) Signal completion
+        client.send(create_message("file_complete", {"filename": filename, "target": target}),
+                    lane=LANE_BULK, on_sent=lambda _n: done.set(), shaped=shaped)
+        while not done.wait(0.5):
+            if not client.listening:
+                raise ConnectionError("client closed during transfer")
+    if progress:
+        progress(100)
+    return filename
+
+
+def export_file(src_path, dst_dir=None, progress=None):
+    """
+    Put a saved file (or received folder) from the hidden folder into dst_dir
+    (default ~/Downloads) under a unique name, using the cheapest mechanism
+    that works per file: reflink, copy_file_range, sendfile, then a plain
+    buffered copy. progress(percent) is optional. Returns the destination path.
+    """
+    dst_dir = dst_dir or os.path.join(os.path.expanduser("~"), "Downloads")
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(f"Source not found: {src_path}")
+
+    os.makedirs(dst_dir, exist_ok=True)
+    is_dir = os.path.isdir(src_path)
+    files = list(_walk_files(src_path)) if is_dir else [("", os.path.getsize(src_path))]
+    total = sum(size for _rel, size in files)
+    base, ext = os.path.splitext(os.path.basename(src_path))
+    if is_dir:
+        base, ext = os.path.basename(src_path), ""
+    dst = os.path.join(dst_dir, base + ext)
+
+    # ensure unique name in destination
+    counter = 1
+    while os.path.exists(dst):
+        dst = os.path.join(dst_dir, f"{base}_{counter}{ext}")
+        counter += 1
+
+    report = ProgressThrottle(progress) if progress else (lambda pct: None)
+    report(0)
+    done = 0
+
+    def _advance(nbytes):
+        nonlocal done
+        done += nbytes
+        report(int(done * 100 / total) if total > 0 else 100)
+
+    try:
+        for rel, size in files:
+            src = os.path.join(src_path, rel) if rel else src_path
+            target = os.path.join(dst, rel) if rel else dst
+            if is_dir:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            _export_one(src, target, size, _advance)
+        if is_dir:
+            # empty folders are part of what was received too
+            for dirpath, dirnames, _filenames in os.walk(src_path):
+                for d in dirnames:
+                    os.makedirs(os.path.join(dst, os.path.relpath(os.path.join(dirpath, d), src_path)), exist_ok=True)
+            os.makedirs(dst, exist_ok=True)
+    except BaseException:
+        if is_dir:
+            shutil.rmtree(dst, ignore_errors=True)
+        raise
+    report(100)
+    return dst
+
+
+def describe_file(path):
+    """The chat message for a saved file, or for a received folder (with its file count)."""
+    if not os.path.isdir(path):
+        return {"type": "file", "filename": os.path.basename(path), "filesize": os.path.getsize(path)}
+    files = list(_walk_files(path))
+    return {"type": "file", "filename": os.path.basename(path),
+            "filesize": sum(size for _rel, size in files), "files": len(files)}
+
+
+def _walk_files(root):
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for f in filenames:
+            full = os.path.join(dirpath, f)
+            yield os.path.relpath(full, root), os.path.getsize(full)
+
+
+def _export_one(src, dst, size, advance):
+    # never a hard link: an edit to the export would change the hidden copy, which is also the basis of
+    # later delta transfers (client/delta.py). A reflink shares the blocks copy-on-write instead.
+    with open(src, "rb") as sf, open(dst, "wb") as df:
         try:
-            if not os.path.exists(self.src_path):
-                raise FileNotFoundError(f"Source not found: {self.src_path}")
-
-            os.makedirs(self.dst_dir, exist_ok=True)
-            total = os.path.getsize(self.src_path)
-            base, ext = os.path.splitext(os.path.basename(self.src_path))
-            dst = os.path.join(self.dst_dir, os.path.basename(self.src_path))
-
-            # ensure unique name in destination
-            counter = 1
-            while os.path.exists(dst):
-                dst = os.path.join(self.dst_dir, f"{base}_{counter}{ext}")
-                counter += 1
-
-            copied = 0
-            with open(self.src_path, "rb") as sf, open(dst, "wb") as df:
-                while chunk := sf.read(CHUNK_SIZE):
-                    df.write(chunk)
-                    copied += len(chunk)
-                    pct = int((copied / total) * 100) if total > 0 else 100
-                    self.progress.emit(pct)
-
-            self.finished.emit(dst)
-        except Exception as e:
-            self.error.emit(str(e))
+            if _reflink(sf, df):
+                advance(size)
+            elif not _copy_in_kernel(sf, df, size, advance):
+                _copy_buffered(sf, df, advance)
+        except BaseException:
+            df.close()
+            os.remove(dst)
+            raise
+
+
+EXPORT_BLOCK = 64 * 1024 * 1024   # bytes per copy_file_range/sendfile call (one progress step)
+EXPORT_BUFFER = 8 * 1024 * 1024   # buffer for the userspace fallback copy
+_FICLONE = 0x40049409              # linux/fs.h: share all extents (btrfs, xfs, bcachefs...)
+
+
+def _reflink(sf, df):
+    """Clone the whole file copy-on-write. Returns False where unsupported."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        fcntl.ioctl(df.fileno(), _FICLONE, sf.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def _copy_in_kernel(sf, df, total, advance):
+    """
+    copy_file_range (which may still reflink or copy server-side), else sendfile;
+    either way the data never passes through Python. Returns False if neither
+    is usable for this pair of files, before anything was written.
+    """
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        offset = 0
+        try:
+            while offset < total:
+                if name == "copy_file_range":
+                    n = func(sf.fileno(), df.fileno(), min(EXPORT_BLOCK, total - offset), offset, offset)
+                else:
+                    n = func(df.fileno(), sf.fileno(), offset, min(EXPORT_BLOCK, total - offset))
+                if n == 0:
+                    break  # source shrank underneath us
+                offset += n
+                advance(n)
+            return True
+        except OSError:
+            if offset:
+                raise  # failed half way: a real I/O error, not an unsupported call
+    return False
+
+
+def _copy_buffered(sf, df, advance):
+    buf = bytearray(EXPORT_BUFFER)
+    view = memoryview(buf)
+    while n := sf.readinto(buf):
+        df.write(view[:n])
+        advance(n)
+
+
+class DiskWriter:
+    """
+    Dedicated I/O thread for incoming files, so a slow disk never stalls the
+    socket listener (and the chat behind it).
 
+    Jobs run in FIFO order. Writes are positional (os.pwrite where available),
+    so chunks may arrive out of order. At most WRITE_QUEUE_BYTES of data wait
+    in the queue; past that, put() blocks the producer, which pushes back on
+    the sender through TCP.
+    """
 
-class FileReceiver(QObject):
+    def __init__(self, max_bytes=WRITE_QUEUE_BYTES):
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._jobs = deque()
+        self._bytes = 0
+        self._thread = None
+
+    def put(self, func, *args, nbytes=0):
+        with self._cond:
+            while self._bytes and self._bytes + nbytes > self.max_bytes:
+                self._cond.wait()
+            self._bytes += nbytes
+            self._jobs.append((func, args, nbytes))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="file-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every queued job has run. Returns False on timeout."""
+        done = threading.Event()
+        self.put(done.set)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                func, args, nbytes = self._jobs.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                print("[ERROR] file writer:", e)
+            if nbytes:
+                with self._cond:
+                    self._bytes -= nbytes
+                    self._cond.notify_all()
+
+
+def _preallocate(fd, size):
+    """Reserve size bytes up front (fewer fragments, early ENOSPC); best effort."""
+    if size <= 0:
+        return
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except OSError:
+        pass
+
+
+def _b64_decoded_len(encoded):
+    # 4 characters per 3 bytes, minus padding; lets the listener book offsets without decoding
+    return len(encoded) * 3 // 4 - len(encoded[-2:]) + len(encoded[-2:].rstrip("="))
+
+
+def _write_at(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(fd, view, offset)
+            view = view[n:]
+            offset += n
+    else:
+        # Windows: no pwrite; fd is only ever touched by the writer thread
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+class FileReceiver:
     """
     Manages incoming file offers/chunks/completion and saves them under a hidden folder:
-    ~/.Hiena-Downloads
+    ~/.Hiena-Downloads (created on the first incoming file).
 
-    Emits progress as (saved_basename, percent).
+    The network thread only books each chunk under a lock; decoding and disk
+    writes happen on a DiskWriter thread. Progress is reported to listeners as
+    listener(saved_basename, percent) from that thread (the GUI wraps them in a
+    Qt signal), and finalize_file() calls on_saved(path) once the file is on disk.
     """
-    progress = pyqtSignal(str, int)  # saved_basename, percent
 
-    def __init__(self, save_dir=None):
-        super().__init__()
+    def __init__(self, save_dir=None, writer=None):
         if save_dir is None:
             save_dir = os.path.join(os.path.expanduser("~"), ".Hiena-Downloads")
         self.save_dir = save_dir
-        os.makedirs(self.save_dir, exist_ok=True)
-
-        # mapping: (sender, orig_filename) -> { 'fh': filehandle, 'total': int, 'received': int, 'saved_basename': str, 'path': str }
+        self.writer = writer or DiskWriter()
+        self._progress_listeners = []
+
+        # mapping: (sender, orig_filename) -> { 'fd': int or None, 'extractor': ArchiveExtractor or None,
+        #   'basis': fd of a delta transfer's prior version or None,
+        #   'closed': bool, 'total': int, 'next_offset': int, 'received': int, 'end': int,
+        #   'saved_basename': str, 'path': str, 'report': ProgressThrottle }
+        # next_offset is only touched on the network thread, received/end only on the writer thread
         self._downloads = {}
+        self._lock = threading.Lock()
+
+    def add_progress_listener(self, listener):
+        self._progress_listeners.append(listener)
 
-    def handle_offer(self, packet):
+    def _emit_progress(self, saved_basename, pct):
+        for listener in self._progress_listeners:
+            listener(saved_basename, pct)
+
+    def handle_offer(self, packet, basis=None):
         """
         Prepare a file on disk for incoming transfer. Packet should contain:
         {'from': sender, 'filename': filename, 'filesize': filesize}
+        and 'kind': 'tar' for a folder/multi-file transfer, which is extracted
+        into a directory (named after the archive) while it arrives.
+        basis is the prior version a delta transfer copies from (see client/delta.py).
         """
         sender = packet.get("from", "unknown")
         fname = packet.get("filename")
@@ -120,27 +529,51 @@ class FileReceiver(QObject):
             return
 
         key = (sender, fname)
-        if key in self._downloads:
-            # already prepared (duplicate offer)
-            return
-
-        base, ext = os.path.splitext(fname)
-        saved_basename = fname
-        path = os.path.join(self.save_dir, saved_basename)
-        counter = 1
-        while os.path.exists(path):
-            saved_basename = f"{base}_{counter}{ext}"
+        with self._lock:
+            if key in self._downloads:
+                # already prepared (duplicate offer)
+                return
+
+            os.makedirs(self.save_dir, exist_ok=True)
+            is_archive = packet.get("kind") == "tar"
+            base, ext = os.path.splitext(os.path.basename(fname))
+            if is_archive:
+                ext = ""
+            saved_basename = base + ext
             path = os.path.join(self.save_dir, saved_basename)
-            counter += 1
+            counter = 1
+            while os.path.exists(path):
+                saved_basename = f"{base}_{counter}{ext}"
+                path = os.path.join(self.save_dir, saved_basename)
+                counter += 1
 
-        fh = open(path, "wb")
-        self._downloads[key] = {"fh": fh, "total": total_bytes, "received": 0, "saved_basename": saved_basename, "path": path}
+            # created here so the name is reserved; preallocation is left to the writer
+            fd = extractor = basis_fd = None
+            if is_archive:
+                from client.archive import ArchiveExtractor
+                extractor = ArchiveExtractor(path)
+            else:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+                if basis:
+                    try:
+                        basis_fd = os.open(basis, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                    except OSError as e:
+                        print(f"[DELTA] cannot open {basis}: {e}")
+            report = ProgressThrottle(lambda pct, b=saved_basename: self._emit_progress(b, pct))
+            entry = {"fd": fd, "extractor": extractor, "basis": basis_fd, "closed": False, "total": total_bytes,
+                     "next_offset": 0, "received": 0, "end": 0,
+                     "saved_basename": saved_basename, "path": path, "report": report}
+            self._downloads[key] = entry
+
+        if fd is not None:
+            self.writer.put(_preallocate, fd, total_bytes)
         # emit 0% initially
-        self.progress.emit(saved_basename, 0)
+        report(0)
 
     def receive_chunk(self, packet):
         """
-        Packet expected to contain at least: {'from': sender, 'filename': fname, 'chunk': base64_str, 'filesize': maybe}
+        Packet expected to contain at least: {'from': sender, 'filename': fname, 'chunk': base64_str,
+        'filesize': maybe, 'offset': maybe}. Without an offset, chunks are appended in arrival order.
         """
         sender = packet.get("from", "unknown")
         fname = packet.get("filename")
@@ -154,26 +587,105 @@ class FileReceiver(QObject):
             total_bytes = packet.get("filesize", 0)
             self.handle_offer({'from': sender, 'filename': fname, 'filesize': total_bytes})
 
-        entry = self._downloads.get(key)
-        if entry is None:
-            return
-
+        encoded = packet.get("chunk", "")
+        offset = packet.get("offset")
+        copy = packet.get("copy")
+        with self._lock:
+            entry = self._downloads.get(key)
+            if entry is None:
+                return
+            if copy is not None:
+                # delta transfer: [src, length] of the basis goes to offset, no data in the frame
+                if not (isinstance(copy, list) and len(copy) == 2 and isinstance(offset, int)
+                        and all(isinstance(v, int) and v >= 0 for v in copy) and offset >= 0):
+                    return
+                entry["next_offset"] = max(entry["next_offset"], offset + copy[1])
+                self.writer.put(self._copy_from_basis, entry, copy[0], copy[1], offset)
+                return
+            if not isinstance(offset, int) or offset < 0:
+                offset = entry["next_offset"]
+            entry["next_offset"] = max(entry["next_offset"], offset + _b64_decoded_len(encoded))
+        self.writer.put(self._decode_and_write, entry, encoded, offset, nbytes=len(encoded))
+
+    def write_data(self, sender, fname, data, offset=None):
+        """Write raw bytes (e.g. from a direct peer stream) to a prepared download."""
+        with self._lock:
+            entry = self._downloads.get((sender, fname))
+            if entry is None:
+                return
+            if offset is None:
+                offset = entry["next_offset"]
+            entry["next_offset"] = max(entry["next_offset"], offset + len(data))
+        self.writer.put(self._write, entry, data, offset, nbytes=len(data))
+
+    def _copy_from_basis(self, entry, src, length, offset):
+        # writer thread; a short or missing basis leaves a hole that the delta's sha256 check catches
+        fd = entry["basis"]
+        while length > 0 and fd is not None and not entry["closed"]:
+            n = min(length, MAX_CHUNK_SIZE)
+            if hasattr(os, "pread"):
+                data = os.pread(fd, n, src)
+            else:
+                os.lseek(fd, src, os.SEEK_SET)
+                data = os.read(fd, n)
+            if not data:
+                break
+            self._write(entry, data, offset)
+            src += len(data)
+            offset += len(data)
+            length -= len(data)
+
+    def _decode_and_write(self, entry, encoded, offset):
         try:
-            data = base64.b64decode(packet.get("chunk", ""))
+            data = base64.b64decode(encoded)
         except Exception:
             data = b""
-
-        fh = entry["fh"]
-        fh.write(data)
+        self._write(entry, data, offset)
+
+    def _write(self, entry, data, offset):
+        # writer thread only
+        if entry["closed"]:
+            return  # aborted
+        if entry["extractor"]:
+            # a tar stream cannot be written out of order (the relay keeps frame order)
+            if offset != entry["end"]:
+                entry["extractor"].error = entry["extractor"].error or IOError(f"archive gap at offset {offset}")
+                return
+            entry["extractor"].feed(data)
+        else:
+            _write_at(entry["fd"], data, offset)
         entry["received"] += len(data)
+        entry["end"] = max(entry["end"], offset + len(data))
 
         total = entry.get("total", 0)
         pct = int((entry["received"] / total) * 100) if total > 0 else 0
-        self.progress.emit(entry["saved_basename"], pct)
+        # an archive's size is an estimate; 100% is only reported once it is extracted
+        entry["report"](min(pct, 99 if entry["extractor"] else 100))
+
+    def abort(self, sender, fname):
+        """Drop a partially received file (e.g. a broken direct transfer)."""
+        with self._lock:
+            entry = self._downloads.pop((sender, fname), None)
+        if entry:
+            self.writer.put(self._discard, entry)
+
+    def _discard(self, entry):
+        entry["closed"] = True
+        _close_basis(entry)
+        if entry["extractor"]:
+            entry["extractor"].abort()
+            return
+        try:
+            os.close(entry["fd"])
+            os.remove(entry["path"])
+        except Exception:
+            pass
 
-    def finalize_file(self, packet):
+    def finalize_file(self, packet, on_saved=None):
         """
-        Close file and return saved path. Packet should contain {'from': sender, 'filename': fname}
+        Close the file once its queued chunks are written. Packet should contain
+        {'from': sender, 'filename': fname}. on_saved(path) is called from the
+        writer thread when the file is complete on disk. Returns the target path.
         """
         sender = packet.get("from", "unknown")
         fname = packet.get("filename")
@@ -181,17 +693,58 @@ class FileReceiver(QObject):
             return None
 
         key = (sender, fname)
-        entry = self._downloads.pop(key, None)
+        with self._lock:
+            entry = self._downloads.pop(key, None)
         if not entry:
             return None
+        self.writer.put(self._close, entry, on_saved)
+        return entry["path"]
+
+    def _close(self, entry, on_saved):
+        entry["closed"] = True
+        _close_basis(entry)
+        path = entry["path"]
         try:
-            fh = entry["fh"]
-            path = entry["path"]
-            fh.close()
-            print(f"[FILE SAVED] {path}")
-            return path
-        except Exception:
+            if entry["extractor"]:
+                files, size = entry["extractor"].close()
+                print(f"[ARCHIVE] extracted {files} files ({size // 1024} KB)")
+            else:
+                # a short transfer must not leave preallocated zeros behind
+                os.ftruncate(entry["fd"], entry["end"])
+                os.close(entry["fd"])
+        except Exception as e:
+            print(f"[ERROR] could not save {path}: {e}")
+            return
+        entry["report"](100)
+        print(f"[FILE SAVED] {path}")
+        if on_saved:
+            on_saved(path)
+
+    def find_prior_version(self, filename):
+        """
+        Newest saved copy of filename (saved as name.ext, name_1.ext, ...) that
+        is not being received right now, or None. Delta transfers use it as basis.
+        """
+        base, ext = os.path.splitext(os.path.basename(filename))
+        try:
+            names = os.listdir(self.save_dir)
+        except OSError:
             return None
+        with self._lock:
+            busy = {entry["path"] for entry in self._downloads.values()}
+        best, best_mtime = None, None
+        for name in names:
+            stem, name_ext = os.path.splitext(name)
+            if name_ext != ext or not (stem == base or (stem.startswith(base + "_") and stem[len(base) + 1:].isdigit())):
+                continue
+            path = os.path.join(self.save_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if path not in busy and os.path.isfile(path) and (best_mtime is None or mtime > best_mtime):
+                best, best_mtime = path, mtime
+        return best
 
     def find_saved_path(self, saved_basename):
         """
@@ -203,5 +756,21 @@ class FileReceiver(QObject):
         return None
 
 
-# Module-level singleton shared by GUI and client listener
-file_receiver = FileReceiver()
+def _close_basis(entry):
+    if entry.get("basis") is not None:
+        try:
+            os.close(entry["basis"])
+        except OSError:
+            pass
+        entry["basis"] = None
+
+
+# Module-level singleton shared by GUI and client listener, created on first use
+_file_receiver = None
+
+
+def get_file_receiver():
+    global _file_receiver
+    if _file_receiver is None:
+        _file_receiver = FileReceiver()
+    return _file_receiver
@@ -6,17 +6,33 @@ import sys
 import os
 import time
 import hashlib
+import math
+import secrets
+import random
 
 # make project root importable
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.utils import create_message, parse_message
-from gui.app_state import app_state
-from gui.main import gui_bridge
-from client.file_transfer import file_receiver
+from core.utils import create_message, parse_message, LineBuffer, RECV_SIZE
+from core.trace import tracer
+from core.profiler import profiler
+from client.state import app_state
+from client.file_transfer import get_file_receiver, send_file_chunks, send_file_ranges, send_file_delta, describe_file
+from client.p2p import PeerFileServer, fetch_from_peer
+from client.multicast import MulticastSender, MulticastReceiver, MCAST_RATE, MCAST_MIN_SIZE
+from client.shaping import BandwidthShaper, parse_rate, format_rate
+from client.delta import DeltaOffer, Signatures, DELTA_MIN_SIZE, file_sha256
+from client.outbound import OutboundScheduler, LANE_CONTROL, LANE_CHAT, CONTROL_ONLY, ONLINE, OFFLINE
 
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 5555
+CONNECT_TIMEOUT = 5.0        # seconds for the TCP connect
+AUTH_TIMEOUT = 5.0           # seconds to wait for auth_result
+RECONNECT_BASE_DELAY = 0.5   # backoff starts here and doubles per failed attempt...
+RECONNECT_MAX_DELAY = 15.0   # ...up to this cap (the actual sleep is jittered below it)
+PRESENCE_LOG_LIMIT = 5  # larger join/leave bursts are summarised in one log line
+SEARCH_TIMEOUT = 5.0    # seconds to wait for a search_result page
+CLOSE_FLUSH_TIMEOUT = 2.0  # seconds close() waits for queued chat/control frames to go out
 
 
 def sha256_hex(s: str) -> str:
@@ -30,23 +46,77 @@ class Client:
         self.sock = None
         self.listening = False
         self.username = None  # store username for GUI tagging
+        self.file_receiver = get_file_receiver()
+        self.p2p_enabled = True    # offer files for direct LAN pulls before relaying
+        self.trace_enabled = bool(os.environ.get("HIENA_TRACE"))  # stamp sent chat for latency tracing
+        self._direct_offers = {}   # transfer_id -> PeerFileServer
+        self.multicast_enabled = False      # multicast large files to the LAN (receiving is always on)
+        self.multicast_rate = MCAST_RATE    # bytes/s for our multicast passes
+        self._mcast_sends = {}     # transfer_id -> MulticastSender
+        self._mcast_recvs = {}     # transfer_id -> MulticastReceiver
+        self.shaper = BandwidthShaper()     # upload caps, adjustable at runtime (see client/shaping.py)
+        self.delta_enabled = True  # re-shared files: send only what changed (see client/delta.py)
+        self._delta_sends = {}     # transfer_id -> DeltaOffer
+        self._delta_bases = {}     # transfer_id -> prior version our signatures describe
+        # single writer for the socket; callers only enqueue (see client/outbound.py)
+        self.outbound = OutboundScheduler(self._write)
+        self.shaper.add_listener(self.outbound.wake)  # queued chunks go at the new caps
+
+        # handshake / resume state
+        self._auth_event = threading.Event()
+        self._auth_reply = {}
+        self._auth_request = None  # (kind, data) of the last host/join, replayed if resume fails
+        self._reconnecting = False
+        self.resume_token = None
+        self.last_seq = 0          # highest room seq seen; the server replays anything newer
+        self._searches = {}        # request_id -> [Event, search_result data]
 
     def connect(self):
         """Connect to the server, start listener thread."""
         if self.sock:
             return True
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.host, self.port))
-            self.listening = True
-            threading.Thread(target=self._listener_thread, daemon=True).start()
+            self._open_socket()
             return True
-        except ConnectionRefusedError:
+        except OSError:
             print("[ERROR] Could not connect to server.")
             return False
 
-    def send(self, msg_str):
-        """Send a raw JSON message string to the server."""
+    def _open_socket(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        self.sock = sock
+        self.listening = True
+        # only handshake frames may go out until auth_result arrives
+        self.outbound.set_level(CONTROL_ONLY)
+        self.outbound.start()
+        threading.Thread(target=self._listener_thread, args=(sock,), daemon=True).start()
+
+    def authenticate(self, kind, data, timeout=AUTH_TIMEOUT):
+        """
+        Send a "host"/"join" request and block until the server's auth_result
+        arrives (instead of sleeping and hoping). Returns (ok, message).
+        The request is remembered so a reconnect can fall back to it.
+        """
+        self._auth_request = (kind, dict(data))
+        return self._handshake(kind, data, timeout)
+
+    def _handshake(self, kind, data, timeout):
+        self._auth_event.clear()
+        self._auth_reply = {}
+        self.send(create_message(kind, data), lane=LANE_CONTROL)
+        if not self._auth_event.wait(timeout):
+            return False, "timeout"
+        return bool(self._auth_reply.get("ok")), self._auth_reply.get("message") or self._auth_reply.get("reason")
+
+    def send(self, msg_str, lane=LANE_CHAT, on_sent=None, block=True, shaped=None):
+        """
+        Queue a raw JSON message string for the writer thread.
+        Chat/control sends never block; LANE_BULK sends block while the file
+        queue is full. on_sent(nbytes) fires once the frame is on the socket.
+        shaped (a ShapedTransfer) paces a bulk frame as the writer takes it.
+        Returns False if the frame was refused.
+        """
         try:
             # accept either a pre-built JSON string or a dict-like message
             if not isinstance(msg_str, str):
@@ -54,24 +124,67 @@ class Client:
                 mtype = msg_str.get("type", "unknown")
                 mdata = msg_str.get("data", {})
                 msg_str = create_message(mtype, mdata)
-            self.sock.sendall((msg_str + "\n").encode("utf-8"))
+            ok = self.outbound.put((msg_str + "\n").encode("utf-8"), lane=lane, on_sent=on_sent, block=block,
+                                   shaped=shaped)
+            if not ok:
+                print("[ERROR] send queue full or client closed; message dropped")
+            return ok
         except Exception as e:
             print("[ERROR] send failed:", e)
+            return False
 
-    def _listener_thread(self):
+    def send_chat(self, text, to=None):
+        """
+        Send a chat line to the room, or only to the usernames in `to` (a direct
+        message), and show it locally.
+        """
+        data = {"message": text}
+        if to:
+            data["to"] = sorted(to)
+        if self.trace_enabled:
+            data["trace"] = {"c_send": time.time()}
+        ok = self.send(create_message("chat", data))
+        if ok:
+            app_state.add_message(self.username, f"(to {', '.join(data['to'])}) {text}" if to else text)
+        return ok
+
+    def search(self, query, before=None, limit=None, sender=None, kind=None, timeout=SEARCH_TIMEOUT):
+        """
+        Search the room's chat and file names on the server (blocking).
+        Returns the search_result data ({"results": [...], "next": cursor, ...})
+        or None on timeout; pass "next" as before= for the following page.
+        """
+        request_id = secrets.token_hex(4)
+        waiter = self._searches[request_id] = [threading.Event(), None]
+        data = {"request_id": request_id, "query": query, "before": before}
+        for key, value in (("limit", limit), ("from", sender), ("kind", kind)):
+            if value is not None:
+                data[key] = value
+        try:
+            if not self.send(create_message("search", data)) or not waiter[0].wait(timeout):
+                return None
+            return waiter[1]
+        finally:
+            self._searches.pop(request_id, None)
+
+    def _write(self, payload):
+        """Runs on the outbound writer thread only."""
+        sock = self.sock
+        if sock is None:
+            raise ConnectionError("not connected")
+        sock.sendall(payload)
+
+    def _listener_thread(self, sock):
         """Listen for messages from the server and handle them (with buffer reassembly)."""
-        buffer = ""
+        buffer = LineBuffer()
         while self.listening:
             try:
-                data = self.sock.recv(8192)
+                data = sock.recv(RECV_SIZE)
                 if not data:
                     print("[INFO] Server closed connection.")
-                    self.listening = False
                     break
 
-                buffer += data.decode("utf-8")
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
+                for line in buffer.feed(data):
                     if not line.strip():
                         continue
                     packet = parse_message(line)
@@ -83,10 +196,73 @@ class Client:
                     self._handle_incoming(packet)
 
             except Exception as e:
-                print("[ERROR] listening:", e)
-                self.listening = False
+                if self.listening:
+                    print("[ERROR] listening:", e)
                 break
 
+        if self._reconnecting:
+            # the socket died mid-handshake: wake up the reconnect loop right away
+            self._auth_reply = {"ok": False, "message": "disconnected"}
+            self._auth_event.set()
+        elif self.listening and self.sock is sock and self._auth_request:
+            # only the listener of the current socket may start a reconnect
+            self._reconnect()
+        elif self.sock is sock:
+            self.listening = False
+
+    def _reconnect(self):
+        """Reconnect with jittered exponential backoff, then resume (or re-auth as a fallback)."""
+        old = self.sock
+        self.sock = None
+        self.outbound.set_level(OFFLINE)  # queued chat/file frames wait for the new socket
+        try:
+            old.close()
+        except Exception:
+            pass
+        self._emit_system("Connection lost, reconnecting...")
+
+        self._reconnecting = True
+        try:
+            self._reconnect_loop()
+        finally:
+            self._reconnecting = False
+
+    def _reconnect_loop(self):
+        attempt = 0
+        while self.listening:
+            # "full jitter": spreads a whole office reconnecting after a server restart
+            delay = random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** attempt)))
+            time.sleep(delay)
+            attempt += 1
+            try:
+                self._open_socket()
+            except OSError:
+                continue
+
+            ok, msg = False, None
+            if self.resume_token:
+                ok, msg = self._handshake("resume", {"resume_token": self.resume_token, "last_seq": self.last_seq}, AUTH_TIMEOUT)
+            if not ok:
+                kind, data = self._auth_request
+                ok, msg = self._handshake(kind, data, AUTH_TIMEOUT)
+                if not ok and kind == "host" and msg == "server_exists":
+                    # our room outlived the connection: enter it like any member
+                    ok, msg = self._handshake("join", data, AUTH_TIMEOUT)
+            if ok:
+                print(f"[INFO] Reconnected after {attempt} attempt(s) ({msg}).")
+                self._emit_system("Reconnected.")
+                return
+
+            # handshake failed on this socket; drop it without triggering another reconnect
+            sock, self.sock = self.sock, None
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _emit_system(self, text):
+        app_state.add_system_log(text)
+
     def _handle_incoming(self, packet):
         """Handles incoming packets and updates GUI state."""
         ptype = packet.get("type")
@@ -95,39 +271,52 @@ class Client:
         if ptype == "auth_result":
             print("[AUTH]", pdata)
             if pdata.get("ok"):
+                self.outbound.set_level(ONLINE)
+                self.resume_token = pdata.get("resume_token", self.resume_token)
+                self.last_seq = max(self.last_seq, pdata.get("seq", 0))
                 app_state.set_username(self.username)
-                try:
-                    gui_bridge.system_message.emit("Authenticated.")
-                except Exception:
-                    pass
+            self._auth_reply = pdata
+            self._auth_event.set()
 
         elif ptype == "chat":
+            self._track_seq(pdata)
             sender = pdata.get("from", "unknown")
             msg = pdata.get("message", "")
+            if pdata.get("to"):
+                sender = f"{sender} (private)"
+            if "trace" in pdata:
+                tracer.received(pdata["trace"])
             print(f"{sender}: {msg}")
 
-            # ONLY emit GUI signal; let the GUI (MainWindow.on_message_received) add to app_state.
-            try:
-                gui_bridge.message_received.emit(sender, msg)
-            except Exception:
-                pass
+            # the GUI follows app_state change notifications (see GuiBridge)
+            app_state.add_message(sender, msg)
 
         elif ptype == "system":
+            self._track_seq(pdata)
             sys_msg = pdata.get("message", "")
             print("[SYSTEM]", sys_msg)
             app_state.add_system_log(sys_msg)
-            try:
-                gui_bridge.system_message.emit(sys_msg)
-            except Exception:
-                pass
+
+        elif ptype == "search_result":
+            waiter = self._searches.get(pdata.get("request_id"))
+            if waiter:
+                waiter[1] = pdata
+                waiter[0].set()
 
         elif ptype == "clients":
+            # full presence snapshot (first join or after a detected gap)
             clients = pdata.get("list", [])
-            app_state.set_clients(clients)
-            try:
-                gui_bridge.client_list_updated.emit(clients)
-            except Exception:
-                pass
+            app_state.set_clients(clients, pdata.get("version"))
+
+        elif ptype == "presence":
+            joined = pdata.get("joined", [])
+            left = pdata.get("left", [])
+            if not app_state.apply_presence(pdata.get("version"), pdata.get("base"), joined, left):
+                # missed a delta (or no snapshot yet) -> ask for a full list
+                self.send(create_message("presence_sync", {}))
+                return
+            for line in self._presence_log_lines(joined, left):
+                app_state.add_system_log(line)
 
         # ---------- FILE TRANSFER HANDLING ----------
         elif ptype in ("file_offer", "file_chunk", "file_complete"):
@@ -136,72 +325,518 @@ class Client:
 
             if ptype == "file_offer":
                 size = pdata.get("filesize", 0)
-                print(f"[FILE OFFER] {sender} is sending {filename} ({size // 1024} KB)")
+                basis = self._delta_bases.pop(pdata.get("transfer_id"), None) if pdata.get("delta") else None
+                print(f"[FILE OFFER] {sender} is sending {filename} ({size // 1024} KB)"
+                      f"{' as a delta of ' + os.path.basename(basis) if basis else ''}")
                 # prepare file receiver slot (so GUI progress can connect early)
-                file_receiver.handle_offer(pdata)
+                self.file_receiver.handle_offer(pdata, basis=basis)
 
             elif ptype == "file_chunk":
-                file_receiver.receive_chunk(pdata)
+                self.file_receiver.receive_chunk(pdata)
 
             elif ptype == "file_complete":
-                saved_path = file_receiver.finalize_file(pdata)
-                if saved_path:
-                    print(f"[FILE COMPLETE] Saved to {saved_path}")
-                    app_state.add_message(sender, {
-                        "type": "file",
-                        "filename": os.path.basename(saved_path),
-                        "filesize": os.path.getsize(saved_path),
-                    })
-                    try:
-                        gui_bridge.messages_updated.emit()
-                    except Exception:
-                        pass
+                # reported once the writer thread has flushed the file
+                if pdata.get("sha256"):
+                    on_saved = lambda path: self._check_delta(sender, pdata, path)
+                else:
+                    on_saved = lambda path: self._on_file_saved(sender, path)
+                self.file_receiver.finalize_file(pdata, on_saved=on_saved)
+
+        # ---------- DIRECT (P2P) TRANSFER HANDLING ----------
+        elif ptype == "p2p_tokens":
+            offer = self._direct_offers.get(pdata.get("transfer_id"))
+            if offer:
+                offer.add_tokens(pdata.get("tokens", {}))
+
+        elif ptype == "p2p_offer":
+            threading.Thread(target=self._fetch_direct, args=(pdata,), daemon=True).start()
+
+        elif ptype == "p2p_fallback":
+            offer = self._direct_offers.get(pdata.get("transfer_id"))
+            username = pdata.get("username")
+            if offer and username and offer.answered(username):
+                print(f"[P2P] {username} could not connect, relaying {offer.filepath} via server")
+                offer.revoke(username)
+                threading.Thread(target=send_file_chunks, args=(self, offer.filepath, username),
+                                 kwargs={"transfer_id": pdata.get("transfer_id"),
+                                         "background": offer.shaped.background}, daemon=True).start()
+
+        # ---------- MULTICAST TRANSFER HANDLING ----------
+        elif ptype == "mcast_offer":
+            threading.Thread(target=self._receive_multicast, args=(pdata,), daemon=True).start()
+
+        elif ptype == "mcast_done":
+            receiver = self._mcast_recvs.get(pdata.get("transfer_id"))
+            if receiver:
+                receiver.done()
+
+        elif ptype in ("mcast_receivers", "mcast_ready", "mcast_nack", "mcast_fallback"):
+            self._on_multicast_answer(ptype, pdata)
+
+        # ---------- DELTA TRANSFER HANDLING ----------
+        elif ptype == "delta_offer":
+            threading.Thread(target=self._answer_delta, args=(pdata,), daemon=True).start()
+
+        elif ptype in ("delta_receivers", "delta_signatures", "delta_fallback"):
+            self._on_delta_answer(ptype, pdata)
 
         else:
             print("[RECV]", packet)
 
+    def _track_seq(self, pdata):
+        seq = pdata.get("seq")
+        if isinstance(seq, int) and seq > self.last_seq:
+            self.last_seq = seq
+
+    def _on_file_saved(self, sender, saved_path):
+        print(f"[FILE COMPLETE] Saved to {saved_path}")
+        app_state.add_message(sender, describe_file(saved_path))
+
+    def offer_direct(self, filepath, progress=None, target="all", background=False, origin=None):
+        """
+        Offer a file for direct pulls by the room or the users in target (see client/p2p.py).
+        Returns the transfer id, or None if direct transfer is disabled/unavailable,
+        in which case the caller should relay the file through the server.
+        origin is the id of an earlier offer of the same file this one completes.
+        """
+        if not self.p2p_enabled:
+            return None
+        transfer_id = secrets.token_hex(8)
+        shaped = self.shaper.transfer(background)
+        try:
+            offer = PeerFileServer(filepath, transfer_id, progress=progress, shaped=shaped)
+        except OSError as e:
+            shaped.close()
+            print("[P2P] cannot listen for direct transfer:", e)
+            return None
+
+        # forget offers that have been fully served or expired
+        self._direct_offers = {k: v for k, v in self._direct_offers.items() if not v.closed}
+        self._direct_offers[transfer_id] = offer
+        offer.start()
+        meta = {
+            "transfer_id": transfer_id,
+            "filename": os.path.basename(filepath),
+            "filesize": offer.filesize,
+            "port": offer.port,
+            "target": target,
+        }
+        if origin:
+            meta["origin"] = origin
+        self.send(create_message("p2p_offer", meta))
+        threading.Thread(target=self._relay_unclaimed, args=(offer,), daemon=True).start()
+        return transfer_id
+
+    def _relay_unclaimed(self, offer):
+        """Relay the file to receivers that never pulled it nor asked for the relay."""
+        silent = offer.take_unclaimed()
+        if silent:
+            print(f"[P2P] no answer from {', '.join(silent)}; relaying {offer.filepath} via server")
+            send_file_chunks(self, offer.filepath, silent, transfer_id=offer.transfer_id,
+                             background=offer.shaped.background)
+
+    def _fetch_direct(self, pdata):
+        """Pull an offered file straight from the sender; ask for the relay if that fails."""
+        sender = pdata.get("from", "unknown")
+        filename = pdata.get("filename")
+        if not filename:
+            return
+        print(f"[FILE OFFER] {sender} is sending {filename} ({pdata.get('filesize', 0) // 1024} KB) directly")
+        self.file_receiver.handle_offer(pdata)
+
+        ok = fetch_from_peer(
+            pdata.get("host"), pdata.get("port"), pdata.get("token", ""),
+            lambda data: self.file_receiver.write_data(sender, filename, data),
+        )
+        if ok:
+            self.file_receiver.finalize_file(pdata, on_saved=lambda path: self._on_file_saved(sender, path))
+        else:
+            self.file_receiver.abort(sender, filename)
+            self.send(create_message("p2p_fallback", {"transfer_id": pdata.get("transfer_id"), "from": sender}))
+
+    def _local_address(self):
+        """Address of our end of the server connection; multicast uses that interface."""
+        try:
+            return self.sock.getsockname()[0]
+        except (AttributeError, OSError):
+            return "0.0.0.0"
+
+    def offer_multicast(self, filepath, progress=None, target="all", background=False):
+        """
+        Multicast a large file to the room or the users in target (see client/multicast.py).
+        Returns the transfer id, or None if multicast is disabled, the file is
+        small or the socket cannot be set up; the caller then offers it directly or relays it.
+        """
+        if not self.multicast_enabled or os.path.getsize(filepath) < MCAST_MIN_SIZE:
+            return None
+        transfer_id = secrets.token_hex(8)
+        shaped = self.shaper.transfer(background)
+        try:
+            sender = MulticastSender(filepath, transfer_id, self._local_address(), rate=self.multicast_rate,
+                                     progress=progress, shaped=shaped)
+        except OSError as e:
+            shaped.close()
+            print("[MCAST] cannot multicast:", e)
+            return None
+
+        self._mcast_sends = {k: v for k, v in self._mcast_sends.items() if not v.closed}
+        self._mcast_sends[transfer_id] = sender
+        self.send(create_message("mcast_offer", dict(sender.offer(), target=target)))
+        threading.Thread(target=self._run_multicast, args=(sender,), daemon=True).start()
+        return transfer_id
+
+    def _run_multicast(self, sender):
+        try:
+            listening, silent = sender.run(self)
+            if silent:
+                print(f"[MCAST] no answer from {', '.join(silent)}, relaying {sender.filepath} via server")
+                threading.Thread(target=send_file_chunks, args=(self, sender.filepath, silent),
+                                 kwargs={"transfer_id": sender.transfer_id, "background": sender.shaped.background},
+                                 daemon=True).start()
+            if listening:
+                late = sender.wait_answers()
+                if late:
+                    print(f"[MCAST] no answer from {', '.join(late)} for {sender.filepath}")
+        finally:
+            sender.close()
+
+    def _on_multicast_answer(self, ptype, pdata):
+        """The broker routed a receiver's answer (or the receiver list) to our multicast pass."""
+        transfer_id = pdata.get("transfer_id")
+        sender = self._mcast_sends.get(transfer_id)
+        username = pdata.get("username")
+        if sender is None:
+            return
+        if ptype == "mcast_receivers":
+            sender.set_receivers(pdata.get("receivers", []))
+        elif ptype == "mcast_ready" and username:
+            sender.ready(username)
+        elif ptype == "mcast_fallback" and username:
+            if not sender.answered(username):
+                return
+            print(f"[MCAST] {username} cannot receive multicast, relaying {sender.filepath} via server")
+            threading.Thread(target=send_file_chunks, args=(self, sender.filepath, username),
+                             kwargs={"transfer_id": transfer_id, "background": sender.shaped.background},
+                             daemon=True).start()
+        elif ptype == "mcast_nack" and username:
+            if not sender.answered(username):
+                return
+            ranges = [r for r in pdata.get("ranges", []) if isinstance(r, list) and len(r) == 2]
+            if ranges:
+                print(f"[MCAST] repairing {sum(e - s for s, e in ranges) // 1024} KB in {len(ranges)} range(s) "
+                      f"for {username} via server")
+                threading.Thread(target=send_file_ranges, args=(self, sender.filepath, ranges, username),
+                                 kwargs={"transfer_id": transfer_id, "background": sender.shaped.background},
+                                 daemon=True).start()
+
+    def _open_multicast(self, pdata, on_data):
+        return MulticastReceiver(pdata, self._local_address(), on_data)
+
+    def _receive_multicast(self, pdata):
+        """Collect a multicast pass, then report the missing ranges (or fall back to the relay)."""
+        sender = pdata.get("from", "unknown")
+        filename = pdata.get("filename")
+        transfer_id = pdata.get("transfer_id")
+        if not filename or not transfer_id:
+            return
+        reply = {"transfer_id": transfer_id, "from": sender}
+        try:
+            receiver = self._open_multicast(
+                pdata, lambda offset, data: self.file_receiver.write_data(sender, filename, data, offset))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[MCAST] cannot join {pdata.get('group')}: {e}; asking for the relay")
+            self.send(create_message("mcast_fallback", reply))
+            return
+
+        print(f"[FILE OFFER] {sender} is sending {filename} ({pdata.get('filesize', 0) // 1024} KB) by multicast")
+        self.file_receiver.handle_offer(pdata)
+        self._mcast_recvs[transfer_id] = receiver
+        self.send(create_message("mcast_ready", reply))
+        try:
+            heard = receiver.run()
+        finally:
+            self._mcast_recvs.pop(transfer_id, None)
+
+        if not heard:
+            print(f"[MCAST] nothing arrived on {receiver.group}:{receiver.port}; asking for the relay")
+            self.file_receiver.abort(sender, filename)
+            self.send(create_message("mcast_fallback", reply))
+            return
+        ranges = receiver.missing()
+        print(f"[MCAST] {filename}: {receiver.received}/{len(receiver.bitmap)} blocks by multicast, "
+              f"{len(ranges)} range(s) to repair")
+        if not ranges:
+            self.file_receiver.finalize_file(pdata, on_saved=lambda path: self._on_file_saved(sender, path))
+        self.send(create_message("mcast_nack", dict(reply, ranges=ranges)))
+
+    def offer_delta(self, filepath, progress=None, target="all", background=False):
+        """
+        Offer a file as a delta against the receivers' prior versions (see client/delta.py).
+        Returns the transfer id, or None if delta transfer is disabled or the
+        file is small; the caller then offers it directly or relays it.
+        Receivers without a prior version still get the whole file.
+        """
+        if not self.delta_enabled or os.path.getsize(filepath) < DELTA_MIN_SIZE:
+            return None
+        transfer_id = secrets.token_hex(8)
+        offer = DeltaOffer(filepath, transfer_id, background)
+        self._delta_sends = {k: v for k, v in self._delta_sends.items() if not v.expired}
+        self._delta_sends[transfer_id] = offer
+        self.send(create_message("delta_offer", dict(offer.offer(), target=target)))
+        threading.Thread(target=self._run_delta, args=(offer, progress), daemon=True).start()
+        return transfer_id
+
+    def _run_delta(self, offer, progress):
+        groups, fallback, late = offer.wait()
+        if late:
+            print(f"[DELTA] no answer from {', '.join(late)} for {offer.filepath}; sending the whole file")
+        for sigs, usernames in groups.values():
+            self._send_delta(offer, sigs, usernames, progress)
+            progress = None   # the first stream reports progress
+        if fallback or late:
+            self._send_whole(offer, fallback + late, progress)
+
+    def _send_delta(self, offer, sigs, usernames, progress=None):
+        def run():
+            try:
+                literal, copied = send_file_delta(self, offer.filepath, sigs, usernames, offer.transfer_id,
+                                                  progress=progress, background=offer.background)
+                print(f"[DELTA] sent {os.path.basename(offer.filepath)} to {', '.join(usernames)}: "
+                      f"{literal // 1024} KB new, {copied // 1024} KB reused")
+            except Exception as e:
+                print(f"[DELTA SEND ERROR] {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def _send_whole(self, offer, usernames, progress=None):
+        """Receivers without a usable prior version: a direct offer, else the relay."""
+        if self.offer_direct(offer.filepath, progress=progress, target=usernames,
+                             background=offer.background, origin=offer.transfer_id):
+            return
+        threading.Thread(target=send_file_chunks, args=(self, offer.filepath, usernames),
+                         kwargs={"progress": progress, "transfer_id": offer.transfer_id,
+                                 "background": offer.background}, daemon=True).start()
+
+    def _on_delta_answer(self, ptype, pdata):
+        """The broker routed a receiver's answer (or the receiver list) to our delta offer."""
+        offer = self._delta_sends.get(pdata.get("transfer_id"))
+        username = pdata.get("username")
+        if offer is None:
+            return
+        if ptype == "delta_receivers":
+            offer.set_receivers(pdata.get("receivers", []))
+            return
+        if not username:
+            return
+        sigs = None
+        if ptype == "delta_signatures":
+            try:
+                sigs = Signatures.from_dict(pdata)
+            except ValueError as e:
+                print(f"[DELTA] {username}: {e}")
+        if not offer.answer(username, sigs):
+            # its rebuilt copy did not check out
+            print(f"[DELTA] {username} needs the whole of {offer.filepath}")
+            self._send_whole(offer, [username])
+
+    def _answer_delta(self, pdata):
+        """Describe our prior version of an offered file, or ask for the whole file."""
+        filename = pdata.get("filename")
+        transfer_id = pdata.get("transfer_id")
+        if not filename or not transfer_id:
+            return
+        reply = {"transfer_id": transfer_id, "from": pdata.get("from", "unknown")}
+        basis = self.file_receiver.find_prior_version(filename)
+        if basis:
+            try:
+                sigs = Signatures.of_file(basis)
+            except OSError as e:
+                print(f"[DELTA] cannot read {basis}: {e}")
+            else:
+                self._delta_bases[transfer_id] = basis
+                self.send(create_message("delta_signatures", dict(reply, **sigs.to_dict())))
+                return
+        self.send(create_message("delta_fallback", reply))
+
+    def _check_delta(self, sender, pdata, path):
+        """A delta-rebuilt file must hash like the sender's; otherwise ask for the whole file."""
+        def run():
+            try:
+                ok = file_sha256(path) == pdata.get("sha256")
+            except OSError:
+                ok = False
+            if ok:
+                self._on_file_saved(sender, path)
+                return
+            print(f"[DELTA] {os.path.basename(path)} does not match the sender's copy; asking for the whole file")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.send(create_message("delta_fallback", {"transfer_id": pdata.get("transfer_id"), "from": sender}))
+        threading.Thread(target=run, daemon=True).start()
+
+    def _presence_log_lines(self, joined, left):
+        """Turn a presence delta into the join/leave notices the server used to send."""
+        joined = [u for u in joined if u != self.username]
+        lines = []
+        if len(joined) > PRESENCE_LOG_LIMIT:
+            lines.append(f"{len(joined)} users have joined.")
+        else:
+            lines.extend(f"{u} has joined." for u in joined)
+        if len(left) > PRESENCE_LOG_LIMIT:
+            lines.append(f"{len(left)} users have left.")
+        else:
+            lines.extend(f"{u} has left." for u in left)
+        return lines
+
     def close(self):
+        # a last chat line or reply may still be queued; file data is not worth waiting for
+        self.outbound.flush(CLOSE_FLUSH_TIMEOUT)
         self.listening = False
+        self.outbound.stop()
+        for offer in list(self._direct_offers.values()) + list(self._mcast_sends.values()):
+            offer.close()
+        sock, self.sock = self.sock, None
         try:
-            if self.sock:
-                self.sock.close()
+            if sock:
+                sock.close()
         except Exception:
             pass
-        self.sock = None
+
+
+def _print_search(client, query, before=None):
+    reply = client.search(query, before=before)
+    if reply is None:
+        print("[SEARCH] no answer from the server")
+        return None
+    for r in reply["results"]:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["time"]))
+        what = f"[file] {r['text']}" if r["kind"] == "file" else r["text"]
+        print(f"[SEARCH] {when} {r['from']}{' (private)' if r['private'] else ''}: {what}")
+    more = " (/more for older)" if reply["next"] is not None else ""
+    print(f"[SEARCH] {len(reply['results'])} result(s) in {reply['took_ms']} ms{more}")
+    return reply["next"]
+
+
+_last_search = {"query": None, "next": None}
+
+
+def run_profile_command(args):
+    """"/profile start" or "/profile stop [path]": sample this client's threads (see core/profiler.py)."""
+    if args[:1] == ["start"]:
+        return "profiler started" if profiler.start() else "profiler already running"
+    if args[:1] == ["stop"]:
+        path, summary = profiler.stop(args[1] if len(args) > 1 else None)
+        return f"{summary}\nfolded stacks: {path}" if path else summary
+    return "usage: /profile start | /profile stop [path]"
+
+
+def _rate_arg(text):
+    """argparse type for MB/s flags: a finite number, 0 or more (0 = unlimited)."""
+    try:
+        rate = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {text}")
+    if not math.isfinite(rate) or rate < 0:
+        raise argparse.ArgumentTypeError(f"must be a finite rate of 0 or more: {text}")
+    return rate
+
+
+def run_limit_command(client, args):
+    """"/limit" shows the upload caps, "/limit [global|transfer] RATE" changes one (e.g. 2.5, 800k, off)."""
+    shaper = client.shaper
+    if not args:
+        lim = shaper.limits()
+        return (f"upload caps: global {format_rate(lim['global'])}, per transfer {format_rate(lim['transfer'])}; "
+                f"{lim['active']} transfer(s) + {lim['background']} background at "
+                f"{shaper.upload_rate() / 1048576:.2f} MB/s")
+    which = args[0] if len(args) == 2 else "global"
+    if which not in ("global", "transfer") or len(args) > 2:
+        return "usage: /limit [global|transfer] RATE  (MB/s, or 800k, 10M, off)"
+    try:
+        rate = parse_rate(args[-1])
+    except ValueError:
+        return f"bad rate: {args[-1]}"
+    shaper.set_limits(**{f"{which}_rate": rate})
+    return f"{which} upload cap set to {format_rate(rate)}"
+
+
+def _send_input_line(client, line):
+    # "/msg alice,bob text" sends a direct message, "/search words" searches the room
+    # history (/more pages back), /limit sets upload caps, /trace and /profile are
+    # diagnostics; anything else goes to the room
+    if line.startswith("/profile"):
+        print(run_profile_command(line.split()[1:]))
+        return
+    if line.split()[:1] == ["/limit"]:
+        print("[LIMIT]", run_limit_command(client, line.split()[1:]))
+        return
+    if line.strip() == "/trace":
+        print(tracer.report())
+        return
+    if line.startswith("/search "):
+        _last_search["query"] = line[len("/search "):]
+        _last_search["next"] = _print_search(client, _last_search["query"])
+        return
+    if line.strip() == "/more":
+        if _last_search["next"] is None:
+            print("[SEARCH] no more results")
+        else:
+            _last_search["next"] = _print_search(client, _last_search["query"], _last_search["next"])
+        return
+    if line.startswith("/msg "):
+        parts = line.split(" ", 2)
+        if len(parts) < 3 or not parts[2]:
+            print("[INFO] usage: /msg user[,user...] message")
+            return
+        client.send_chat(parts[2], to=[u for u in parts[1].split(",") if u])
+    else:
+        client.send_chat(line)
+
+
+def _configure_client(client, args):
+    """Apply the transfer and tracing options shared by host-server and join-server."""
+    client.p2p_enabled = not args.no_p2p
+    client.multicast_enabled = args.multicast
+    client.multicast_rate = int(args.multicast_rate * 1048576)
+    client.shaper.set_limits(int(args.limit_global * 1048576), int(args.limit_transfer * 1048576))
+    client.delta_enabled = not args.no_delta
+    client.trace_enabled = client.trace_enabled or args.trace
 
 
 def command_host(args, use_gui=False):
     client = Client(args.host, args.port)
     client.username = args.username or "host"
+    _configure_client(client, args)
     if not client.connect():
         return
 
     app_state.set_client(client)
 
     password_hash = sha256_hex(args.password)
-    payload = create_message("host", {
+    ok, msg = client.authenticate("host", {
         "server_name": args.name,
         "password_hash": password_hash,
         "username": client.username
     })
-    client.send(payload)
-
-    time.sleep(0.5)
+    if not ok:
+        print(f"[ERROR] Could not host '{args.name}': {msg}")
+        client.close()
+        return
 
     if use_gui:
         from gui.main import run_gui
         run_gui(client)
         return
 
-    print("[INFO] You are now hosting. Type chat messages to broadcast. /quit to exit.")
+    print("[INFO] You are now hosting. Type chat messages to broadcast, /msg user text to one user, "
+          "/search words to search the room. /quit to exit.")
     try:
         while True:
             line = input()
             if line.strip().lower() == "/quit":
                 break
-            msg = create_message("chat", {"message": line})
-            client.send(msg)
-            app_state.add_message(client.username, line)
+            _send_input_line(client, line)
     finally:
         client.close()
 
@@ -209,35 +844,36 @@ def command_host(args, use_gui=False):
 def command_join(args, use_gui=False):
     client = Client(args.host, args.port)
     client.username = args.username or "guest"
+    _configure_client(client, args)
     if not client.connect():
         return
 
     app_state.set_client(client)
 
     password_hash = sha256_hex(args.password)
-    payload = create_message("join", {
+    ok, msg = client.authenticate("join", {
         "server_name": args.name,
         "password_hash": password_hash,
         "username": client.username
     })
-    client.send(payload)
-
-    time.sleep(0.5)
+    if not ok:
+        print(f"[ERROR] Could not join '{args.name}': {msg}")
+        client.close()
+        return
 
     if use_gui:
         from gui.main import run_gui
         run_gui(client)
         return
 
-    print("[INFO] Joined (if auth succeeded). Type chat messages to send. /quit to exit.")
+    print("[INFO] Joined. Type chat messages to send, /msg user text to one user, "
+          "/search words to search the room. /quit to exit.")
     try:
         while True:
             line = input()
             if line.strip().lower() == "/quit":
                 break
-            msg = create_message("chat", {"message": line})
-            client.send(msg)
-            app_state.add_message(client.username, line)
+            _send_input_line(client, line)
     finally:
         client.close()
 
@@ -246,7 +882,22 @@ def main():
     parser = argparse.ArgumentParser(prog="lanchat-client", description="LAN chat client - Phase1")
     sub = parser.add_subparsers(dest="command", required=True)
 
-    hostp = sub.add_parser("host-server", help="Host a new server/room")
+    # transfer and tracing options of both commands, applied by _configure_client()
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--no-p2p", action="store_true", help="Always relay files through the server")
+    common.add_argument("--no-delta", action="store_true",
+                        help="Always send whole files, even to receivers holding a prior version")
+    common.add_argument("--multicast", action="store_true",
+                        help="Multicast large files to the LAN once, repairing losses via the server")
+    common.add_argument("--multicast-rate", type=_rate_arg, default=MCAST_RATE / 1048576, metavar="MB/S",
+                        help="Send rate for multicast files (0 = unpaced; default %(default)g)")
+    common.add_argument("--limit-global", type=_rate_arg, default=0, metavar="MB/S",
+                        help="Cap all file uploads together (0 = unlimited; /limit changes it at runtime)")
+    common.add_argument("--limit-transfer", type=_rate_arg, default=0, metavar="MB/S",
+                        help="Cap each file upload (0 = unlimited)")
+    common.add_argument("--trace", action="store_true", help="Stamp sent messages for latency tracing (/trace)")
+
+    hostp = sub.add_parser("host-server", parents=[common], help="Host a new server/room")
     hostp.add_argument("--name", required=True)
     hostp.add_argument("--password", required=True)
     hostp.add_argument("--username", required=False)
@@ -254,7 +905,7 @@ def main():
     hostp.add_argument("--port", type=int, default=DEFAULT_PORT)
     hostp.add_argument("--gui", action="store_true", help="Launch GUI client instead of CLI")
 
-    joinp = sub.add_parser("join-server", help="Join an existing server/room")
+    joinp = sub.add_parser("join-server", parents=[common], help="Join an existing server/room")
     joinp.add_argument("--name", required=True)
     joinp.add_argument("--password", required=True)
     joinp.add_argument("--username", required=False)
@@ -0,0 +1,121 @@
+# client/message_store.py
+"""
+Bounded chat message store for the client.
+
+The newest MEMORY_WINDOW messages live in a deque. Older ones are spilled to a
+throw-away SQLite file (created on first spill, deleted on close) and read back
+page by page only when the user scrolls up. Every message keeps a stable id
+(0, 1, 2, ... in arrival order), so callers can keep addressing messages by
+index exactly like the plain list this replaces: len(store), store[i].
+"""
+
+import atexit
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
+MEMORY_WINDOW = 2000   # newest messages kept in RAM
+PAGE_SIZE = 200        # messages per page read back from disk
+PAGE_CACHE = 8         # disk pages kept in RAM (LRU)
+SPILL_COMMIT_EVERY = 256
+
+
+class MessageStore:
+    def __init__(self, window=MEMORY_WINDOW, spill_dir=None):
+        self.window = window
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._recent = deque()      # (username, message) for ids [_first_recent, _count)
+        self._first_recent = 0
+        self._count = 0
+        self._db = None
+        self._db_path = None
+        self._uncommitted = 0
+        self._pages = OrderedDict() # page number -> list of (username, message)
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def append(self, username, message):
+        """Store one message and return its id."""
+        with self._lock:
+            self._recent.append((username, message))
+            msg_id = self._count
+            self._count += 1
+            if len(self._recent) > self.window:
+                self._spill(self._first_recent, self._recent.popleft())
+                self._first_recent += 1
+            return msg_id
+
+    def __getitem__(self, msg_id):
+        with self._lock:
+            if msg_id < 0:
+                msg_id += self._count
+            if not 0 <= msg_id < self._count:
+                raise IndexError(msg_id)
+            if msg_id >= self._first_recent:
+                return self._recent[msg_id - self._first_recent]
+            return self._from_disk(msg_id)
+
+    def __iter__(self):
+        for msg_id in range(len(self)):
+            yield self[msg_id]
+
+    @property
+    def first_in_memory(self):
+        """Oldest id still held in RAM; anything below is paged in from disk."""
+        with self._lock:
+            return self._first_recent
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+                try:
+                    os.remove(self._db_path)
+                except OSError:
+                    pass
+
+    # ---------- disk spill (caller holds _lock) ----------
+    def _open_db(self):
+        # imported here: most sessions never spill, so startup does not pay for sqlite3
+        import sqlite3
+        import tempfile
+        fd, self._db_path = tempfile.mkstemp(prefix="hiena-history-", suffix=".db", dir=self.spill_dir)
+        os.close(fd)
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+        # a spill file is a cache of this session only: trade durability for speed
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, username TEXT, body TEXT)")
+        atexit.register(self.close)
+
+    def _spill(self, msg_id, entry):
+        if self._db is None:
+            self._open_db()
+        username, message = entry
+        self._db.execute("INSERT INTO messages VALUES (?, ?, ?)", (msg_id, username, json.dumps(message)))
+        self._uncommitted += 1
+        if self._uncommitted >= SPILL_COMMIT_EVERY:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def _from_disk(self, msg_id):
+        page_no = msg_id // PAGE_SIZE
+        page = self._pages.get(page_no)
+        if page is None:
+            rows = self._db.execute(
+                "SELECT username, body FROM messages WHERE id >= ? AND id < ? ORDER BY id",
+                (page_no * PAGE_SIZE, (page_no + 1) * PAGE_SIZE),
+            ).fetchall()
+            page = [(username, json.loads(body)) for username, body in rows]
+            if len(page) == PAGE_SIZE:  # the page just below the RAM window may still be filling
+                self._pages[page_no] = page
+                if len(self._pages) > PAGE_CACHE:
+                    self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page_no)
+        return page[msg_id - page_no * PAGE_SIZE]
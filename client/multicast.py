@@ -0,0 +1,345 @@
+# client/multicast.py
+"""
+Multicast distribution of large files to big rooms on the LAN.
+
+A relayed file crosses the network once per receiver; multicast sends every
+block once, whatever the room size, and repairs what individual receivers
+missed over their normal server connection.
+
+Flow:
+  1. The sender opens a UDP socket (TTL 1, so datagrams never leave the LAN)
+     and sends "mcast_offer" {transfer_id, filename, filesize, group, port,
+     block} to the server, which forwards it to the room (or the users in
+     "target") and tells the sender who was asked ("mcast_receivers").
+  2. Each receiver joins the group and answers "mcast_ready", or
+     "mcast_fallback" if it cannot join.
+  3. Once everyone answered (or MCAST_READY_WAIT passed) the sender sends the
+     file once, paced to `rate` bytes/s (0: unpaced), and then "mcast_done".
+  4. Each receiver answers "mcast_nack" with the byte ranges it is missing
+     (an empty list means it saved the file). The sender relays exactly those
+     ranges to that receiver through the server as file_chunk frames with
+     offsets, followed by file_complete.
+  5. A receiver that sees no datagram at all (multicast blocked between the
+     two hosts, different subnet...) sends "mcast_fallback" instead and gets
+     the whole file through the normal relay. So does a receiver that never
+     answered the offer within MCAST_READY_WAIT (an older client, say); its
+     later answers are ignored.
+
+Datagram format (one block each, at most MCAST_BLOCK payload bytes so a
+datagram fits a 1500-byte Ethernet MTU without fragmentation):
+
+    transfer id (8 bytes) | file offset (uint64) | payload
+
+Both ends use the local address of their server connection as the multicast
+interface, so on a single host (server on 127.0.0.1) everything runs over
+the loopback device; tools/multicast_loopback.py tests it that way.
+"""
+
+import os
+import random
+import socket
+import struct
+import threading
+import time
+
+from core.utils import create_message, ProgressThrottle
+
+MCAST_BLOCK = 1400                  # payload bytes per datagram
+MCAST_RATE = 25 * 1024 * 1024       # default send rate, bytes/s (200 Mbit/s)
+MCAST_TTL = 1                       # stay on the local network
+MCAST_MIN_SIZE = 8 * 1024 * 1024    # smaller files are not worth the setup round trips
+MCAST_READY_WAIT = 3.0              # sender waits this long for receivers to join the group
+MCAST_PROBE_WAIT = 5.0              # receiver falls back if no datagram arrives this long after joining
+MCAST_DRAIN = 0.2                   # after mcast_done, read until the group is quiet this long
+MCAST_IDLE_TIMEOUT = 30.0           # receiver gives up on a stream that stopped without mcast_done
+MCAST_ANSWER_WAIT = 60.0            # sender waits this long for every receiver's nack
+MCAST_MAX_NACK_RANGES = 4096        # more missing ranges are merged (repairing a little extra)
+MCAST_RECV_BUFFER = 4 * 1024 * 1024
+MCAST_FLUSH = 256 * 1024            # contiguous blocks are handed to the disk writer in runs this size
+MCAST_PORTS = (40000, 60000)
+_HEADER = struct.Struct("!8sQ")
+
+
+def pick_group():
+    """A random group in the organisation-local scope 239.255.0.0/16 and a port for it."""
+    return f"239.255.{random.randrange(256)}.{random.randrange(1, 255)}", random.randrange(*MCAST_PORTS)
+
+
+def missing_ranges(bitmap, block, filesize, limit=MCAST_MAX_NACK_RANGES):
+    """[start, end) byte ranges of the blocks not received, merged down to at most limit ranges."""
+    ranges = []
+    i = bitmap.find(0)
+    while i != -1:
+        j = bitmap.find(1, i)
+        if j == -1:
+            j = len(bitmap)
+        ranges.append([i * block, min(j * block, filesize)])
+        i = bitmap.find(0, j)
+    if len(ranges) > limit:
+        # close the smallest gaps first, so the repair resends as little as possible
+        gaps = sorted(ranges[i + 1][0] - ranges[i][1] for i in range(len(ranges) - 1))
+        cutoff = gaps[len(ranges) - limit - 1]
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            if start - merged[-1][1] <= cutoff:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        ranges = merged
+    return ranges
+
+
+class MulticastSender:
+    """Send one file once to a multicast group and track the receivers' answers."""
+
+    def __init__(self, filepath, transfer_id, iface, rate=MCAST_RATE, block=MCAST_BLOCK, progress=None, shaped=None):
+        self.filepath = filepath
+        self.transfer_id = transfer_id
+        self.filesize = os.path.getsize(filepath)
+        self.rate = rate        # bytes/s, 0 = unpaced (only the client's caps apply)
+        self.shaped = shaped    # ShapedTransfer (client/shaping.py) for the client's caps, or None
+        self.block = block
+        self.group, self.port = pick_group()
+        # callable(percent) for the multicast pass, may be None
+        self.progress = ProgressThrottle(progress) if progress else None
+
+        self._lock = threading.Lock()
+        self._receivers_known = threading.Event()
+        self._answered = threading.Event()
+        self._receivers = set()   # asked by the broker
+        self._ready = set()       # joined the group
+        self._pending = set()     # not answered yet (ready/fallback before the pass, nack after it)
+        self._silent = set()      # never answered the offer; relayed the whole file instead
+        self._streamed = False
+        self._closed = False
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MCAST_TTL)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+        except OSError:
+            self.sock.close()
+            raise
+
+    def offer(self):
+        return {
+            "transfer_id": self.transfer_id,
+            "filename": os.path.basename(self.filepath),
+            "filesize": self.filesize,
+            "group": self.group,
+            "port": self.port,
+            "block": self.block,
+        }
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._answered.set()
+        self.sock.close()
+        if self.shaped:
+            self.shaped.close()
+
+    # ---- answers routed back by the broker ----
+    def set_receivers(self, usernames):
+        with self._lock:
+            self._receivers = set(usernames)
+            self._pending = set(usernames)
+            if not self._pending:
+                self._answered.set()
+        self._receivers_known.set()
+
+    def ready(self, username):
+        with self._lock:
+            if username in self._receivers and not self._streamed:
+                self._ready.add(username)
+                self._answer(username)
+
+    def answered(self, username):
+        """
+        A receiver fell back or sent its nack; it needs nothing more from the
+        multicast pass. Returns False if it was already relayed the whole file
+        for not answering in time (nothing more to send it).
+        """
+        with self._lock:
+            self._ready.discard(username)
+            self._answer(username)
+            return username not in self._silent
+
+    def _answer(self, username):
+        self._pending.discard(username)
+        if not self._pending:
+            self._answered.set()
+
+    # ---- the multicast pass ----
+    def run(self, client):
+        """
+        Wait for the receivers, send the file once and announce the end of the
+        pass. Returns (listening, silent): the usernames that were listening
+        and those that never answered the offer, which the caller relays the
+        whole file to. If sending fails the pass simply ends early: the
+        listeners' nacks then cover the rest of the file.
+        """
+        deadline = time.monotonic() + MCAST_READY_WAIT
+        self._receivers_known.wait(MCAST_READY_WAIT)
+        self._answered.wait(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            self._streamed = True
+            listening = sorted(self._ready)
+            self._silent = set(self._pending)
+            silent = sorted(self._silent)
+            self._pending = set(listening)
+            self._answered.clear()
+            if not self._pending:
+                self._answered.set()
+        if not listening:
+            return [], silent
+
+        start = time.monotonic()
+        try:
+            self._stream()
+            elapsed = time.monotonic() - start
+            print(f"[MCAST] sent {os.path.basename(self.filepath)} to {len(listening)} receiver(s) on "
+                  f"{self.group}:{self.port} in {elapsed:.1f}s ({self.filesize / max(elapsed, 1e-6) / 1048576:.1f} MB/s)")
+        except OSError as e:
+            print(f"[MCAST SEND ERROR] {e}")
+        client.send(create_message("mcast_done", {"transfer_id": self.transfer_id, "target": listening}))
+        return listening, silent
+
+    def wait_answers(self, timeout=MCAST_ANSWER_WAIT):
+        """Wait until every listening receiver sent its nack; returns those that did not."""
+        self._answered.wait(timeout)
+        with self._lock:
+            return sorted(self._pending)
+
+    def _stream(self):
+        tid = bytes.fromhex(self.transfer_id)
+        addr = (self.group, self.port)
+        block = self.block
+        buf = bytearray(block * max(1, (1024 * 1024) // block))
+        view = memoryview(buf)
+        start = time.monotonic()
+        sent = 0
+        with open(self.filepath, "rb", buffering=0) as f:
+            while not self._closed:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                for i in range(0, n, block):
+                    if i % (block * 32) == 0:
+                        # pace to the configured rate, and within the client's bandwidth caps
+                        if self.rate > 0:
+                            ahead = start + (sent + i) / self.rate - time.monotonic()
+                            if ahead > 0:
+                                time.sleep(ahead)
+                        if self.shaped:
+                            self.shaped.acquire(min(block * 32, n - i))
+                    self.sock.sendto(_HEADER.pack(tid, sent + i) + view[i:min(i + block, n)], addr)
+                sent += n
+                if self.progress:
+                    self.progress(min(int(sent * 100 / self.filesize), 100) if self.filesize else 100)
+
+
+class MulticastReceiver:
+    """Join a sender's group and collect the offered file's blocks."""
+
+    def __init__(self, pdata, iface, on_data, drop=0.0):
+        self.transfer_id = bytes.fromhex(pdata["transfer_id"])
+        self.filesize = int(pdata.get("filesize", 0))
+        self.block = int(pdata.get("block", MCAST_BLOCK))
+        self.group = pdata["group"]
+        self.port = int(pdata["port"])
+        self.on_data = on_data        # on_data(offset, bytes) for every run of contiguous blocks
+        self.drop = drop              # fraction of datagrams ignored on purpose (loss testing)
+        nblocks = (self.filesize + self.block - 1) // self.block
+        self.bitmap = bytearray(nblocks)
+        self.received = 0             # blocks
+        self.datagrams = 0
+        self._done = threading.Event()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MCAST_RECV_BUFFER)
+            try:
+                self.sock.bind((self.group, self.port))  # only this group's datagrams (Linux)
+            except OSError:
+                self.sock.bind(("", self.port))
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                 socket.inet_aton(self.group) + socket.inet_aton(iface))
+        except OSError:
+            self.sock.close()
+            raise
+
+    def done(self):
+        """The sender finished its pass (mcast_done)."""
+        self._done.set()
+
+    @property
+    def complete(self):
+        return self.received == len(self.bitmap)
+
+    def run(self):
+        """
+        Receive until the file is complete, or the pass is over and the group
+        went quiet. Returns False if nothing arrived within MCAST_PROBE_WAIT
+        (multicast does not reach us).
+        """
+        buf = bytearray(_HEADER.size + max(self.block, MCAST_BLOCK))
+        view = memoryview(buf)
+        run = bytearray()
+        run_start = 0
+        block = self.block
+        self.sock.settimeout(MCAST_DRAIN)
+        last = time.monotonic()
+        try:
+            while not self.complete:
+                try:
+                    n = self.sock.recv_into(buf)
+                except socket.timeout:
+                    idle = time.monotonic() - last
+                    if self._done.is_set() or idle > MCAST_IDLE_TIMEOUT:
+                        break
+                    if not self.datagrams and idle > MCAST_PROBE_WAIT:
+                        return False
+                    continue
+                last = time.monotonic()
+                if n < _HEADER.size:
+                    continue
+                tid, offset = _HEADER.unpack_from(buf)
+                if tid != self.transfer_id or offset % block or offset >= self.filesize:
+                    continue
+                self.datagrams += 1
+                if self.drop and random.random() < self.drop:
+                    continue
+                index = offset // block
+                if self.bitmap[index]:
+                    continue  # duplicate
+                self.bitmap[index] = 1
+                self.received += 1
+                if run and (offset != run_start + len(run) or len(run) >= MCAST_FLUSH):
+                    self.on_data(run_start, bytes(run))
+                    run.clear()
+                if not run:
+                    run_start = offset
+                run += view[_HEADER.size:n]
+            return self.datagrams > 0
+        finally:
+            if run:
+                self.on_data(run_start, bytes(run))
+            self.close()
+
+    def missing(self):
+        return missing_ranges(self.bitmap, self.block, self.filesize)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,196 @@
+# client/outbound.py
+"""
+Single-writer outbound queue for the client socket.
+
+Every frame the client sends (GUI chat, CLI input, file senders, p2p
+brokering) is encoded by the caller and queued here; one writer thread owns
+sock.sendall, so frames can never interleave and the GUI thread never blocks
+on a slow upload.
+
+Lanes are drained strictly by priority:
+  LANE_CONTROL  handshakes (host/join/resume) - the only lane allowed while (re)authenticating
+  LANE_CHAT     chat and small protocol messages - overtakes queued file data
+  LANE_BULK     file offer/chunk/complete - bounded by BULK_QUEUE_BYTES; producers block
+
+Each frame may carry an on_sent(nbytes) callback, called from the writer thread
+once the frame is actually on the socket, which is what transfer progress uses.
+
+Bulk frames of a shaped upload carry its ShapedTransfer (client/shaping.py).
+The writer charges the upload's token buckets when it takes such a frame,
+not when it is queued, so a new cap applies to what is already queued. A
+frame whose upload has to wait is passed over by other uploads' frames but
+never by later frames of its own upload, so an upload tags its offer and
+completion too; an untagged bulk frame waits for every frame queued before
+it. Each upload may queue BULK_QUEUE_BYTES, or about shaping.QUEUE_INTERVAL
+of its cap if that is less.
+"""
+
+import threading
+import time
+from collections import deque
+
+LANE_CONTROL = 0
+LANE_CHAT = 1
+LANE_BULK = 2
+
+OFFLINE = -1                        # nothing may be written
+CONTROL_ONLY = LANE_CONTROL         # connected, handshake in progress
+ONLINE = LANE_BULK                  # authenticated, every lane flows
+
+BULK_QUEUE_BYTES = 4 * 1024 * 1024  # file data buffered ahead of the socket
+CHAT_QUEUE_LIMIT = 10000            # frames; beyond this non-blocking sends are refused
+
+
+class OutboundScheduler:
+    def __init__(self, write):
+        """write(payload_bytes) sends one frame on the current socket or raises."""
+        self._write = write
+        self._cond = threading.Condition()
+        self._lanes = (deque(), deque(), deque())
+        self._bulk_bytes = {}   # ShapedTransfer (None for untagged frames) -> queued bulk bytes
+        self._level = OFFLINE   # highest lane number the writer may drain
+        self._epoch = 0         # bumped on every state change, see _run()
+        self._stopped = False
+        self._thread = None
+        self._in_flight = None  # lane of the frame being written
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout, lanes=(LANE_CONTROL, LANE_CHAT)):
+        """
+        Wait up to timeout seconds until the frames queued in lanes are on the
+        socket. Returns False if they are not (timeout, or offline).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(self._lanes[lane] for lane in lanes) or self._in_flight in lanes:
+                remaining = deadline - time.monotonic()
+                if self._stopped or remaining <= 0 or self._level < max(lanes):
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def wake(self):
+        """Make the writer look at the queue again (the upload caps changed)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def set_level(self, level):
+        """OFFLINE, CONTROL_ONLY or ONLINE."""
+        with self._cond:
+            self._level = level
+            self._epoch += 1
+            self._cond.notify_all()
+
+    def put(self, payload, lane=LANE_CHAT, on_sent=None, block=True, shaped=None):
+        """
+        Queue one encoded frame. Bulk frames block while their upload (shaped,
+        a ShapedTransfer, or None) has its share queued (unless block=False);
+        chat/control never block.
+        Returns False if the frame was refused (queue full or scheduler stopped).
+        """
+        with self._cond:
+            if self._stopped:
+                return False
+            if lane == LANE_BULK:
+                while True:
+                    queued = self._bulk_bytes.get(shaped, 0)
+                    limit = shaped.queue_limit(BULK_QUEUE_BYTES) if shaped else BULK_QUEUE_BYTES
+                    if not queued or queued + len(payload) <= limit:
+                        break
+                    if not block or self._stopped:
+                        return False
+                    self._cond.wait()
+                self._bulk_bytes[shaped] = queued + len(payload)
+            elif lane == LANE_CHAT and len(self._lanes[LANE_CHAT]) >= CHAT_QUEUE_LIMIT:
+                return False
+            self._lanes[lane].append((payload, on_sent, shaped))
+            self._cond.notify_all()
+            return True
+
+    def pending(self):
+        """Number of queued frames per lane (control, chat, bulk)."""
+        with self._cond:
+            return tuple(len(q) for q in self._lanes)
+
+    def _next(self):
+        """
+        (lane, item, wait): the next frame to write, or (None, None, wait) with
+        the seconds until a shaped frame may go (None: until notified).
+        Caller holds _cond.
+        """
+        for lane in range(min(self._level, LANE_CHAT) + 1):
+            if self._lanes[lane]:
+                return lane, self._lanes[lane].popleft(), None
+        if self._level < LANE_BULK:
+            return None, None, None
+        bulk = self._lanes[LANE_BULK]
+        waiting = set()   # uploads whose first queued frame has to wait
+        wait = None
+        for i, item in enumerate(bulk):
+            shaped = item[2]
+            if shaped is None:
+                if waiting:
+                    break
+            elif shaped in waiting:
+                continue
+            else:
+                delay = shaped.try_acquire(len(item[0]))
+                if delay > 0:
+                    waiting.add(shaped)
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+            del bulk[i]
+            return LANE_BULK, item, None
+        return None, None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                lane, item, wait = self._next()
+                while item is None and not self._stopped:
+                    self._cond.wait(wait)
+                    lane, item, wait = self._next()
+                if self._stopped:
+                    return
+                epoch = self._epoch
+                self._in_flight = lane
+
+            payload, on_sent, shaped = item
+            try:
+                self._write(payload)
+            except Exception as e:
+                with self._cond:
+                    # keep the frame (it is re-sent whole on the next socket) and stop
+                    # writing until the client reconnects - unless that already happened
+                    self._lanes[lane].appendleft(item)
+                    self._in_flight = None
+                    if self._epoch == epoch:
+                        self._level = OFFLINE
+                    self._cond.notify_all()
+                print("[ERROR] send failed:", e)
+                continue
+
+            with self._cond:
+                self._in_flight = None
+                if lane == LANE_BULK:
+                    queued = self._bulk_bytes[shaped] - len(payload)
+                    if queued:
+                        self._bulk_bytes[shaped] = queued
+                    else:
+                        del self._bulk_bytes[shaped]
+                self._cond.notify_all()
+            if on_sent:
+                try:
+                    on_sent(len(payload))
+                except Exception as e:
+                    print("[ERROR] on_sent callback:", e)
@@ -0,0 +1,241 @@
+# client/p2p.py
+"""
+Direct (peer-to-peer) file transfer on the LAN, brokered by the server.
+
+Flow:
+  1. The sender opens a PeerFileServer on an ephemeral port and sends
+     "p2p_offer" {transfer_id, filename, filesize, port} to the server.
+  2. The server issues one one-time token per receiver. It hands the sender the
+     token list ("p2p_tokens") and each receiver its own token plus the sender's
+     endpoint ("p2p_offer").
+  3. Each receiver connects to the sender, presents its token and pulls the file
+     with fetch_from_peer().
+  4. If a receiver cannot connect (or the stream breaks) it sends "p2p_fallback"
+     and the sender relays the file to that user through the server instead.
+  5. Receivers that neither pulled nor fell back within P2P_CLAIM_WAIT (older
+     clients, a dead handler) lose their token and get the file through the
+     relay too; a fallback arriving after that is ignored.
+
+Wire format on the direct connection:
+  receiver -> sender : "<token>\\n"
+  sender -> receiver : '{"ok": true, "filesize": N}\\n' followed by N raw bytes
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+from core.utils import ProgressThrottle
+
+P2P_CONNECT_TIMEOUT = 5.0     # receiver gives up connecting after this
+P2P_IO_TIMEOUT = 30.0         # stalled direct stream is treated as failed
+P2P_TOKEN_WAIT = 10.0         # sender waits this long for the broker's token list
+P2P_OFFER_TTL = 10 * 60       # sender closes an offer nobody picked up
+P2P_CLAIM_WAIT = 30.0         # receivers connect right away, or fall back within P2P_CONNECT_TIMEOUT
+P2P_BLOCK = 1024 * 1024       # sendfile()/progress granularity
+P2P_RECV_BUFFER = 256 * 1024
+
+
+def _read_line(sock, limit=4096):
+    """Read one newline-terminated line byte-wise (only used for the short handshake)."""
+    data = b""
+    while not data.endswith(b"\n"):
+        ch = sock.recv(1)
+        if not ch:
+            break
+        data += ch
+        if len(data) > limit:
+            break
+    return data.decode("utf-8", "replace").strip()
+
+
+class PeerFileServer:
+    """Serve one file to receivers that present a broker-issued one-time token."""
+
+    def __init__(self, filepath, transfer_id, progress=None, bind_host="0.0.0.0", shaped=None):
+        self.filepath = filepath
+        self.transfer_id = transfer_id
+        self.filesize = os.path.getsize(filepath)
+        self.shaped = shaped    # ShapedTransfer (client/shaping.py) pacing all receivers, or None
+        # callable(percent) over all receivers, may be None
+        self.progress = ProgressThrottle(progress) if progress else None
+
+        self._tokens = {}                 # token -> username still allowed to pull
+        self._tokens_ready = threading.Event()
+        self._lock = threading.Lock()
+        self._claimed = threading.Condition(self._lock)  # notified whenever a token is used or revoked
+        self._silent = set()              # receivers relayed to after P2P_CLAIM_WAIT
+        self._expected = 0                # receivers announced by the broker
+        self._sent = 0                    # bytes served to all receivers
+        self._closed = False
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((bind_host, 0))
+        self.sock.listen()
+        self.sock.settimeout(1.0)
+        self.port = self.sock.getsockname()[1]
+        self._deadline = time.monotonic() + P2P_OFFER_TTL
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def add_tokens(self, tokens):
+        """Register the broker's {token: username} map. An empty map closes the offer."""
+        with self._lock:
+            self._tokens.update(tokens)
+            self._expected = len(tokens)
+        self._tokens_ready.set()
+        if not tokens:
+            self.close()
+
+    def revoke(self, username):
+        """Drop the token of a receiver that switched to the relay fallback."""
+        with self._lock:
+            for tok, user in list(self._tokens.items()):
+                if user == username:
+                    del self._tokens[tok]
+            self._claimed.notify_all()
+            done = self._tokens_ready.is_set() and not self._tokens
+        if done:
+            self.close()
+
+    def take_unclaimed(self, timeout=None):
+        """
+        Wait up to timeout (default P2P_CLAIM_WAIT) for every receiver to use
+        its token or fall back, then revoke the tokens still unused. Returns
+        those receivers' usernames; the caller relays the file to them.
+        """
+        deadline = time.monotonic() + (P2P_CLAIM_WAIT if timeout is None else timeout)
+        self._tokens_ready.wait(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            self._claimed.wait_for(lambda: not self._tokens or self._closed, max(0.0, deadline - time.monotonic()))
+            silent = sorted(set(self._tokens.values()))
+            self._tokens.clear()
+            self._silent.update(silent)
+            done = self._tokens_ready.is_set()
+        if silent and done:
+            self.close()
+        return silent
+
+    def answered(self, username):
+        """False for receivers take_unclaimed() handed to the relay: their late fallback is ignored."""
+        with self._lock:
+            return username not in self._silent
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+        if self.shaped:
+            self.shaped.close()
+
+    def _accept_loop(self):
+        while not self._closed and time.monotonic() < self._deadline:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn, addr), daemon=True).start()
+        self.close()
+
+    def _serve(self, conn, addr):
+        try:
+            conn.settimeout(P2P_IO_TIMEOUT)
+            token = _read_line(conn)
+            # the receiver may race the broker's token list to us
+            self._tokens_ready.wait(P2P_TOKEN_WAIT)
+            with self._lock:
+                username = self._tokens.pop(token, None)
+                self._claimed.notify_all()
+            if username is None:
+                conn.sendall(b'{"ok": false, "reason": "bad_token"}\n')
+                return
+
+            header = json.dumps({"ok": True, "filesize": self.filesize})
+            conn.sendall((header + "\n").encode("utf-8"))
+            with open(self.filepath, "rb") as f:
+                offset = 0
+                while offset < self.filesize:
+                    count = min(P2P_BLOCK, self.filesize - offset)
+                    if self.shaped:
+                        count = min(count, self.shaped.block_size(P2P_BLOCK))
+                        self.shaped.acquire(count)
+                    sent = conn.sendfile(f, offset, count)
+                    if not sent:
+                        break
+                    offset += sent
+                    self._account(sent)
+            print(f"[P2P] served {os.path.basename(self.filepath)} to {username}@{addr[0]}")
+        except Exception as e:
+            print(f"[P2P SEND ERROR] {e}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                done = self._tokens_ready.is_set() and not self._tokens
+            if done:
+                self.close()
+
+    def _account(self, nbytes):
+        with self._lock:
+            self._sent += nbytes
+            total = self.filesize * max(self._expected, 1)
+            pct = int(self._sent * 100 / total) if total > 0 else 100
+        if self.progress:
+            self.progress(min(pct, 100))
+
+
+def fetch_from_peer(host, port, token, on_data, connect_timeout=P2P_CONNECT_TIMEOUT):
+    """
+    Pull a file directly from a PeerFileServer.
+    on_data(bytes) is called for every received block.
+    Returns True only if the full advertised filesize was received.
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout=connect_timeout)
+    except OSError as e:
+        print(f"[P2P] cannot reach {host}:{port}: {e}")
+        return False
+
+    try:
+        sock.settimeout(P2P_IO_TIMEOUT)
+        sock.sendall((token + "\n").encode("utf-8"))
+        header = json.loads(_read_line(sock) or "{}")
+        if not header.get("ok"):
+            print(f"[P2P] peer refused transfer: {header.get('reason')}")
+            return False
+
+        remaining = header.get("filesize", 0)
+        buf = bytearray(P2P_RECV_BUFFER)
+        view = memoryview(buf)
+        while remaining > 0:
+            n = sock.recv_into(view, min(len(buf), remaining))
+            if not n:
+                return False
+            on_data(bytes(view[:n]))
+            remaining -= n
+        return True
+    except Exception as e:
+        print(f"[P2P RECV ERROR] {e}")
+        return False
+    finally:
+        try:
+            sock.close()
+        except Exception:
+            pass
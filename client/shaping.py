@@ -0,0 +1,238 @@
+# client/shaping.py
+"""
+Bandwidth shaping for the client's uploads, with token buckets.
+
+    global cap     all uploads together: relayed files, direct (p2p) pulls
+                   served to peers and multicast passes
+    transfer cap   each upload on its own (the default for new transfers;
+                   a single transfer can be given its own with set_rate)
+    background     transfers of this class only use capacity the foreground
+                   transfers leave idle: they wait while any foreground
+                   transfer sent or wanted to send within BACKGROUND_IDLE
+
+Rates are bytes/s, 0 = unlimited, and can be changed at any time: waiting
+transfers are woken and the next chunk of every transfer in flight already
+uses the new rates. Chat never goes through a bucket.
+
+Relayed files are shaped where frames leave the client: the outbound writer
+(client/outbound.py) takes a chunk off the queue only once try_acquire()
+lets it go, so chunks queued before a rate change go out at the new rate.
+Direct (p2p) and multicast senders write their own sockets and call
+acquire(nbytes), which blocks, before each block. A chunk larger than the
+bucket may overdraw it; the debt is paid back before the next chunk, so the
+average rate holds whatever the chunk size.
+"""
+
+import math
+import threading
+import time
+
+SHAPING_BURST = 0.25      # seconds of its rate a bucket may save up
+BACKGROUND_IDLE = 0.5     # foreground activity this recent keeps background transfers waiting
+RATE_WINDOW = 1.0         # seconds over which upload_rate() is measured
+SMOOTH_INTERVAL = 0.05    # capped uploads send about this many seconds of their rate at once
+QUEUE_INTERVAL = 0.5      # capped relays queue about this many seconds of their rate ahead of the writer
+MIN_BLOCK = 16 * 1024
+
+
+class TokenBucket:
+    """Tokens are bytes; rate 0 means unlimited. Callers hold the shaper's lock."""
+    __slots__ = ("rate", "tokens", "last")
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.tokens + (now - self.last) * self.rate, self.rate * SHAPING_BURST)
+        else:
+            self.tokens = 0.0
+        self.last = now
+
+    def set_rate(self, rate, now):
+        self.refill(now)
+        self.rate = rate
+        self.tokens = min(self.tokens, rate * SHAPING_BURST) if rate else 0.0
+
+    def wait_time(self):
+        """Seconds until the bucket is out of debt (0 = a chunk may go now)."""
+        if not self.rate or self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def take(self, nbytes):
+        if self.rate:
+            self.tokens -= nbytes
+
+
+class ShapedTransfer:
+    """One upload's share of the shaper; use as a context manager or close() it."""
+
+    def __init__(self, shaper, background, rate):
+        self.shaper = shaper
+        self.background = background
+        self.bucket = TokenBucket(rate)
+        self.own_rate = False   # set_rate() was called: the shaper's transfer cap no longer applies
+        self.sent = 0
+
+    def acquire(self, nbytes):
+        self.shaper._acquire(self, nbytes)
+
+    def try_acquire(self, nbytes):
+        """Take nbytes if the caps allow it now (returns 0), else the seconds to wait before asking again."""
+        return self.shaper._try_acquire(self, nbytes)
+
+    def queue_limit(self, limit):
+        """Bytes of this upload worth queueing ahead of the writer: limit, or about QUEUE_INTERVAL of its cap."""
+        rates = [r for r in (self.bucket.rate, self.shaper.global_rate) if r]
+        if not rates:
+            return limit
+        return max(MIN_BLOCK, min(limit, int(min(rates) * QUEUE_INTERVAL)))
+
+    def block_size(self, limit):
+        """Bytes per send that keep a capped upload smooth (about SMOOTH_INTERVAL of its rate)."""
+        rates = [r for r in (self.bucket.rate, self.shaper.global_rate) if r]
+        if not rates:
+            return limit
+        return max(MIN_BLOCK, min(limit, int(min(rates) * SMOOTH_INTERVAL)))
+
+    def set_rate(self, rate):
+        self.shaper._set_transfer_rate(self, rate)
+
+    def close(self):
+        self.shaper._forget(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BandwidthShaper:
+    def __init__(self, global_rate=0, transfer_rate=0):
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate)
+        self.transfer_rate = transfer_rate
+        self._transfers = set()
+        self._last_foreground = 0.0
+        self._sent = 0
+        self._window = (time.monotonic(), 0)   # (start, bytes sent at start) for upload_rate()
+        self._listeners = []                   # called after every change of the caps
+
+    def add_listener(self, callback):
+        """callback() runs (without the shaper's lock) whenever the caps change."""
+        self._listeners.append(callback)
+
+    @property
+    def global_rate(self):
+        return self._global.rate
+
+    def transfer(self, background=False):
+        """Register a new upload; returns its ShapedTransfer."""
+        with self._cond:
+            shaped = ShapedTransfer(self, background, self.transfer_rate)
+            self._transfers.add(shaped)
+            return shaped
+
+    def set_limits(self, global_rate=None, transfer_rate=None):
+        """Change the global and/or default per-transfer cap (bytes/s, 0 = unlimited) right away."""
+        with self._cond:
+            now = time.monotonic()
+            if global_rate is not None:
+                self._global.set_rate(global_rate, now)
+            if transfer_rate is not None:
+                self.transfer_rate = transfer_rate
+                for shaped in self._transfers:
+                    if not shaped.own_rate:
+                        shaped.bucket.set_rate(transfer_rate, now)
+            self._cond.notify_all()
+        self._changed()
+
+    def _changed(self):
+        for callback in self._listeners:
+            callback()
+
+    def limits(self):
+        with self._cond:
+            return {"global": self._global.rate, "transfer": self.transfer_rate,
+                    "active": sum(1 for t in self._transfers if not t.background),
+                    "background": sum(1 for t in self._transfers if t.background)}
+
+    def upload_rate(self):
+        """Bytes/s acquired over roughly the last RATE_WINDOW seconds."""
+        with self._cond:
+            now = time.monotonic()
+            start, sent = self._window
+            elapsed = now - start
+            rate = (self._sent - sent) / elapsed if elapsed > 0 else 0.0
+            if elapsed >= RATE_WINDOW:
+                self._window = (now, self._sent)
+            return rate
+
+    # ---- called through ShapedTransfer ----
+    def _acquire(self, shaped, nbytes):
+        with self._cond:
+            while (wait := self._take(shaped, nbytes)) > 0:
+                self._cond.wait(wait)   # set_limits() wakes us early
+
+    def _try_acquire(self, shaped, nbytes):
+        with self._cond:
+            return self._take(shaped, nbytes)
+
+    def _take(self, shaped, nbytes):
+        # caller holds _cond; returns 0 once nbytes were taken, else seconds to wait
+        now = time.monotonic()
+        if not shaped.background:
+            self._last_foreground = now
+        self._global.refill(now)
+        shaped.bucket.refill(now)
+        if shaped.background:
+            busy = self._last_foreground + BACKGROUND_IDLE - now
+            if busy > 0:
+                return busy
+        wait = max(self._global.wait_time(), shaped.bucket.wait_time())
+        if wait <= 0:
+            self._global.take(nbytes)
+            shaped.bucket.take(nbytes)
+            shaped.sent += nbytes
+            self._sent += nbytes
+            return 0
+        if not shaped.background:
+            # still wanting capacity while waiting: background stays paused
+            self._last_foreground = max(self._last_foreground, now + wait)
+        return wait
+
+    def _set_transfer_rate(self, shaped, rate):
+        with self._cond:
+            shaped.own_rate = True
+            shaped.bucket.set_rate(rate, time.monotonic())
+            self._cond.notify_all()
+        self._changed()
+
+    def _forget(self, shaped):
+        with self._cond:
+            self._transfers.discard(shaped)
+            self._cond.notify_all()
+
+
+def parse_rate(text):
+    """'0', 'off', '2.5' (MB/s), '800k', '10M', '1g' -> bytes/s."""
+    text = text.strip().lower().removesuffix("/s").removesuffix("b")
+    if text in ("off", "none", "unlimited", ""):
+        return 0
+    scale = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}.get(text[-1])
+    value = float(text[:-1] if scale else text) * (scale or 1024 ** 2)
+    if not math.isfinite(value):
+        raise ValueError("rate must be a finite number")
+    if value < 0:
+        raise ValueError("rate must not be negative")
+    return int(value)
+
+
+def format_rate(rate):
+    if not rate:
+        return "unlimited"
+    return f"{rate / 1048576:.2f} MB/s" if rate >= 1048576 else f"{rate / 1024:.0f} KB/s"
@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+
+from client.message_store import MessageStore
+
+# change notifications passed to listeners as listener(event, payload)
+MESSAGES_APPENDED = "messages_appended"  # payload: (first_index, last_index)
+LOG_APPENDED = "log_appended"            # payload: log line
+CLIENTS_RESET = "clients_reset"          # payload: full client list
+PRESENCE_CHANGED = "presence_changed"    # payload: (joined, left)
+
+
+class AppState:
+    def __init__(self):
+        self.messages = MessageStore()  # (username, message) by id; old ones paged from disk
+        self.clients = []       # active users
+        self.clients_version = None  # presence version of self.clients (None = no snapshot yet)
+        self.system_logs = deque(maxlen=100)  # last 100 system log strings
+        self.lock = threading.Lock()
+        self.username = None 
+        self.client = None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Register listener(event, payload), called after every change from the
+        thread that made it (network threads included). Listeners must not block.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, event, payload):
+        for listener in self._listeners:
+            try:
+                listener(event, payload)
+            except Exception as e:
+                print(f"[STATE] listener failed on {event}: {e}")
+
+    def add_message(self, username, message):
+        index = self.messages.append(username, message)
+        self._notify(MESSAGES_APPENDED, (index, index))
+
+    def add_system_log(self, log):
+        with self.lock:
+            self.system_logs.append(log)
+        self._notify(LOG_APPENDED, log)
+    
+    def set_client(self, client):
+        with self.lock:
+            self.client = client
+
+    def get_client(self):
+        with self.lock:
+            return self.client
+
+    def set_clients(self, client_list, version=None):
+        with self.lock:
+            self.clients = list(client_list)
+            self.clients_version = version
+        self._notify(CLIENTS_RESET, list(client_list))
+
+    def apply_presence(self, version, base, joined, left):
+        """
+        Apply a presence delta. Returns False (and changes nothing) when the delta
+        does not follow our current version, i.e. a snapshot must be requested.
+        """
+        with self.lock:
+            if self.clients_version is None or base != self.clients_version:
+                return False
+            gone = set(left)
+            self.clients = [c for c in self.clients if c not in gone]
+            for name in joined:
+                if name not in self.clients:
+                    self.clients.append(name)
+            self.clients_version = version
+        self._notify(PRESENCE_CHANGED, (list(joined), list(left)))
+        return True
+    
+    def set_username(self, username):
+        with self.lock:
+            self.username = username
+
+    def get_username(self):
+        with self.lock:
+            return self.username
+
+app_state = AppState()
@@ -0,0 +1,107 @@
+# core/profiler.py
+"""
+On-demand sampling profiler for a running server or client.
+
+A daemon thread snapshots every thread's Python stack (sys._current_frames)
+every `interval` seconds and counts identical stacks. Nothing is hooked into
+the interpreter, so the overhead is proportional to the sampling rate and
+disappears when the profiler is stopped.
+
+stop() writes the samples in the "folded stacks" format (one
+"thread;outer;...;inner count" line per stack) that flamegraph.pl and
+speedscope read, and returns a short summary of the hottest functions.
+Threads are grouped by name with the counter removed, e.g. all
+"Thread-12 (handle_client)" threads become "Thread (handle_client)".
+"""
+
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+PROFILE_INTERVAL = 0.005   # seconds between samples (200 Hz)
+_THREAD_NUMBER = re.compile(r"-\d+")
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self.samples = 0
+        self.started = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=PROFILE_INTERVAL):
+        """Start sampling; returns False if it is already running."""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._stacks = Counter()
+            self.samples = 0
+            self.started = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, interval):
+        me = threading.get_ident()
+        while not self._stop.wait(interval):
+            names = {t.ident: _THREAD_NUMBER.sub("", t.name) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self, path=None):
+        """
+        Stop sampling and write the folded stacks to path (default: a file in
+        the temp dir). Returns (path, summary) or (None, message) if not running.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return None, "profiler is not running"
+            self._stop.set()
+        thread.join()
+
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(),
+                                f"hiena-profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path, self.summary()
+
+    def summary(self, top=15):
+        """Hottest innermost frames (self time) over all sampled threads."""
+        leaves = Counter()
+        total = 0
+        for stack, count in self._stacks.items():
+            parts = stack.split(";")
+            leaf = parts[-1].rsplit(":", 1)[0] if len(parts) > 1 else parts[0]
+            leaves[(parts[0], leaf)] += count
+            total += count
+        elapsed = time.time() - self.started if self.started else 0.0
+        lines = [f"{self.samples} samples over {elapsed:.1f}s"]
+        for (thread, leaf), count in leaves.most_common(top):
+            lines.append(f"{count * 100 / max(total, 1):5.1f}%  {leaf}  [{thread}]")
+        return "\n".join(lines)
+
+
+profiler = SamplingProfiler()
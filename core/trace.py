@@ -0,0 +1,150 @@
+# core/trace.py
+"""
+Optional per-message latency tracing.
+
+A traced chat message carries data["trace"], a dict of wall-clock stamps added
+as it travels:
+
+    c_send      sender queued it (Client.send_chat)
+    s_recv      server's recv() returned the bytes holding it
+    s_enqueue   server handler starts the broadcast
+    s_send      server built the relayed frame, right before the fan-out loop
+    c_recv      receiver's listener parsed it
+    gui_render  receiver's chat view appended the row
+
+Each process records the hops it can see into per-hop histograms: the server
+s_recv -> s_enqueue -> s_send plus the per-recipient fan-out time, a receiver
+every hop of the packet. Hops between two machines (c_send -> s_recv,
+s_send -> c_recv) include their clock offset; negative samples are counted
+separately as a hint that the clocks disagree.
+"""
+
+import bisect
+import json
+import threading
+import time
+
+STAGES = ("c_send", "s_recv", "s_enqueue", "s_send", "c_recv", "gui_render")
+# bucket upper bounds in milliseconds; the last bucket is everything slower
+BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_PENDING_RENDERS = 10000
+
+
+def stamp(trace, stage):
+    """Add a stage stamp to a trace dict (no-op for untraced packets)."""
+    if isinstance(trace, dict):
+        trace[stage] = time.time()
+    return trace
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.negative = 0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        if ms < 0:
+            self.negative += 1
+            return
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "mean_ms": self.total / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p90_ms": self.percentile(90), "p99_ms": self.percentile(99),
+                "max_ms": self.max, "negative": self.negative,
+                "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["inf"], self.counts))}
+
+
+class TraceRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hops = {}              # "a->b" -> LatencyHistogram
+        self._pending_render = []    # traces waiting for the GUI to show them
+        self.expect_render = False   # set by the GUI; without one nothing waits for gui_render
+
+    def record_hop(self, name, seconds):
+        with self._lock:
+            hist = self._hops.get(name)
+            if hist is None:
+                hist = self._hops[name] = LatencyHistogram()
+            hist.record(seconds)
+
+    def record_trace(self, trace, first=None, last=None):
+        """Record consecutive hops between the stages present in trace (optionally a sub-range)."""
+        stages = STAGES[STAGES.index(first) if first else 0:STAGES.index(last) + 1 if last else None]
+        prev = None
+        for stage in stages:
+            t = trace.get(stage)
+            if not isinstance(t, (int, float)):
+                continue
+            if prev is not None:
+                self.record_hop(f"{prev[0]}->{stage}", t - prev[1])
+            prev = (stage, t)
+
+    def received(self, trace):
+        """A traced packet reached this client: record its hops and wait for the GUI if there is one."""
+        if not isinstance(trace, dict):
+            return
+        stamp(trace, "c_recv")
+        self.record_trace(trace, last="c_recv")
+        if self.expect_render:
+            with self._lock:
+                if len(self._pending_render) < MAX_PENDING_RENDERS:
+                    self._pending_render.append(trace)
+
+    def rendered(self):
+        """Called by the GUI after it appended new rows: closes the c_recv -> gui_render hop."""
+        with self._lock:
+            pending, self._pending_render = self._pending_render, []
+        now = time.time()
+        for trace in pending:
+            self.record_hop("c_recv->gui_render", now - trace["c_recv"])
+
+    def snapshot(self):
+        with self._lock:
+            return {name: hist.to_dict() for name, hist in self._hops.items()}
+
+    def reset(self):
+        with self._lock:
+            self._hops = {}
+
+    def report(self):
+        """Text table of every hop, in stage order."""
+        snap = self.snapshot()
+        if not snap:
+            return "no traced messages yet"
+        order = {s: i for i, s in enumerate(STAGES)}
+        lines = [f"{'hop':24} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>9}"]
+        for name in sorted(snap, key=lambda n: (order.get(n.split("->")[0], 99), n)):
+            h = snap[name]
+            skew = f"  ({h['negative']} negative: clock skew?)" if h["negative"] else ""
+            lines.append(f"{name:24} {h['count']:7d} {h['p50_ms']:7.2f}ms {h['p90_ms']:7.2f}ms "
+                         f"{h['p99_ms']:7.2f}ms {h['max_ms']:8.2f}ms{skew}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        return path
+
+
+tracer = TraceRecorder()
@@ -1,4 +1,6 @@
 import json
+import threading
+import time
 
 # Message structure: { "type": "<message_type>", "data": { ... } }
 # Example types used in Phase 1: "host", "join", "auth_result", "chat", "system"
@@ -13,6 +15,16 @@ def create_message(msg_type, data):
     packet = {"type": msg_type, "data": data}
     return json.dumps(packet)
 
+def create_blob_message(msg_type, data, blob_key, blob):
+    """
+    Same JSON as create_message(msg_type, {**data, blob_key: blob}) for a large
+    string that needs no escaping (e.g. base64). The blob is spliced in rather
+    than scanned by json.dumps, which is most of the cost of a file frame.
+    """
+    head = json.dumps({"type": msg_type, "data": data})
+    sep = ", " if data else ""
+    return f'{head[:-2]}{sep}"{blob_key}": "{blob}"}}}}'
+
 def parse_message(msg_str):
     """
     Parse a JSON message string received over socket.
@@ -23,3 +35,71 @@ def parse_message(msg_str):
         return json.loads(msg_str)
     except Exception:
         return {"type": "error", "data": {"message": "invalid_json"}}
+
+
+PROGRESS_MIN_INTERVAL = 0.1  # seconds between two progress reports of one transfer
+
+
+class ProgressThrottle:
+    """
+    Wrap a progress(percent) callback so it only fires when the percentage
+    changed, and at most once per min_interval (0 and 100 always get through).
+    Keeps per-chunk progress from flooding the GUI event queue.
+    """
+    def __init__(self, callback, min_interval=PROGRESS_MIN_INTERVAL):
+        self.callback = callback
+        self.min_interval = min_interval
+        self._last_pct = None
+        self._last_time = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, pct):
+        with self._lock:
+            if pct == self._last_pct:
+                return
+            now = time.monotonic()
+            if pct not in (0, 100) and now - self._last_time < self.min_interval:
+                return
+            self._last_pct = pct
+            self._last_time = now
+        self.callback(pct)
+
+
+RECV_SIZE = 256 * 1024  # bytes per socket read; file frames can be over a megabyte
+
+
+class LineBuffer:
+    """
+    Reassemble newline-delimited frames from socket reads.
+    Only newly received bytes are searched for the newline and a partial frame
+    is kept as a list of pieces, so a large frame costs O(size) instead of
+    being re-copied and re-scanned on every read. Lines are decoded whole, so
+    a UTF-8 character split across two reads survives.
+    """
+    def __init__(self):
+        self._parts = []
+
+    def feed(self, data):
+        """Add received bytes; returns the complete lines (str, without the newline)."""
+        lines = []
+        start = 0
+        while (nl := data.find(b"\n", start)) >= 0:
+            if self._parts:
+                self._parts.append(data[start:nl])
+                line = b"".join(self._parts)
+                self._parts = []
+            else:
+                line = data[start:nl]
+            lines.append(line.decode("utf-8", errors="replace"))
+            start = nl + 1
+        if start < len(data):
+            self._parts.append(data[start:])
+        return lines
+
+    def pending(self):
+        """Bytes of the incomplete frame received so far (feed() them to another buffer to continue)."""
+        return b"".join(self._parts)
+
+    def buffered(self):
+        """Size of pending() without copying it."""
+        return sum(len(p) for p in self._parts)
@@ -0,0 +1,47 @@
+# gui/bandwidth_dialog.py
+"""Upload caps of client.shaper (see client/shaping.py); changes apply to transfers already running."""
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QDialog, QFormLayout, QDoubleSpinBox, QLabel
+
+RATE_REFRESH_MS = 1000
+
+
+def _rate_box(rate):
+    box = QDoubleSpinBox()
+    box.setRange(0, 10000)
+    box.setDecimals(2)
+    box.setSingleStep(0.5)
+    box.setSuffix(" MB/s")
+    box.setSpecialValueText("Unlimited")   # shown for 0
+    box.setValue(rate / 1048576)
+    return box
+
+
+class BandwidthDialog(QDialog):
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Upload bandwidth")
+        self.shaper = client.shaper
+        limits = self.shaper.limits()
+
+        layout = QFormLayout()
+        self.global_box = _rate_box(limits["global"])
+        self.transfer_box = _rate_box(limits["transfer"])
+        self.global_box.valueChanged.connect(lambda v: self.shaper.set_limits(global_rate=int(v * 1048576)))
+        self.transfer_box.valueChanged.connect(lambda v: self.shaper.set_limits(transfer_rate=int(v * 1048576)))
+        self.status = QLabel("")
+        layout.addRow("All uploads", self.global_box)
+        layout.addRow("Each transfer", self.transfer_box)
+        layout.addRow(self.status)
+        self.setLayout(layout)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(RATE_REFRESH_MS)
+        self._refresh()
+
+    def _refresh(self):
+        limits = self.shaper.limits()
+        self.status.setText(f"{limits['active']} transfer(s), {limits['background']} in background, "
+                            f"uploading {self.shaper.upload_rate() / 1048576:.2f} MB/s")
@@ -1,141 +1,319 @@
 # gui/chat_frame.py
 from PyQt5.QtWidgets import (
-    QWidget, QLabel, QVBoxLayout, QScrollArea, QLineEdit, QPushButton,
-    QHBoxLayout, QApplication, QTextEdit, QFileDialog, QProgressBar
+    QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QApplication, QTextEdit, QFileDialog, QCheckBox,
+    QListView, QAbstractItemView, QStyledItemDelegate, QStyleOptionViewItem
 )
-from PyQt5.QtCore import Qt
-from gui.app_state import app_state
+from PyQt5.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex, QRect, QSize, QEvent
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter
+from client.state import app_state
+from client.message_store import PAGE_SIZE, MEMORY_WINDOW
 import os
-from client.file_transfer import FileSenderThread, file_receiver, DownloadThread
+from client.file_transfer import get_file_receiver
+from gui.transfers import FileSenderThread, ArchiveSenderThread, DownloadThread
 import importlib.resources as pkg_resources
 import gui.assets
 
-
-class ChatBubble(QWidget):
-    """Individual chat bubble widget with sender name, left/right alignment, and copy button."""
-    def __init__(self, text, sender_name="me", parent=None):
+# custom data roles exposed by MessageListModel
+SenderRole = Qt.UserRole + 1     # display name ("You" for own messages)
+IsMineRole = Qt.UserRole + 2     # bool
+FileRole = Qt.UserRole + 3       # {"filename", "filesize"[, "files"]} or None for chat text
+ProgressRole = Qt.UserRole + 4   # transfer/download percent for file rows, or None
+DownloadedRole = Qt.UserRole + 5 # bool, file already exported to ~/Downloads
+MessageIdRole = Qt.UserRole + 6  # stable app_state.messages id (rows shift when older pages load)
+
+MAX_VIEW_ROWS = MEMORY_WINDOW  # rows kept in the view while following new messages
+
+# colours of the former ChatBubble/FileBubble widgets (see assets/chatframe.qss)
+BUBBLE_MINE = QColor("#4ECDC4")
+BUBBLE_OTHER = QColor("#2E3A4A")
+TEXT_MINE = QColor("#FFFFFF")
+TEXT_OTHER = QColor("#E0E0E0")
+BUTTON_BG = QColor("#4ECDC4")
+BUTTON_TEXT = QColor("#1F2A38")
+BUTTON_DONE = QColor("#90EE90")
+PROGRESS_BG = QColor("#0D1318")
+PROGRESS_FG = QColor("#7CBBC2")
+
+
+class MessageListModel(QAbstractListModel):
+    """
+    List model over a window of app_state.messages ids [_base, _end).
+    New messages are appended by sync(); older ones are prepended page by page
+    by load_older() when the user scrolls up, so nothing is ever rebuilt and
+    messages spilled to disk are only read when actually shown.
+    """
+    def __init__(self, parent=None):
         super().__init__(parent)
-        self.sender_name = sender_name
-        self.text = text
-
-        layout = QVBoxLayout()
-        layout.setContentsMargins(0, 0, 0, 0)
-
-        # Sender name label
-        name_label = QLabel(sender_name if sender_name != "me" else "You")
-        name_label.setObjectName("senderName")
-        layout.addWidget(name_label, alignment=Qt.AlignLeft if sender_name != "me" else Qt.AlignRight)
-
-        # Message bubble
-        self.label = QLabel(text)
-        self.label.setWordWrap(True)
-        self.label.setTextInteractionFlags(Qt.TextSelectableByMouse)
-        layout.addWidget(self.label)
-
-        # Copy button (always visible)
-        self.copy_btn = QPushButton("📋 Copy")
-        self.copy_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #4ECDC4;
-                color: #1F2A38;
-                border-radius: 10px;
-                padding: 4px 8px;
-                font-size: 12px;
-            }
-            QPushButton:hover {
-                background-color: #FF6B6B;
-                color: white;
-            }
-        """)
-        self.copy_btn.clicked.connect(self._copy_text)
-        layout.addWidget(self.copy_btn, alignment=Qt.AlignRight if sender_name == "me" else Qt.AlignLeft)
-
-        # Set property for right/left styling via QSS
-        self.setProperty("right", "true" if sender_name == "me" else "false")
-        layout.setAlignment(Qt.AlignLeft if sender_name != "me" else Qt.AlignRight)
-        self.setLayout(layout)
-
-    def _copy_text(self):
-        QApplication.clipboard().setText(self.text)
-
-
-class FileBubble(ChatBubble):
-    """Special bubble for file messages with always visible Download button + progress bar on demand."""
-    def __init__(self, filename, filesize, sender_name="me", parent=None, client=None):
-        text = f"📄 {filename} ({filesize // 1024} KB)"
-        super().__init__(text, sender_name=sender_name, parent=parent)
-
-        self.filename = filename
-        self.filesize = filesize
-        self.client = client
-        self.download_thread = None
-
-        # Progress bar (hidden initially)
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setValue(0)
-        self.progress_bar.hide()
-        self.layout().addWidget(self.progress_bar)
-
-        # Download button (initial style)
-        self.download_btn = QPushButton("⬇ Download", self)
-        self._set_download_idle_style()
-        self.download_btn.clicked.connect(self._on_download_clicked)
-        self.layout().addWidget(self.download_btn, alignment=Qt.AlignRight if sender_name == "me" else Qt.AlignLeft)
-
-    def _set_download_idle_style(self):
-        self.download_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #4ECDC4;
-                color: #1F2A38;
-                border-radius: 10px;
-                padding: 4px 8px;
-                font-size: 12px;
-            }
-            QPushButton:hover {
-                background-color: #FF6B6B;
-                color: white;     
-            }
-        """)
-
-    def _set_download_complete_style(self):
-        self.download_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #90EE90;  /* Light green */
-                color: black;
-                border-radius: 10px;
-                padding: 4px 8px;
-                font-size: 12px;
-            }
-        """)
-
-    def _on_download_clicked(self):
-        """Download file via QThread and show progress bar."""
-        src = file_receiver.find_saved_path(self.filename)
-        if not src:
-            print(f"[DOWNLOAD ERROR] file not found: {self.filename}")
-            return
-
-        dst_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-        self.progress_bar.show()
-        self.download_btn.setEnabled(False)  # disable during download
-
-        self.download_thread = DownloadThread(src, dst_dir=dst_dir)
-        self.download_thread.progress.connect(lambda pct: self.update_progress(pct))
-        self.download_thread.finished.connect(self._on_download_finished)
-        self.download_thread.error.connect(lambda e: print(f"[DOWNLOAD ERROR] {e}"))
-        self.download_thread.start()
+        self._base = None        # message id of row 0 (set on first sync)
+        self._end = 0            # one past the newest id shown
+        self._file_ids = {}      # filename -> [message id, ...] (progress is keyed by filename)
+        self._progress = {}      # filename -> percent
+        self._downloaded = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self._base is None:
+            return 0
+        return self._end - self._base
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.rowCount():
+            return None
+        msg_id = self._base + index.row()
+        if role == MessageIdRole:
+            return msg_id
+        username, message = app_state.messages[msg_id]
+        is_file = isinstance(message, dict) and message.get("type") == "file"
+
+        if role == Qt.DisplayRole:
+            if is_file and "files" in message:
+                return f"📁 {message['filename']} ({message['files']} files, {message['filesize'] // 1024} KB)"
+            if is_file:
+                return f"📄 {message['filename']} ({message['filesize'] // 1024} KB)"
+            return message
+        if role == SenderRole:
+            return "You" if username == app_state.get_username() else username
+        if role == IsMineRole:
+            return username == app_state.get_username()
+        if role == FileRole:
+            return message if is_file else None
+        if role == ProgressRole:
+            return self._progress.get(message["filename"]) if is_file else None
+        if role == DownloadedRole:
+            return is_file and message["filename"] in self._downloaded
+        return None
+
+    def sync(self):
+        """Append rows for messages added to app_state since the last sync. Returns True if any."""
+        total = len(app_state.messages)
+        if self._base is None:
+            # start with what is still in memory; older pages load on scroll-up
+            self._base = self._end = app_state.messages.first_in_memory
+        if total <= self._end:
+            return False
+        rows = self.rowCount()
+        self.beginInsertRows(QModelIndex(), rows, rows + total - self._end - 1)
+        self._index_files(self._end, total)
+        self._end = total
+        self.endInsertRows()
+        return True
+
+    def can_load_older(self):
+        return bool(self._base)
+
+    def load_older(self, count=PAGE_SIZE):
+        """Prepend up to count older messages (paged in from disk). Returns how many."""
+        count = min(count, self._base or 0)
+        if count <= 0:
+            return 0
+        self.beginInsertRows(QModelIndex(), 0, count - 1)
+        self._base -= count
+        self._index_files(self._base, self._base + count)
+        self.endInsertRows()
+        return count
+
+    def trim_front(self, keep):
+        """Drop the oldest rows so at most keep remain (they can be paged back in)."""
+        excess = self.rowCount() - keep
+        if excess <= 0:
+            return 0
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        self._base += excess
+        for ids in self._file_ids.values():
+            ids[:] = [i for i in ids if i >= self._base]
+        self.endRemoveRows()
+        return excess
+
+    @property
+    def first_id(self):
+        return self._base or 0
+
+    def _index_files(self, first, end):
+        for msg_id in range(first, end):
+            message = app_state.messages[msg_id][1]
+            if isinstance(message, dict) and message.get("type") == "file":
+                self._file_ids.setdefault(message["filename"], []).append(msg_id)
 
-    def _on_download_finished(self, dst):
-        print(f"[DOWNLOADED] {dst}")
-        self._set_download_complete_style()
-        self.download_btn.setText("✅ Downloaded")
+    def set_progress(self, filename, pct):
+        if self._progress.get(filename) == pct:
+            return
+        self._progress[filename] = pct
+        self._file_changed(filename)
+
+    def set_downloaded(self, filename):
+        self._downloaded.add(filename)
+        self._progress.pop(filename, None)
+        self._file_changed(filename)
+
+    def _file_changed(self, filename):
+        for msg_id in self._file_ids.get(filename, ()):
+            idx = self.index(msg_id - self._base)
+            self.dataChanged.emit(idx, idx, [ProgressRole, DownloadedRole])
+
+
+class BubbleDelegate(QStyledItemDelegate):
+    """Paints one message row as a bubble with its Copy (and Download) button."""
+    copy_clicked = pyqtSignal(str)       # message text
+    download_clicked = pyqtSignal(str)   # filename
+
+    MARGIN = 6
+    PAD_X = 14
+    PAD_Y = 10
+    BUTTON_H = 24
+    BUTTON_GAP = 6
+    PROGRESS_H = 8
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.text_font = QFont()
+        self.text_font.setPixelSize(14)
+        self.name_font = QFont()
+        self.name_font.setPixelSize(10)
+        self.name_font.setBold(True)
+        self.button_font = QFont()
+        self.button_font.setPixelSize(12)
+        self._text_fm = QFontMetrics(self.text_font)
+        self._name_fm = QFontMetrics(self.name_font)
+        self._button_fm = QFontMetrics(self.button_font)
+        self._text_cache = {}     # message id -> (height, width) of the wrapped text at _cache_width
+        self._height_cache = {}   # message id -> full row height at _cache_width
+        self._cache_width = None
+
+    def _check_width(self, width):
+        if self._cache_width != width:
+            self._text_cache.clear()
+            self._height_cache.clear()
+            self._cache_width = width
+
+    def _text_size(self, index, text_width):
+        key = index.data(MessageIdRole)
+        size = self._text_cache.get(key)
+        if size is None:
+            rect = self._text_fm.boundingRect(QRect(0, 0, text_width, 1 << 20), Qt.TextWordWrap, index.data() or "")
+            size = self._text_cache[key] = (rect.height(), rect.width())
+        return size
+
+    def forget_before(self, msg_id):
+        """Drop cached sizes of rows the model no longer shows."""
+        for cache in (self._text_cache, self._height_cache):
+            for key in [k for k in cache if k < msg_id]:
+                del cache[key]
+
+    def _button_width(self, label):
+        return self._button_fm.horizontalAdvance(label) + 16
+
+    def _layout(self, option, index):
+        """Geometry shared by paint(), sizeHint() and editorEvent()."""
+        row = option.rect
+        self._check_width(row.width())
+        mine = index.data(IsMineRole)
+        is_file = index.data(FileRole) is not None
+        max_bubble = max(int(row.width() * 0.7), 80)
+        text_h, text_w = self._text_size(index, max_bubble - 2 * self.PAD_X)
+
+        y = row.top() + self.MARGIN
+        name_h = self._name_fm.height()
+        bubble_w = text_w + 2 * self.PAD_X
+        bubble_h = text_h + 2 * self.PAD_Y
+        left = row.right() - self.MARGIN - bubble_w if mine else row.left() + self.MARGIN
+
+        geo = {"mine": mine, "is_file": is_file}
+        geo["name"] = QRect(row.left() + self.MARGIN, y, row.width() - 2 * self.MARGIN, name_h)
+        y += name_h + 2
+        geo["bubble"] = QRect(left, y, bubble_w, bubble_h)
+        y += bubble_h + self.BUTTON_GAP
+
+        buttons = [("copy", "📋 Copy")]
+        if is_file:
+            buttons.append(("download", "✅ Downloaded" if index.data(DownloadedRole) else "⬇ Download"))
+        x = row.right() - self.MARGIN if mine else row.left() + self.MARGIN
+        for name, label in buttons:
+            w = self._button_width(label)
+            if mine:
+                x -= w
+                geo[name] = (QRect(x, y, w, self.BUTTON_H), label)
+                x -= self.BUTTON_GAP
+            else:
+                geo[name] = (QRect(x, y, w, self.BUTTON_H), label)
+                x += w + self.BUTTON_GAP
+        y += self.BUTTON_H
+        if is_file:
+            y += self.BUTTON_GAP
+            geo["progress"] = QRect(left, y, bubble_w, self.PROGRESS_H)
+            y += self.PROGRESS_H
+        geo["height"] = y + self.MARGIN - row.top()
+        return geo
+
+    def sizeHint(self, option, index):
+        # the view asks with an empty rect; rows always span the viewport
+        width = self.view.viewport().width()
+        self._check_width(width)
+        key = index.data(MessageIdRole)
+        height = self._height_cache.get(key)
+        if height is None:
+            option = QStyleOptionViewItem(option)
+            option.rect = QRect(0, 0, width, 0)
+            height = self._height_cache[key] = self._layout(option, index)["height"]
+        return QSize(width, height)
+
+    def paint(self, painter, option, index):
+        geo = self._layout(option, index)
+        mine = geo["mine"]
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        painter.setFont(self.name_font)
+        painter.setPen(TEXT_MINE)
+        painter.drawText(geo["name"], (Qt.AlignRight if mine else Qt.AlignLeft) | Qt.AlignVCenter, index.data(SenderRole))
+
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(BUBBLE_MINE if mine else BUBBLE_OTHER)
+        painter.drawRoundedRect(geo["bubble"], 14, 14)
+        painter.setFont(self.text_font)
+        painter.setPen(TEXT_MINE if mine else TEXT_OTHER)
+        painter.drawText(geo["bubble"].adjusted(self.PAD_X, self.PAD_Y, -self.PAD_X, -self.PAD_Y),
+                         Qt.TextWordWrap, index.data() or "")
+
+        painter.setFont(self.button_font)
+        for name in ("copy", "download"):
+            if name not in geo:
+                continue
+            rect, label = geo[name]
+            done = name == "download" and index.data(DownloadedRole)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(BUTTON_DONE if done else BUTTON_BG)
+            painter.drawRoundedRect(rect, 10, 10)
+            painter.setPen(QColor("black") if done else BUTTON_TEXT)
+            painter.drawText(rect, Qt.AlignCenter, label)
+
+        pct = index.data(ProgressRole)
+        if "progress" in geo and pct is not None and 0 <= pct < 100:
+            bar = geo["progress"]
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(PROGRESS_BG)
+            painter.drawRoundedRect(bar, 4, 4)
+            painter.setBrush(PROGRESS_FG)
+            painter.drawRoundedRect(QRect(bar.left(), bar.top(), int(bar.width() * pct / 100), bar.height()), 4, 4)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            geo = self._layout(option, index)
+            if geo["copy"][0].contains(event.pos()):
+                self.copy_clicked.emit(index.data() if not geo["is_file"] else index.data(FileRole)["filename"])
+                return True
+            if "download" in geo and geo["download"][0].contains(event.pos()) and not index.data(DownloadedRole):
+                self.download_clicked.emit(index.data(FileRole)["filename"])
+                return True
+        return super().editorEvent(event, model, option, index)
 
-    def update_progress(self, pct):
-        self.progress_bar.setValue(pct)
 
 class ChatFrame(QWidget):
-    """Main chat frame with scrollable bubbles and input field."""
-    def __init__(self, send_callback, client=None):
+    """Main chat frame with a virtualized message list and input field."""
+    direct_progress = pyqtSignal(str, int)  # filename, percent (from p2p/multicast sender threads)
+    receive_progress = pyqtSignal(str, int)  # saved_basename, percent (from the network thread)
+
+    def __init__(self, send_callback, client=None, recipients=None):
         super().__init__()
         main_layout = QVBoxLayout()
         with pkg_resources.open_text("gui.assets", "chatframe.qss") as f:
@@ -143,18 +321,34 @@ class ChatFrame(QWidget):
 
         # Use the shared receiver instance
         self.client = app_state.get_client()
-        self.file_receiver = file_receiver
-        self.file_receiver.progress.connect(self._on_receive_progress)
-
-        # Scroll area
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_content = QWidget()
-        self.scroll_layout = QVBoxLayout()
-        self.scroll_layout.setAlignment(Qt.AlignTop)
-        self.scroll_content.setLayout(self.scroll_layout)
-        self.scroll_area.setWidget(self.scroll_content)
-        main_layout.addWidget(self.scroll_area)
+        self.file_receiver = get_file_receiver()
+        self.receive_progress.connect(self._on_receive_progress)
+        self.file_receiver.add_progress_listener(self.receive_progress.emit)
+
+        # Message list: only visible rows are painted, new rows are appended
+        self.model = MessageListModel(self)
+        self.view = QListView()
+        self.delegate = BubbleDelegate(self.view)
+        self.delegate.copy_clicked.connect(lambda text: QApplication.clipboard().setText(text))
+        self.delegate.download_clicked.connect(self._on_download_clicked)
+        self.view.setModel(self.model)
+        self.view.setItemDelegate(self.delegate)
+        self.view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setLayoutMode(QListView.Batched)
+        self.view.setBatchSize(200)
+        self.view.setFocusPolicy(Qt.NoFocus)
+        main_layout.addWidget(self.view)
+
+        # follow new messages while the user is at the bottom; batched layout grows the
+        # scroll range over several event-loop passes, so re-pin on every range change
+        self._stick_to_bottom = True
+        self._anchor_from_bottom = None  # keeps the viewport still while older rows are prepended
+        self._restoring_scroll = False
+        scrollbar = self.view.verticalScrollBar()
+        scrollbar.valueChanged.connect(self._on_scrolled)
+        scrollbar.rangeChanged.connect(self._on_scroll_range_changed)
 
         # Input layout
         input_layout = QHBoxLayout()
@@ -172,45 +366,56 @@ class ChatFrame(QWidget):
         file_button = QPushButton("Send File")
         file_button.clicked.connect(self._on_send_file)
 
+        folder_button = QPushButton("Send Folder")
+        folder_button.clicked.connect(self._on_send_folder)
+
         input_layout.addWidget(self.entry)
         input_layout.addWidget(send_button)
         input_layout.addWidget(file_button)
+        input_layout.addWidget(folder_button)
+
+        # background sends only use upload bandwidth the other transfers leave idle
+        self.background_box = QCheckBox("Background")
+        self.background_box.setToolTip("Send files using only idle upload bandwidth")
+        input_layout.addWidget(self.background_box)
         main_layout.addLayout(input_layout)
 
         self.setLayout(main_layout)
         self.send_callback = send_callback
+        self.recipients = recipients or (lambda: [])  # usernames for private sends; empty = whole room
 
-        self._file_bubbles = {}
+        self._download_threads = {}  # filename -> DownloadThread
+        self._archive_threads = []   # running ArchiveSenderThreads (kept alive until done)
+        self.direct_progress.connect(self._on_direct_progress)
 
     def refresh_messages(self):
-        """Refresh chat bubbles from app_state messages."""
-        for i in reversed(range(self.scroll_layout.count())):
-            widget = self.scroll_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
-
-        self._file_bubbles.clear()
-
-        for username, message in app_state.messages:
-            sender_type = "me" if username == app_state.get_username() else username
-
-            if isinstance(message, dict) and message.get("type") == "file":
-                filename = message["filename"]
-                filesize = message["filesize"]
-                bubble = FileBubble(filename, filesize, sender_name=sender_type, client=self.client)
-                self._file_bubbles[filename] = bubble
-            else:
-                bubble = ChatBubble(message, sender_name=sender_type)
-
-            self.scroll_layout.addWidget(bubble)
-
-        self._maybe_autoscroll()
+        """Append rows for new app_state messages (existing rows are left untouched)."""
+        if self.model.sync() and self._stick_to_bottom and self.model.trim_front(MAX_VIEW_ROWS):
+            # following the live end: keep the view (and its caches) bounded too
+            self.delegate.forget_before(self.model.first_id)
 
-    def _maybe_autoscroll(self):
-        """Auto-scroll only if near bottom (<60 px)."""
-        scrollbar = self.scroll_area.verticalScrollBar()
-        if scrollbar.maximum() - scrollbar.value() <= 60:
-            scrollbar.setValue(scrollbar.maximum())
+    def _on_scrolled(self, value):
+        if self._restoring_scroll:
+            return
+        # auto-scroll only if near bottom (<60 px)
+        scrollbar = self.view.verticalScrollBar()
+        self._stick_to_bottom = scrollbar.maximum() - value <= 60
+        self._anchor_from_bottom = None
+        if value == scrollbar.minimum() and self.model.can_load_older():
+            # lazy-load the previous page (from the on-disk spill) at the top
+            self._anchor_from_bottom = scrollbar.maximum() - value
+            self.model.load_older()
+
+    def _on_scroll_range_changed(self, _minimum, maximum):
+        scrollbar = self.view.verticalScrollBar()
+        self._restoring_scroll = True
+        try:
+            if self._stick_to_bottom:
+                scrollbar.setValue(maximum)
+            elif self._anchor_from_bottom is not None:
+                scrollbar.setValue(maximum - self._anchor_from_bottom)
+        finally:
+            self._restoring_scroll = False
 
     def _on_send(self):
         text = self.entry.toPlainText().strip()
@@ -220,31 +425,99 @@ class ChatFrame(QWidget):
             self.refresh_messages()
 
     def _on_send_file(self):
-        filepath, _ = QFileDialog.getOpenFileName(self, "Select File to Send")
-        if not filepath:
+        filepaths, _ = QFileDialog.getOpenFileNames(self, "Select Files to Send")
+        if len(filepaths) > 1:
+            self._send_archive(filepaths)
+            return
+        if not filepaths:
             return
+        filepath = filepaths[0]
 
         sender = app_state.get_username() or "me"
         filesize = os.path.getsize(filepath)
         filename = os.path.basename(filepath)
 
-        app_state.messages.append((sender, {"type": "file", "filename": filename, "filesize": filesize}))
+        app_state.add_message(sender, {"type": "file", "filename": filename, "filesize": filesize})
         self.refresh_messages()
 
         client = self.client
+        target = self.recipients() or "all"
+        progress = lambda pct, f=filename: self.direct_progress.emit(f, pct)
+        background = self.background_box.isChecked()
+        if client and client.offer_multicast(filepath, progress=progress, target=target, background=background):
+            # sent once to the LAN group; the server only brokers and relays repairs
+            return
+        if client and client.offer_delta(filepath, progress=progress, target=target, background=background):
+            # receivers holding a prior version get only the changes, the others the whole file
+            return
+        if client and client.offer_direct(filepath, progress=progress, target=target, background=background):
+            # receivers pull directly from us; the server only brokers the endpoint
+            return
         if client:
-            self.file_thread = FileSenderThread(client, filepath)
-            if filename in self._file_bubbles:
-                fn = filename
-                self.file_thread.progress.connect(lambda pct, f=fn: self._file_bubbles[f].update_progress(pct))
+            self.file_thread = FileSenderThread(client, filepath, target, background=background)
+            self.file_thread.progress.connect(lambda pct, f=filename: self.model.set_progress(f, pct))
             self.file_thread.finished.connect(lambda f: print(f"[FILE SENT] {f}"))
             self.file_thread.error.connect(lambda e: print(f"[FILE SEND ERROR] {e}"))
             self.file_thread.start()
 
+    def _on_send_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Send")
+        if folder:
+            self._send_archive([folder])
+
+    def _send_archive(self, paths):
+        """Several files or a folder go out as one streamed archive with a single bubble."""
+        client = self.client
+        if not client:
+            return
+        from client.archive import collect_entries
+        collected = collect_entries(paths)
+        name, entries = collected
+        files = [size for _path, _arcname, size in entries if size is not None]
+        sender = app_state.get_username() or "me"
+        app_state.add_message(sender, {"type": "file", "filename": name, "filesize": sum(files), "files": len(files)})
+        self.refresh_messages()
+
+        thread = ArchiveSenderThread(client, paths, self.recipients() or "all", collected=collected,
+                                     background=self.background_box.isChecked())
+        thread.progress.connect(lambda pct, f=name: self.model.set_progress(f, pct))
+        thread.finished.connect(lambda f: print(f"[FILES SENT] {f}"))
+        thread.error.connect(lambda e: print(f"[FILE SEND ERROR] {e}"))
+        self._archive_threads = [t for t in self._archive_threads if t.isRunning()] + [thread]
+        thread.start()
+
+    def _on_download_clicked(self, filename):
+        """Export a received file into ~/Downloads via QThread; progress shows in the row."""
+        if filename in self._download_threads:
+            return  # already downloading
+        src = self.file_receiver.find_saved_path(filename)
+        if not src:
+            print(f"[DOWNLOAD ERROR] file not found: {filename}")
+            return
+
+        dst_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+        thread = DownloadThread(src, dst_dir=dst_dir)
+        thread.progress.connect(lambda pct, f=filename: self.model.set_progress(f, pct))
+        thread.finished.connect(lambda dst, f=filename: self._on_download_finished(f, dst))
+        thread.error.connect(lambda e, f=filename: self._on_download_error(f, e))
+        self._download_threads[filename] = thread
+        self.model.set_progress(filename, 0)
+        thread.start()
+
+    def _on_download_finished(self, filename, dst):
+        print(f"[DOWNLOADED] {dst}")
+        self._download_threads.pop(filename, None)
+        self.model.set_downloaded(filename)
+
+    def _on_download_error(self, filename, err):
+        print(f"[DOWNLOAD ERROR] {err}")
+        self._download_threads.pop(filename, None)
+
+    def _on_direct_progress(self, filename, pct):
+        self.model.set_progress(filename, pct)
+
     def _on_receive_progress(self, saved_basename, pct):
-        bubble = self._file_bubbles.get(saved_basename)
-        if bubble:
-            bubble.update_progress(pct)
+        self.model.set_progress(saved_basename, pct)
 
     def _adjust_textedit_height(self):
         doc_height = self.entry.document().size().height()
@@ -1,24 +1,95 @@
 # gui/main.py
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout
+import threading
+import time
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QShortcut
 from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+from PyQt5.QtGui import QKeySequence
 from gui.topbar import TopBar
 from gui.sidebar import Sidebar
 from gui.chat_frame import ChatFrame
-from gui.app_state import app_state
-from core.utils import create_message
+from core.trace import tracer
+from client.state import (
+    app_state, MESSAGES_APPENDED, LOG_APPENDED, CLIENTS_RESET, PRESENCE_CHANGED
+)
 import os
 
 
+GUI_FRAME_INTERVAL_MS = 33  # deliver state changes to widgets at most ~30 times per second
+
+
 # 🔗 Thread-safe bridge between Client threads and GUI
 class GuiBridge(QObject):
-    message_received = pyqtSignal(str, str)   # sender, message
-    system_message = pyqtSignal(str)
-    client_list_updated = pyqtSignal(list)
-    messages_updated = pyqtSignal()           # new message list (useful after file_complete)
+    """
+    Collects app_state change notifications from any thread into a buffer and
+    delivers them to the widgets in frame-rate-limited batches, so a burst of
+    traffic costs one cross-thread wake-up and one widget update per frame
+    instead of one per packet.
+    """
+    messages_appended = pyqtSignal(int, int)  # first, last index of new app_state.messages
+    logs_appended = pyqtSignal(list)          # new system log lines
+    clients_reset = pyqtSignal(list)          # rebuild the user list from app_state
+    presence_changed = pyqtSignal(list, list) # joined, left (already applied to app_state)
+    _wake = pyqtSignal()                      # network thread -> GUI thread, once per batch
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = []          # (event, payload) in arrival order
+        self._wake_sent = False
+        self._last_flush = 0.0
+        self._wake.connect(self._on_wake)
+
+    def on_state_event(self, event, payload):
+        """app_state listener; may run on any thread."""
+        with self._lock:
+            self._pending.append((event, payload))
+            if self._wake_sent:
+                return
+            self._wake_sent = True
+        self._wake.emit()
+
+    def _on_wake(self):
+        wait_ms = GUI_FRAME_INTERVAL_MS - int((time.monotonic() - self._last_flush) * 1000)
+        if wait_ms > 0:
+            QTimer.singleShot(wait_ms, self._flush)
+        else:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._wake_sent = False
+        self._last_flush = time.monotonic()
+
+        first = last = None
+        logs = []
+        presence = []
+        reset = None
+        for event, payload in batch:
+            if event == MESSAGES_APPENDED:
+                first = payload[0] if first is None else min(first, payload[0])
+                last = payload[1] if last is None else max(last, payload[1])
+            elif event == LOG_APPENDED:
+                logs.append(payload)
+            elif event == CLIENTS_RESET:
+                reset, presence = payload, []   # a snapshot supersedes earlier deltas
+            elif event == PRESENCE_CHANGED:
+                presence.append(payload)
+
+        if first is not None:
+            self.messages_appended.emit(first, last)
+        if logs:
+            self.logs_appended.emit(logs)
+        if reset is not None or len(presence) > 1:
+            # app_state already holds the result of every change in the batch
+            self.clients_reset.emit(list(app_state.clients))
+        elif presence:
+            self.presence_changed.emit(*presence[0])
 
 
 gui_bridge = GuiBridge()
+app_state.add_listener(gui_bridge.on_state_event)
 
 import importlib.resources as pkg_resources
 import gui.assets
@@ -34,6 +105,8 @@ class MainWindow(QWidget):
 
         main_layout = QVBoxLayout()
         topbar = TopBar()
+        topbar.search_requested.connect(self.open_search)
+        topbar.bandwidth_requested.connect(self.open_bandwidth)
         main_layout.addWidget(topbar)
 
         content_layout = QHBoxLayout()
@@ -42,45 +115,58 @@ class MainWindow(QWidget):
         self.sidebar.setFixedWidth(250)
         content_layout.addWidget(self.sidebar)
 
-        self.chat_frame = ChatFrame(self.send_message_to_server)
+        self.chat_frame = ChatFrame(self.send_message_to_server, recipients=self.sidebar.selected_users)
         content_layout.addWidget(self.chat_frame)
 
         main_layout.addLayout(content_layout)
         self.setLayout(main_layout)
 
-        # Connect signals
-        gui_bridge.message_received.connect(self.on_message_received)
-        gui_bridge.system_message.connect(self.on_system_message)
-        gui_bridge.client_list_updated.connect(self.on_client_list_updated)
-        gui_bridge.messages_updated.connect(self.chat_frame.refresh_messages)
-
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.refresh_ui)
-        self.timer.start(1000)
-
-    def send_message_to_server(self, msg):
-        if self.client:
-            payload = {"message": msg}
-            self.client.send(create_message("chat", payload))
-            app_state.add_message(self.client.username, msg)
-            self.chat_frame.refresh_messages()
-
-    def on_message_received(self, sender, msg):
-        app_state.add_message(sender, msg)
-        self.chat_frame.refresh_messages()
+        # Widgets update only from change notifications; nothing polls.
+        gui_bridge.messages_appended.connect(self.on_messages_appended)
+        gui_bridge.logs_appended.connect(self.sidebar.append_logs)
+        gui_bridge.clients_reset.connect(lambda _clients: self.sidebar.refresh_clients())
+        gui_bridge.presence_changed.connect(self.sidebar.apply_presence)
 
-    def on_system_message(self, msg):
-        # app_state.add_system_log(msg)
-        self.sidebar.refresh()
-        self.sidebar.logs_view.verticalScrollBar().setValue(self.sidebar.logs_view.verticalScrollBar().maximum())
+        # diagnostics: Ctrl+Shift+L logs the latency histograms, Ctrl+Shift+P starts/stops the profiler
+        tracer.expect_render = True
+        QShortcut(QKeySequence("Ctrl+Shift+L"), self, activated=self.log_trace_report)
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, activated=self.toggle_profiler)
 
-    def on_client_list_updated(self, clients):
-        app_state.set_clients(clients)
+        # state gathered before the window existed (e.g. during auth)
         self.sidebar.refresh()
+        self.chat_frame.refresh_messages()
 
-    def refresh_ui(self):
-        self.sidebar.refresh()
+    def send_message_to_server(self, msg):
+        if self.client:
+            # users selected in the sidebar get it as a direct message
+            self.client.send_chat(msg, to=self.sidebar.selected_users())
+
+    def open_search(self, query):
+        from gui.search_dialog import SearchDialog
+        dialog = SearchDialog(self.client, query, parent=self)
+        dialog.show()
+
+    def open_bandwidth(self):
+        if not self.client:
+            return
+        from gui.bandwidth_dialog import BandwidthDialog
+        dialog = BandwidthDialog(self.client, parent=self)
+        dialog.show()
+
+    def on_messages_appended(self, first, last):
         self.chat_frame.refresh_messages()
+        tracer.rendered()
+
+    def log_trace_report(self):
+        for line in tracer.report().splitlines():
+            app_state.add_system_log(line)
+
+    def toggle_profiler(self):
+        from core.profiler import profiler
+        from client.main import run_profile_command
+        result = run_profile_command(["stop" if profiler.running else "start"])
+        for line in result.splitlines():
+            app_state.add_system_log(line)
 
 def run_gui(client):
     app = QApplication(sys.argv)
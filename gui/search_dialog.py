@@ -0,0 +1,86 @@
+# gui/search_dialog.py
+"""Room history search: results come from the server's index one page at a time."""
+
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QListWidget, QPushButton, QLabel
+
+
+class SearchThread(QThread):
+    """Run one blocking Client.search() call off the GUI thread."""
+    finished = pyqtSignal(object)   # search_result data, or None on timeout
+
+    def __init__(self, client, query, before=None):
+        super().__init__()
+        self.client = client
+        self.query = query
+        self.before = before
+
+    def run(self):
+        self.finished.emit(self.client.search(self.query, before=self.before))
+
+
+class SearchDialog(QDialog):
+    def __init__(self, client, query="", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Search room history")
+        self.resize(560, 420)
+        self.client = client
+        self._next = None
+        self._thread = None
+
+        layout = QVBoxLayout()
+        top = QHBoxLayout()
+        self.query_edit = QLineEdit(query)
+        self.query_edit.setPlaceholderText("Words to find (all must match)")
+        self.query_edit.returnPressed.connect(self._new_search)
+        search_button = QPushButton("Search")
+        search_button.clicked.connect(self._new_search)
+        top.addWidget(self.query_edit)
+        top.addWidget(search_button)
+        layout.addLayout(top)
+
+        self.results = QListWidget()
+        self.results.setWordWrap(True)
+        layout.addWidget(self.results)
+
+        bottom = QHBoxLayout()
+        self.status = QLabel("")
+        self.more_button = QPushButton("Older results")
+        self.more_button.setEnabled(False)
+        self.more_button.clicked.connect(lambda: self._run(self._next))
+        bottom.addWidget(self.status)
+        bottom.addWidget(self.more_button)
+        layout.addLayout(bottom)
+        self.setLayout(layout)
+
+        if query:
+            self._new_search()
+
+    def _new_search(self):
+        self.results.clear()
+        self._run(None)
+
+    def _run(self, before):
+        query = self.query_edit.text().strip()
+        if not query or not self.client or (self._thread and self._thread.isRunning()):
+            return
+        self.more_button.setEnabled(False)
+        self.status.setText("Searching...")
+        self._thread = SearchThread(self.client, query, before)
+        self._thread.finished.connect(self._on_results)
+        self._thread.start()
+
+    def _on_results(self, reply):
+        if reply is None:
+            self.status.setText("No answer from the server.")
+            return
+        for r in reply["results"]:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["time"]))
+            what = f"📎 {r['text']}" if r["kind"] == "file" else r["text"]
+            private = " 🔒" if r["private"] else ""
+            self.results.addItem(f"{when}  {r['from']}{private}: {what}")
+        self._next = reply["next"]
+        self.more_button.setEnabled(self._next is not None)
+        self.status.setText(f"{self.results.count()} result(s), last page in {reply['took_ms']} ms")
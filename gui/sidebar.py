@@ -1,6 +1,6 @@
-from PyQt5.QtWidgets import QWidget, QListWidget, QVBoxLayout, QLabel, QTextEdit
+from PyQt5.QtWidgets import QWidget, QListWidget, QVBoxLayout, QLabel, QTextEdit, QAbstractItemView
 from PyQt5.QtCore import Qt
-from gui.app_state import app_state
+from client.state import app_state
 import os
 
 import importlib.resources as pkg_resources
@@ -21,8 +21,15 @@ class Sidebar(QWidget):
 
         self.clients_list = QListWidget()
         self.clients_list.setFixedHeight(250)  # about 60% of sidebar space
+        # selected users become the recipients of messages and files (none = whole room)
+        self.clients_list.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.clients_list.itemSelectionChanged.connect(self._update_recipients_hint)
         layout.addWidget(self.clients_list)
 
+        self.recipients_hint = QLabel("Sending to: everyone")
+        self.recipients_hint.setWordWrap(True)
+        layout.addWidget(self.recipients_hint)
+
         # --- System Logs Section ---
         logs_label = QLabel("System Logs")
         # logs_label.setStyleSheet("font-weight: bold; font-size: 14px; color: white; margin-top: 10px;")
@@ -30,18 +37,54 @@ class Sidebar(QWidget):
 
         self.logs_view = QTextEdit()
         self.logs_view.setReadOnly(True)
+        self.logs_view.document().setMaximumBlockCount(100)  # same cap as app_state.system_logs
         # self.logs_view.setStyleSheet("background-color: #232428; color: #B0B3B8; font-size: 12px;")
         layout.addWidget(self.logs_view)
 
         self.setLayout(layout)
 
     def refresh(self):
-        # Refresh clients
+        self.refresh_clients()
+        self.refresh_logs()
+
+    def selected_users(self):
+        """Usernames picked as private recipients; empty means the whole room."""
+        me = app_state.get_username()
+        return sorted(item.text() for item in self.clients_list.selectedItems() if item.text() != me)
+
+    def _update_recipients_hint(self):
+        users = self.selected_users()
+        self.recipients_hint.setText(f"Sending to: {', '.join(users)} (private)" if users else "Sending to: everyone")
+
+    def refresh_clients(self):
+        selected = set(self.selected_users())
+        self.clients_list.blockSignals(True)
         self.clients_list.clear()
         for client in sorted(set(app_state.clients)):
             self.clients_list.addItem(client)
+            if client in selected:
+                self.clients_list.item(self.clients_list.count() - 1).setSelected(True)
+        self.clients_list.blockSignals(False)
+        self._update_recipients_hint()
+
+    def apply_presence(self, joined, left):
+        """Add/remove only the users named in a presence delta."""
+        for name in left:
+            for item in self.clients_list.findItems(name, Qt.MatchExactly):
+                self.clients_list.takeItem(self.clients_list.row(item))
+        for name in joined:
+            if not self.clients_list.findItems(name, Qt.MatchExactly):
+                self.clients_list.addItem(name)
+        self.clients_list.sortItems()
+        self._update_recipients_hint()  # a selected user who left is no longer a recipient
+
+    def append_logs(self, logs):
+        for log in logs:
+            self.logs_view.append(f"• {log}")
+        scrollbar = self.logs_view.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
 
-        # Refresh logs
+    def refresh_logs(self):
         self.logs_view.clear()
         for log in app_state.system_logs:
             self.logs_view.append(f"• {log}")
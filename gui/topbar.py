@@ -1,11 +1,14 @@
-from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout, QLineEdit, QPushButton
+from PyQt5.QtCore import Qt, pyqtSignal
 import os
 
 import importlib.resources as pkg_resources
 import gui.assets 
 
 class TopBar(QWidget):
+    search_requested = pyqtSignal(str)  # query typed into the search box
+    bandwidth_requested = pyqtSignal()  # open the upload caps dialog
+
     def __init__(self):
         super().__init__()
         layout = QHBoxLayout()
@@ -14,4 +17,19 @@ class TopBar(QWidget):
         self.label = QLabel("HI-ENA Connect")
         self.label.setStyleSheet("color: white; font-weight: bold; font-size: 16px;")
         layout.addWidget(self.label, alignment=Qt.AlignLeft)
+
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search messages and files")
+        self.search_box.setFixedWidth(260)
+        self.search_box.returnPressed.connect(self._on_search)
+        layout.addWidget(self.search_box, alignment=Qt.AlignRight)
+
+        bandwidth_button = QPushButton("Bandwidth")
+        bandwidth_button.clicked.connect(self.bandwidth_requested.emit)
+        layout.addWidget(bandwidth_button, alignment=Qt.AlignRight)
         self.setLayout(layout)
+
+    def _on_search(self):
+        query = self.search_box.text().strip()
+        if query:
+            self.search_requested.emit(query)
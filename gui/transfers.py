@@ -0,0 +1,72 @@
+# gui/transfers.py
+"""Qt thread wrappers around the headless transfer functions in client.file_transfer."""
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from client.file_transfer import send_file_chunks, send_archive_chunks, export_file
+
+
+class FileSenderThread(QThread):
+    """Send a file in chunks via a connected client."""
+    progress = pyqtSignal(int)      # emits percentage
+    finished = pyqtSignal(str)      # emits filename when done
+    error = pyqtSignal(str)         # emits error string
+
+    def __init__(self, client, filepath, target="all", background=False):
+        super().__init__()
+        self.client = client
+        self.filepath = filepath
+        self.target = target
+        self.background = background    # only use upload bandwidth other transfers leave idle
+
+    def run(self):
+        try:
+            filename = send_file_chunks(self.client, self.filepath, self.target, progress=self.progress.emit,
+                                        background=self.background)
+            self.finished.emit(filename)
+
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class ArchiveSenderThread(QThread):
+    """Send several files and/or a folder as one streamed archive."""
+    progress = pyqtSignal(int)      # emits percentage
+    finished = pyqtSignal(str)      # emits the archive's display name when done
+    error = pyqtSignal(str)         # emits error string
+
+    def __init__(self, client, paths, target="all", collected=None, background=False):
+        super().__init__()
+        self.client = client
+        self.paths = paths
+        self.target = target
+        self.collected = collected
+        self.background = background
+
+    def run(self):
+        try:
+            name = send_archive_chunks(self.client, self.paths, self.target, progress=self.progress.emit,
+                                       collected=self.collected, background=self.background)
+            self.finished.emit(name)
+
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class DownloadThread(QThread):
+    """Export a saved file from the hidden folder into ~/Downloads (see export_file)."""
+    progress = pyqtSignal(int)    # percent
+    finished = pyqtSignal(str)    # destination path
+    error = pyqtSignal(str)
+
+    def __init__(self, src_path, dst_dir=None):
+        super().__init__()
+        self.src_path = src_path
+        self.dst_dir = dst_dir
+
+    def run(self):
+        try:
+            dst = export_file(self.src_path, self.dst_dir, progress=self.progress.emit)
+            self.finished.emit(dst)
+        except Exception as e:
+            self.error.emit(str(e))
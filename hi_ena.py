@@ -1,8 +1,7 @@
 import argparse
+import os
 import sys
 
-from server.main import start_server
-from client.main import main as client_main
 
 def main():
     parser = argparse.ArgumentParser(prog="Hi-ena", description="LAN Chat + File Sharing")
@@ -12,6 +11,29 @@ def main():
     serverp = sub.add_parser("server", help="Start a server")
     serverp.add_argument("--host", default="0.0.0.0")
     serverp.add_argument("--port", type=int, default=5555)
+    serverp.add_argument("--takeover", action="store_true",
+                         help="take over the sockets and rooms of the server running on this port (restart without dropping clients)")
+    serverp.add_argument("--handoff-socket", default=None, help="Unix socket used for --takeover (default: per port, in the temp dir)")
+    serverp.add_argument("--capture", default=None, metavar="PATH",
+                         help="record all inbound client traffic to PATH for tools/replay.py")
+    serverp.add_argument("--relay-budget", type=float, default=None, metavar="MB",
+                         help="memory for queued file relays over all receivers before spilling to disk (default 256)")
+    serverp.add_argument("--relay-conn-budget", type=float, default=None, metavar="MB",
+                         help="the same per receiver (default 16)")
+    serverp.add_argument("--spill-dir", default=None,
+                         help="where relay spill segments go (default: the temp dir; on a tmpfs spills take RAM)")
+    serverp.add_argument("--spill-budget", type=float, default=None, metavar="MB",
+                         help="disk for spilled relays over all receivers; a receiver needing more is disconnected (default 8192)")
+
+    # Admin commands for a running server (over its handoff socket)
+    adminp = sub.add_parser("admin", help="Profile a running server, show its latency traces, memory use or capture its traffic")
+    adminp.add_argument("action", choices=["profile-start", "profile-stop", "trace", "trace-reset",
+                                           "capture-start", "capture-stop", "memory"])
+    adminp.add_argument("--port", type=int, default=5555)
+    adminp.add_argument("--handoff-socket", default=None)
+    adminp.add_argument("--out", default=None, help="profile-stop: where to write the folded stacks; capture-start: the capture file")
+    adminp.add_argument("--interval", type=float, default=None, help="profile-start: seconds between samples")
+    adminp.add_argument("--top", type=int, default=None, help="memory: how many connections and rooms to list")
 
     # Client (reuse your client.main logic)
     clientp = sub.add_parser("client", help="Run client commands (host-server/join-server)")
@@ -20,9 +42,28 @@ def main():
     args = parser.parse_args()
 
     if args.command == "server":
-        start_server(host=args.host, port=args.port)
+        # imported per command so the server never loads the client (or Qt) and vice versa
+        from server.main import start_server
+        mb = lambda v: None if v is None else int(v * 1024 * 1024)
+        start_server(host=args.host, port=args.port, takeover=args.takeover, handoff_socket=args.handoff_socket,
+                     capture_path=args.capture, relay_conn_budget=mb(args.relay_conn_budget),
+                     relay_total_budget=mb(args.relay_budget), spill_dir=args.spill_dir,
+                     spill_budget=mb(args.spill_budget))
+
+    elif args.command == "admin":
+        from server import handoff
+        path = args.handoff_socket or handoff.handoff_path(args.port)
+        # the server resolves paths against its own working directory
+        out = os.path.abspath(args.out) if args.out else None
+        result = handoff.admin_request(path, args.action.replace("-", "_"), path=out, interval=args.interval,
+                                       top=args.top)
+        print(result.get("message", ""))
+        if result.get("path") and args.action == "profile-stop":
+            print(f"folded stacks: {result['path']}")
+        sys.exit(0 if result.get("ok") else 1)
 
     elif args.command == "client":
+        from client.main import main as client_main
         sys.argv = ["client.main"] + args.args
         client_main()
 
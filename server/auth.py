@@ -11,14 +11,21 @@ import threading
 
 _lock = threading.Lock()
 
+
+class Room:
+    """A hosted room: credentials, creator connection, usernames that joined and the host."""
+    __slots__ = ("password_hash", "owner_conn", "clients", "host")
+
+    def __init__(self, password_hash, owner_conn=None, clients=(), host=None):
+        self.password_hash = password_hash
+        self.owner_conn = owner_conn
+        self.clients = set(clients)
+        self.host = host   # filled in after auth
+
+
 class AuthManager:
     def __init__(self):
-        # servers: server_name -> {
-        #   "password_hash": str,
-        #   "owner_conn": conn,
-        #   "clients": set(usernames),
-        #   "host": str
-        # }
+        # servers: server_name -> Room
         self.servers = {}
 
     def create_server(self, server_name: str, password_hash: str, owner_conn):
@@ -26,12 +33,7 @@ class AuthManager:
         with _lock:
             if server_name in self.servers:
                 return False, "server_exists"
-            self.servers[server_name] = {
-                "password_hash": password_hash,
-                "owner_conn": owner_conn,
-                "clients": set(),
-                "host": None,   # ✅ will be filled in after auth
-            }
+            self.servers[server_name] = Room(password_hash, owner_conn)
             return True, "created"
 
     def verify_join(self, server_name: str, password_hash: str, username: str):
@@ -39,10 +41,10 @@ class AuthManager:
         with _lock:
             if server_name not in self.servers:
                 return False, "server_not_found"
-            if self.servers[server_name]["password_hash"] != password_hash:
+            if self.servers[server_name].password_hash != password_hash:
                 return False, "wrong_password"
             # allow join
-            self.servers[server_name]["clients"].add(username)
+            self.servers[server_name].clients.add(username)
             return True, "joined"
 
     def remove_connection(self, server_name: str, username: str = None):
@@ -51,18 +53,36 @@ class AuthManager:
             if server_name not in self.servers:
                 return
             if username:
-                self.servers[server_name]["clients"].discard(username)
+                self.servers[server_name].clients.discard(username)
             # cleanup logic can be expanded later
 
+    def snapshot(self):
+        """Rooms as plain data for a restart handoff (owner_conn is not carried over)."""
+        with _lock:
+            return {
+                name: {"password_hash": s.password_hash, "clients": sorted(s.clients), "host": s.host}
+                for name, s in self.servers.items()
+            }
+
+    def restore(self, snapshot):
+        with _lock:
+            for name, s in snapshot.items():
+                self.servers[name] = Room(s["password_hash"], clients=s["clients"], host=s["host"])
+
+    def set_host(self, server_name, username):
+        with _lock:
+            room = self.servers.get(server_name)
+            if room is not None:
+                room.host = username
+
     def get_server_list(self):
         with _lock:
             return list(self.servers.keys())
         
     def is_host(self, server_name, username):
         """Return True if the given username is the host of the server."""
-        if server_name not in self.servers:
-            return False
-        return self.servers[server_name].get("host") == username
+        room = self.servers.get(server_name)
+        return room is not None and room.host == username
 
     @staticmethod
     def hash_password_raw(password: str) -> str:
@@ -0,0 +1,65 @@
+# server/brokering.py
+"""
+Offer/answer routing shared by the p2p, multicast and delta brokers.
+
+Each of those protocols has the same shape on the server: the sender's offer
+goes to every receiver in the room or the users named in "target", the sender
+learns who was asked (before any receiver can answer), and each receiver's
+answer is routed back to the offer's owner. Only the packet types and the
+protocol-specific fields differ, so the brokers build those and leave the
+routing to this module.
+
+The audience is resolved under clients_lock; the packets are sent after it is
+released so one slow socket does not stall the rest of the server.
+"""
+
+from core.utils import create_message
+
+
+def send_packet(conn, ptype, data):
+    conn.sendall((create_message(ptype, data) + "\n").encode("utf-8"))
+
+
+def resolve_audience(client_entry, rooms, clients_lock, target):
+    """Receivers of an offer (the sender excluded) and the named users not online."""
+    with clients_lock:
+        return rooms.audience(client_entry.server_name, target, exclude=client_entry)
+
+
+def deliver(receivers, ptype, tag):
+    """Send (ClientSession, data) pairs, logging per-receiver failures."""
+    for c, data in receivers:
+        try:
+            send_packet(c.conn, ptype, data)
+        except Exception as e:
+            print(f"[SERVER {tag} ERROR] {e}")
+
+
+def forward_offer(client_entry, ack_type, ack, missing, offer_type, offers, tag):
+    """
+    Tell the sender who was asked (ack_type/ack, plus who was not online),
+    then hand each receiver its offer. Returns False if the sender is gone.
+    """
+    try:
+        send_packet(client_entry.conn, ack_type, ack)
+        if missing:
+            send_packet(client_entry.conn, "system", {
+                "message": f"Not online, file not sent to: {', '.join(missing)}"})
+    except Exception as e:
+        print(f"[SERVER {tag} ERROR] {e}")
+        return False
+    deliver(offers, offer_type, tag)
+    return True
+
+
+def route_to_owner(client_entry, rooms, clients_lock, owner, ptype, reply, tag):
+    """Send a receiver's answer to the owner of the offer, if still connected."""
+    with clients_lock:
+        owners, _missing = rooms.lookup(client_entry.server_name, {owner} if isinstance(owner, str) else set())
+        conn = next((c.conn for c in owners if c.conn is not None), None)
+    if conn is None:
+        return
+    try:
+        send_packet(conn, ptype, reply)
+    except Exception as e:
+        print(f"[SERVER {tag} ERROR] {e}")
@@ -0,0 +1,128 @@
+# server/capture.py
+"""
+Traffic capture for replaying a real room's load against another server build.
+
+While a capture runs, every byte the server reads from a client is appended to
+a gzip file together with the connection it came from and when it arrived:
+
+    header  b"HICAP1\\n"
+    record  kind (B) | connection id (I) | seconds since capture start (d) | length (I) | payload
+            kind 0 = connection opened (payload: JSON {"addr": [ip, port]})
+            kind 1 = bytes received    (payload: exactly what recv() returned)
+            kind 2 = connection closed (no payload)
+
+Whole recv() reads are stored rather than parsed frames, so the replay sends
+the same bytes in the same pieces, partial frames and file chunks included.
+Connections already open when a capture starts get their "opened" record on
+their first read (their first frame may then be incomplete).
+
+Captures contain everything clients sent, password hashes and messages
+included, so the file is created readable by our own user only.
+tools/replay.py plays a capture against a server.
+"""
+
+import gzip
+import json
+import os
+import struct
+import threading
+import time
+
+CAPTURE_MAGIC = b"HICAP1\n"
+CAPTURE_MAX_BYTES = 1 << 30   # stop capturing after this much client data (uncompressed)
+OPENED, DATA, CLOSED = 0, 1, 2
+_RECORD = struct.Struct("!BIdI")
+
+
+class Capture:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._ids = {}       # id(conn) -> connection id in the capture
+        self._next_id = 1
+        self._start = 0.0
+        self.path = None
+        self.bytes = 0
+        self.max_bytes = CAPTURE_MAX_BYTES
+
+    @property
+    def active(self):
+        return self._file is not None
+
+    def start(self, path, max_bytes=CAPTURE_MAX_BYTES):
+        """Start writing a capture to path; returns False if one is already running."""
+        with self._lock:
+            if self._file is not None:
+                return False
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            self._file = gzip.GzipFile(fileobj=os.fdopen(fd, "wb"), mode="wb", compresslevel=1)
+            self._file.write(CAPTURE_MAGIC)
+            self._ids = {}
+            self._next_id = 1
+            self._start = time.time()
+            self.path = path
+            self.bytes = 0
+            self.max_bytes = max_bytes
+            return True
+
+    def stop(self):
+        """Finish the file; returns (path, bytes captured) or (None, 0) if not running."""
+        with self._lock:
+            return self._close()
+
+    def _close(self):
+        f, self._file = self._file, None
+        if f is None:
+            return None, 0
+        raw = f.fileobj
+        f.close()
+        raw.close()
+        return self.path, self.bytes
+
+    def _write(self, kind, conn_id, when, payload=b""):
+        self._file.write(_RECORD.pack(kind, conn_id, when - self._start, len(payload)))
+        if payload:
+            self._file.write(payload)
+
+    def _conn_id(self, conn, addr, when):
+        cid = self._ids.get(id(conn))
+        if cid is None:
+            cid = self._ids[id(conn)] = self._next_id
+            self._next_id += 1
+            self._write(OPENED, cid, when, json.dumps({"addr": list(addr or ())}).encode("utf-8"))
+        return cid
+
+    def received(self, conn, addr, data, when):
+        """Record one recv() result of a client connection."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(DATA, self._conn_id(conn, addr, when), when, data)
+            self.bytes += len(data)
+            if self.bytes >= self.max_bytes:
+                path, size = self._close()
+                print(f"[CAPTURE] stopped at the {size} byte limit, written to {path}")
+
+    def closed(self, conn):
+        with self._lock:
+            if self._file is None:
+                return
+            cid = self._ids.pop(id(conn), None)
+            if cid is not None:
+                self._write(CLOSED, cid, time.time())
+
+
+def read_capture(path):
+    """Yield (kind, connection id, offset seconds, payload) records of a capture file."""
+    with gzip.open(path, "rb") as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a Hi-ena capture")
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return  # end of file (or a capture cut short by a crash)
+            kind, cid, offset, length = _RECORD.unpack(header)
+            payload = f.read(length) if length else b""
+            if len(payload) < length:
+                return
+            yield kind, cid, offset, payload
@@ -0,0 +1,53 @@
+# server/delta.py
+"""
+Broker for delta transfers of re-shared files (see client/delta.py for the
+full flow).
+
+The server hands the offer to every receiver in the room or the users named
+in "target", tells the sender who was asked ("delta_receivers") and routes
+each receiver's answer back to the sender: its block signatures, or
+"delta_fallback" when it has no prior version. The delta itself is an
+ordinary file_offer/chunk/complete relay.
+"""
+
+from server import brokering
+
+VALID_DELTA_TYPES = {"delta_offer", "delta_signatures", "delta_fallback"}
+_SIGNATURE_FIELDS = ("block", "size", "weak", "strong")
+
+
+def handle_delta_message(packet, client_entry, rooms, clients_lock):
+    try:
+        ptype = packet.get("type")
+        pdata = packet.get("data", {}) or {}
+
+        if ptype not in VALID_DELTA_TYPES:
+            print(f"[SERVER] Ignored unknown delta packet type: {ptype}")
+            return
+
+        sender = client_entry.username
+        if not client_entry.server_name:
+            return
+
+        if ptype == "delta_offer":
+            receivers, missing = brokering.resolve_audience(client_entry, rooms, clients_lock,
+                                                            pdata.get("target", "all"))
+            offer = dict(pdata, **{"from": sender})
+            offer.pop("target", None)
+            # the sender learns who to wait for before any receiver can answer
+            if not brokering.forward_offer(
+                    client_entry, "delta_receivers",
+                    {"transfer_id": pdata.get("transfer_id"), "receivers": [c.username for c in receivers]},
+                    missing, "delta_offer", [(c, offer) for c in receivers], "DELTA"):
+                return
+
+            print(f"[SERVER] {sender} offers '{pdata.get('filename')}' as a delta to {len(receivers)} receiver(s)")
+
+        else:
+            reply = {"transfer_id": pdata.get("transfer_id"), "username": sender}
+            if ptype == "delta_signatures":
+                reply.update((k, pdata.get(k)) for k in _SIGNATURE_FIELDS)
+            brokering.route_to_owner(client_entry, rooms, clients_lock, pdata.get("from"), ptype, reply, "DELTA")
+
+    except Exception as e:
+        print(f"[SERVER ERROR] handle_delta_message exception: {e}")
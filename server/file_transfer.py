@@ -1,11 +1,11 @@
-import json
-from core.utils import create_message
+from core.utils import create_message, create_blob_message
 
 VALID_FILE_TYPES = {"file_offer", "file_chunk", "file_complete"}
 
-def handle_file_message(packet, client_entry, connected_clients, clients_lock):
+def handle_file_message(packet, client_entry, rooms, clients_lock):
     """
-    Relay file messages (offer/chunk/complete) to other clients in the same server.
+    Relay file messages (offer/chunk/complete) to other clients in the same server,
+    or only to the users named in "target" (a username or a list of them).
     """
     try:
         ptype = packet.get("type")
@@ -15,25 +15,50 @@ def handle_file_message(packet, client_entry, connected_clients, clients_lock):
             print(f"[SERVER] Ignored unknown file packet type: {ptype}")
             return
 
-        server_name = client_entry.get("server_name")
-        sender = client_entry.get("username")
+        server_name = client_entry.server_name
+        sender = client_entry.username
+        # "all" fans out to the room; a username (p2p relay fallback) or a list picks receivers
+        target = pdata.get("target", "all") if isinstance(pdata, dict) else "all"
 
+        # encoded once for every receiver; the base64 chunk is spliced in, not re-escaped
+        relay_dict = {"from": sender}
+        if isinstance(pdata, dict):
+            relay_dict.update(pdata)
+        chunk = relay_dict.pop("chunk", None) if ptype == "file_chunk" else None
+        # only splice what cannot break out of the JSON string or the frame (base64 never does)
+        if isinstance(chunk, str) and chunk.isascii() and not ('"' in chunk or "\\" in chunk or "\n" in chunk):
+            relay_json = create_blob_message(ptype, relay_dict, "chunk", chunk)
+        else:
+            if chunk is not None:
+                relay_dict["chunk"] = chunk
+            relay_json = create_message(ptype, relay_dict)
+        payload = (relay_json + "\n").encode("utf-8")
+
+        # in-flight relays show up in the server's memory report until file_complete
+        filename = pdata.get("filename") if isinstance(pdata, dict) else None
+        if ptype == "file_offer":
+            client_entry.relay_started(filename, pdata.get("filesize", 0))
+        elif ptype == "file_chunk":
+            client_entry.relayed(filename, len(chunk) * 3 // 4 if isinstance(chunk, str) else 0)
+        else:
+            client_entry.relay_finished(filename)
+
+        # queued per receiver (see server/relay.py): a slow receiver never holds up the sender or the room;
+        # relay() may write to a spill segment, so it runs outside clients_lock
         with clients_lock:
-            for c in connected_clients:
-                if c.get("server_name") == server_name and c.get("conn") != client_entry.get("conn"):
-                    try:
-                        relay_dict = {"from": sender}
-                        if isinstance(pdata, dict):
-                            relay_dict.update(pdata)
-                        relay_json = create_message(ptype, relay_dict)
-                        if not isinstance(relay_json, str):
-                            relay_json = json.dumps(relay_json)
-                        c["conn"].sendall((relay_json + "\n").encode("utf-8"))
-                    except Exception as e:
-                        print(f"[SERVER FILE RELAY ERROR] {e}")
+            receivers, missing = rooms.audience(server_name, target, exclude=client_entry)
+        for c in receivers:
+            try:
+                c.conn.relay(payload, bulk=ptype == "file_chunk")
+            except Exception as e:
+                print(f"[SERVER FILE RELAY ERROR] {e}")
 
         if ptype == "file_offer":
-            print(f"[SERVER] {sender} is sending file '{pdata.get('filename')}' ({pdata.get('filesize',0)//1024} KB)")
+            if missing:
+                client_entry.conn.sendall((create_message("system", {
+                    "message": f"Not online, file not sent to: {', '.join(missing)}"}) + "\n").encode("utf-8"))
+            print(f"[SERVER] {sender} is sending file '{pdata.get('filename')}' ({pdata.get('filesize',0)//1024} KB) "
+                  f"to {len(receivers)} receiver(s)")
         elif ptype == "file_complete":
             print(f"[SERVER] File transfer completed: {pdata.get('filename')} from {sender}")
 
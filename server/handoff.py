@@ -0,0 +1,198 @@
+# server/handoff.py
+"""
+Zero-downtime restart: hand the listening socket, the live client sockets and
+a snapshot of rooms/sessions/history to a new server process.
+
+The running server listens on a Unix socket (handoff_path). A new process
+started with --takeover connects and asks for a handoff; the old one then
+
+  1. requests a drain: the accept loop and every client handler stop at a
+     frame boundary (between two recv() calls) and park their state, i.e.
+     the connection and the bytes of a frame received only in part;
+  2. sends a JSON snapshot plus the socket fds (SCM_RIGHTS) to the new process;
+  3. on the new process' ack closes its copies and exits, or, if anything
+     failed, releases the drain and carries on as if nothing happened.
+     Before exiting it sends the search index documents, which the new
+     process indexes on a background thread while it already serves.
+
+Bytes clients send meanwhile simply wait in the kernel socket buffers, and
+connection attempts wait in the listen backlog, so clients see a pause but no
+disconnect. Needs AF_UNIX fd passing (socket.send_fds, Python 3.9+ on Unix).
+
+The same socket takes "admin" requests (profiler, trace histograms); see
+admin_request() and `hi_ena.py admin`.
+"""
+
+import json
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+
+from core.utils import create_message, parse_message, LineBuffer
+
+HANDOFF_VERSION = 2
+PARK_TIMEOUT = 5.0        # seconds to wait for handlers to reach a frame boundary
+ACK_TIMEOUT = 30.0        # seconds the new process gets to adopt everything
+MAX_FDS_PER_MSG = 200     # SCM_RIGHTS carries at most 253 fds per message on Linux
+_HEADER = struct.Struct("!IQ")  # fd count, snapshot length
+_READY = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP if hasattr(select, "poll") else 0
+
+
+def supported():
+    return hasattr(socket, "send_fds") and hasattr(select, "poll")
+
+
+def handoff_path(port):
+    return os.path.join(tempfile.gettempdir(), f"hi-ena-{port}.sock")
+
+
+class Drain:
+    """
+    Lets a handoff stop every accept/handler loop at a frame boundary.
+    Loops poll their socket together with a wakeup pipe and are counted while
+    they run (enter/leave), so the handoff knows when everyone has parked.
+    """
+
+    def __init__(self):
+        self._r, self._w = os.pipe()
+        self._cond = threading.Condition()
+        self.requested = False
+        self.handed_over = False
+        self._active = 0
+        self.parked = []
+
+    def poller(self, sock):
+        p = select.poll()
+        p.register(sock, _READY)
+        p.register(self._r, select.POLLIN)
+        return p
+
+    def readable(self, poller):
+        """Block until the socket has data (True) or a drain was requested (False)."""
+        while True:
+            events = poller.poll()
+            if any(fd == self._r for fd, _ev in events):
+                return False
+            if events:
+                return True
+
+    def enter(self):
+        with self._cond:
+            self._active += 1
+
+    def leave(self, parked=None):
+        with self._cond:
+            self._active -= 1
+            if parked is not None:
+                self.parked.append(parked)
+            self._cond.notify_all()
+
+    def request(self):
+        with self._cond:
+            self.requested = True
+        os.write(self._w, b"x")  # never read until release(): wakes every poller, now and later
+
+    def wait_idle(self, timeout=PARK_TIMEOUT):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._active == 0, timeout)
+
+    def release(self, handed_over):
+        """End a drain. Returns the parked state so the caller can resume it (if not handed over)."""
+        with self._cond:
+            os.read(self._r, 1)
+            self.requested = False
+            self.handed_over = handed_over
+            parked, self.parked = self.parked, []
+            self._cond.notify_all()
+        return parked
+
+    def wait_released(self):
+        """For the accept loop: block while a drain is in progress; False once handed over."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self.requested)
+            return not self.handed_over
+
+
+# ---------- transport (Unix socket) ----------
+def send_state(sock, state, fds):
+    body = json.dumps(state).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(fds), len(body)))
+    for i in range(0, len(fds), MAX_FDS_PER_MSG):
+        socket.send_fds(sock, [b"F"], fds[i:i + MAX_FDS_PER_MSG])
+    sock.sendall(body)
+
+
+def recv_state(sock):
+    """Returns (state, fds); the fds are new descriptors owned by the caller."""
+    count, length = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    fds = []
+    try:
+        while len(fds) < count:
+            _msg, got, flags, _addr = socket.recv_fds(sock, 1, MAX_FDS_PER_MSG)
+            fds.extend(got)
+            if not got or flags & getattr(socket, "MSG_CTRUNC", 0):
+                raise ConnectionError("handoff: descriptors were truncated (fd limit?)")
+        return json.loads(_recv_exact(sock, length)), fds
+    except Exception:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        data = sock.recv(min(n - len(buf), 1024 * 1024))
+        if not data:
+            raise ConnectionError("handoff: peer closed the connection")
+        buf += data
+    return bytes(buf)
+
+
+def send_packet(sock, ptype, data):
+    sock.sendall((create_message(ptype, data) + "\n").encode("utf-8"))
+
+
+def recv_packet(sock):
+    """
+    One control line. Read a byte at a time: the state and its descriptors may
+    follow right behind it, and an over-read would drop the SCM_RIGHTS data.
+    """
+    buffer = LineBuffer()
+    while True:
+        data = sock.recv(1)
+        if not data:
+            raise ConnectionError("handoff: peer closed the connection")
+        lines = buffer.feed(data)
+        if lines:
+            return parse_message(lines[0])
+
+
+def admin_request(sock_path, command, timeout=ACK_TIMEOUT, **args):
+    """Run an admin command on the server listening on sock_path; returns its result dict."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(sock_path)
+        send_packet(sock, "admin", dict(args, command=command))
+        return recv_packet(sock).get("data", {})
+
+
+def listen(path):
+    """Bind the handoff socket, readable by our own user only."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        # nobody can connect before listen(), so tightening the mode afterwards leaves no window
+        os.chmod(path, 0o600)
+        sock.listen(1)
+    except OSError:
+        sock.close()
+        raise
+    return sock
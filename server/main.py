@@ -1,20 +1,45 @@
 # server/main.py
+import base64
+import os
 import socket
+import tempfile
 import threading
+import time
 import traceback
 
-from core.utils import create_message, parse_message
+from core.utils import create_message, parse_message, LineBuffer, RECV_SIZE
+from core.trace import tracer, stamp
+from core.profiler import profiler
 from server.auth import AuthManager
 from server import file_transfer
+from server import p2p
+from server import multicast
+from server import delta
+from server import handoff
+from server.presence import PresenceTracker
+from server.session import ClientSession, RoomHistory, SessionRegistry
+from server.routing import RoomIndex, parse_targets
+from server.search import SearchIndex, SEARCH_PAGE
+from server.capture import Capture
+from server import memory
+from server.relay import ClientSocket, RelayBudget
 
 HOST = "0.0.0.0"
 PORT = 5555
 
 # global structures
 clients_lock = threading.Lock()
-connected_clients = []  # {"conn": socket, "addr": (ip,port), "username": str, "server_name": str}
+connected_clients = []  # ClientSession per connection
+rooms = RoomIndex()     # the same entries by room and username (members only), also under clients_lock
 
 auth_mgr = AuthManager()
+presence = PresenceTracker(rooms, clients_lock)
+history = RoomHistory()
+sessions = SessionRegistry()
+search_index = SearchIndex()
+drain = handoff.Drain()  # stops the accept/handler loops at a frame boundary for a restart handoff
+capture = Capture()      # records inbound traffic for tools/replay.py while active
+relay_budget = RelayBudget()  # memory for queued file relays; the rest spills to disk
 
 def send_json(conn, obj_str):
     try:
@@ -23,84 +48,219 @@ def send_json(conn, obj_str):
         raise
 
 
-def broadcast_to_server(server_name, sender_username, text, sender_conn=None):
+def _chat_frame(data, trace):
+    # the trace rides along to receivers but is not kept for replay
+    if trace is None:
+        return create_message("chat", data)
+    return create_message("chat", dict(data, trace=stamp(trace, "s_send")))
+
+
+def _traced_send(conn, msg, trace):
+    send_json(conn, msg)
+    if trace is not None:
+        tracer.record_hop("s_send->sent", time.time() - trace["s_send"])
+
+
+def broadcast_to_server(server_name, sender_username, text, sender_conn=None, trace=None):
     """Broadcast a 'chat' message to all clients in server_name except sender."""
+    # mark host if sender is host of this server
+    display_name = sender_username
+    if auth_mgr.is_host(server_name, sender_username):
+        display_name = f"{sender_username} (HOST)"
+
     with clients_lock:
+        # seq is assigned under clients_lock so every member sees the same order
+        data = history.record(server_name, sender_username, "chat", {"from": display_name, "message": text})
+        msg = _chat_frame(data, trace)
         to_remove = []
-        for c in connected_clients:
-            if c["server_name"] == server_name and c["conn"] is not None:
-                if c["conn"] == sender_conn:
+        for c in rooms.members(server_name):
+            if c.conn is not None:
+                if c.conn == sender_conn:
                     continue  # skip sender
 
-                # mark host if sender is host of this server
-                display_name = sender_username
-                if auth_mgr.is_host(server_name, sender_username):
-                    display_name = f"{sender_username} (HOST)"
-
                 try:
-                    msg = create_message("chat", {"from": display_name, "message": text})
-                    send_json(c["conn"], msg)
+                    _traced_send(c.conn, msg, trace)
                 except Exception:
                     to_remove.append(c)
-        for r in to_remove:
-            try:
-                connected_clients.remove(r)
-            except ValueError:
-                pass
-
+        _drop_dead(to_remove)
+    if trace is not None:
+        tracer.record_trace(trace, first="s_recv", last="s_send")
+    search_index.add(server_name, sender_username, text, seq=data["seq"])
+
+
+def send_direct_message(server_name, sender_username, text, recipients, sender_conn=None, trace=None):
+    """
+    Deliver a 'chat' message only to the named users of server_name (a DM).
+    It still gets a room seq, but only its recipients are sent it again on resume.
+    Returns the recipients that are not online.
+    """
+    display_name = sender_username
+    if auth_mgr.is_host(server_name, sender_username):
+        display_name = f"{sender_username} (HOST)"
 
-def broadcast_system_message(server_name, text):
-    """Broadcast a system message to all clients in server_name."""
     with clients_lock:
+        targets, missing = rooms.lookup(server_name, recipients)
+        audience = sorted(recipients.difference(missing))
+        if not audience:
+            return missing
+        data = history.record(server_name, sender_username, "chat",
+                              {"from": display_name, "message": text, "to": audience}, audience=set(audience))
+        msg = _chat_frame(data, trace)
         to_remove = []
-        for c in connected_clients:
-            if c["server_name"] == server_name and c["conn"] is not None:
+        for c in targets:
+            if c.conn is not None and c.conn != sender_conn:
                 try:
-                    msg = create_message("system", {"message": text})
-                    send_json(c["conn"], msg)
+                    _traced_send(c.conn, msg, trace)
                 except Exception:
                     to_remove.append(c)
-        for r in to_remove:
-            try:
-                connected_clients.remove(r)
-            except ValueError:
-                pass
+        _drop_dead(to_remove)
+    if trace is not None:
+        tracer.record_trace(trace, first="s_recv", last="s_send")
+    search_index.add(server_name, sender_username, text, seq=data["seq"], audience=audience)
+    return missing
+
 
+def _drop_dead(entries):
+    # caller holds clients_lock; handle_client's finally does the rest of the cleanup
+    for r in entries:
+        rooms.remove(r)
+        try:
+            connected_clients.remove(r)
+        except ValueError:
+            pass
 
-def broadcast_client_list(server_name):
-    """Send updated client list to all clients in the server."""
+
+def broadcast_system_message(server_name, text):
+    """Broadcast a system message to all clients in server_name."""
     with clients_lock:
-        clients = [c["username"] for c in connected_clients if c["server_name"] == server_name]
-        print(f"[DEBUG] broadcast_client_list -> connected_clients = {clients}")
-        for c in connected_clients:
-            if c["server_name"] == server_name:
+        data = history.record(server_name, None, "system", {"message": text})
+        msg = create_message("system", data)
+        to_remove = []
+        for c in rooms.members(server_name):
+            if c.conn is not None:
                 try:
-                    msg = create_message("clients", {"list": clients})
-                    send_json(c["conn"], msg)
+                    send_json(c.conn, msg)
                 except Exception:
-                    pass
+                    to_remove.append(c)
+        _drop_dead(to_remove)
 
 
-def handle_client(conn, addr):
-    client_entry = {"conn": conn, "addr": addr, "username": None, "server_name": None}
+def admit_to_room(conn, client_entry, server_name, username, message, token=None):
+    """
+    Make an authenticated connection a member of server_name.
+    The presence snapshot goes out before membership (see PresenceTracker); the
+    auth_result carries the resume token and the room's current seq.
+    """
+    presence.send_snapshot(conn, server_name)
     with clients_lock:
-        connected_clients.append(client_entry)
-
-    print(f"[NEW CONNECTION] {addr}")
+        if client_entry.server_name:
+            rooms.remove(client_entry)  # authenticating again on the same connection
+        client_entry.username = username
+        client_entry.server_name = server_name
+        rooms.add(client_entry)
+    client_entry.resume_token = token or sessions.issue(server_name, username)
+    resp = create_message("auth_result", {
+        "ok": True,
+        "message": message,
+        "resume_token": client_entry.resume_token,
+        "seq": history.last_seq(server_name),
+    })
+    send_json(conn, resp)
+    presence.mark_changed(server_name)
+
+
+def index_file_offer(client_entry, pdata):
+    """Make an offered file findable by name (by its recipients only, if targeted)."""
+    server_name = client_entry.server_name
+    if server_name:
+        audience = parse_targets(pdata.get("target", "all"))
+        search_index.add(server_name, client_entry.username, pdata.get("filename"), kind="file",
+                         audience=sorted(audience) if audience is not None else None)
+
+
+def search_room(conn, client_entry, pdata):
+    server_name = client_entry.server_name
+    if not server_name:
+        send_json(conn, create_message("system", {"message": "not_in_server"}))
+        return
+    before, limit = pdata.get("before"), pdata.get("limit", SEARCH_PAGE)
+    start = time.perf_counter()
+    results, next_before = search_index.search(
+        server_name, client_entry.username, str(pdata.get("query", "")),
+        before=before if isinstance(before, int) else None,
+        limit=limit if isinstance(limit, int) else SEARCH_PAGE,
+        sender=pdata.get("from") if isinstance(pdata.get("from"), str) else None,
+        kind=pdata.get("kind"),
+    )
+    send_json(conn, create_message("search_result", {
+        "request_id": pdata.get("request_id"),
+        "query": pdata.get("query", ""),
+        "results": results,
+        "next": next_before,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2),
+    }))
+
+
+def replay_missed(conn, server_name, username, last_seq):
+    """Resend the room broadcasts a resuming client missed (except its own)."""
+    entries, complete = history.since(server_name, last_seq)
+    if not complete:
+        send_json(conn, create_message("system", {"message": "Some older messages were missed while reconnecting."}))
+    replayed = 0
+    for seq, origin, ptype, data, audience in entries:
+        if origin == username or (audience is not None and username not in audience):
+            continue
+        send_json(conn, create_message(ptype, data))
+        replayed += 1
+    return replayed
+
+
+def _spawn_handler(conn, addr, client_entry=None, pending=b""):
+    drain.enter()  # counted before the thread runs, so a handoff waits for it to park
+    threading.Thread(target=handle_client, args=(conn, addr, client_entry, pending), daemon=True).start()
+
+
+def _accept_trace(trace, recv_time):
+    """Keep only the sender's stamp of a client-supplied trace (see core/trace.py)."""
+    if not isinstance(trace, dict) or not isinstance(trace.get("c_send"), (int, float)):
+        return None
+    return {"c_send": trace["c_send"], "s_recv": recv_time, "s_enqueue": time.time()}
+
+
+def handle_client(conn, addr, client_entry=None, pending=b""):
+    """
+    Serve one connection. client_entry/pending continue a connection adopted
+    from a restart handoff (already registered) and the partial frame it had.
+    """
+    if client_entry is None:
+        client_entry = ClientSession(conn, addr)
+        with clients_lock:
+            connected_clients.append(client_entry)
+        print(f"[NEW CONNECTION] {addr}")
+
+    buffer = LineBuffer()
+    buffer.feed(pending)
+    client_entry.buffer = buffer  # counted in the memory report
+    poller = drain.poller(conn)
+    parked = False
     try:
-        buffer = ""
         while True:
+            if not drain.readable(poller):
+                parked = True  # a handoff: stop here, between two frames
+                break
             try:
-                data = conn.recv(4096)
+                data = conn.recv(RECV_SIZE)
             except Exception:
                 data = b""
             if not data:
                 break
+            recv_time = time.time()  # "s_recv" for traced messages in this read
+            client_entry.bytes_in += len(data)
+            if capture.active:
+                capture.received(conn, addr, data, recv_time)
 
-            buffer += data.decode("utf-8")
             # process all full newline-terminated messages
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
+            for line in buffer.feed(data):
                 if not line.strip():
                     continue
                 packet = parse_message(line)
@@ -124,12 +284,8 @@ def handle_client(conn, addr):
 
                     ok, msg = auth_mgr.create_server(server_name, password_hash, conn)
                     if ok:
-                        client_entry["username"] = username
-                        client_entry["server_name"] = server_name
-                        auth_mgr.servers[server_name]["host"] = username
-                        resp = create_message("auth_result", {"ok": True, "message": "server_created"})
-                        send_json(conn, resp)
-                        broadcast_client_list(server_name)
+                        auth_mgr.set_host(server_name, username)
+                        admit_to_room(conn, client_entry, server_name, username, "server_created")
                         print(f"[SERVER CREATED] {server_name} by {username}@{addr}")
                     else:
                         resp = create_message("auth_result", {"ok": False, "message": msg})
@@ -147,32 +303,78 @@ def handle_client(conn, addr):
 
                     ok, msg = auth_mgr.verify_join(server_name, password_hash, username)
                     if ok:
-                        client_entry["username"] = username
-                        client_entry["server_name"] = server_name
-                        resp = create_message("auth_result", {"ok": True, "message": "joined"})
-                        send_json(conn, resp)
-                        broadcast_system_message(server_name, f"{username} has joined.")
-                        broadcast_client_list(server_name)
+                        admit_to_room(conn, client_entry, server_name, username, "joined")
                         print(f"[JOIN] {username} -> {server_name} from {addr}")
                     else:
                         resp = create_message("auth_result", {"ok": False, "message": msg})
                         send_json(conn, resp)
 
+                elif ptype == "resume":
+                    # reconnect with a resume token: rebind the session and replay missed broadcasts
+                    token = pdata.get("resume_token", "")
+                    resumed = sessions.resume(token)
+                    if not resumed or resumed[0] not in auth_mgr.servers:
+                        send_json(conn, create_message("auth_result", {"ok": False, "message": "resume_failed"}))
+                        continue
+                    server_name, username = resumed
+                    admit_to_room(conn, client_entry, server_name, username, "resumed", token=token)
+                    last_seq = pdata.get("last_seq")
+                    if not isinstance(last_seq, int):
+                        last_seq = 0  # malformed: replay whatever history is kept
+                    replayed = replay_missed(conn, server_name, username, last_seq)
+                    print(f"[RESUME] {username} -> {server_name} from {addr} ({replayed} replayed)")
+
                 elif ptype == "chat":
-                    # broadcast to same server
-                    server_name = client_entry.get("server_name")
-                    username = client_entry.get("username", "unknown")
+                    # broadcast to same server, or only to the users named in "to"
+                    server_name = client_entry.server_name
+                    username = client_entry.username or "unknown"
                     text = pdata.get("message", "")
-                    if server_name:
-                        broadcast_to_server(server_name, username, text, sender_conn=conn)
+                    recipients = parse_targets(pdata.get("to"))
+                    trace = _accept_trace(pdata.get("trace"), recv_time)
+                    if server_name and recipients is not None:
+                        missing = send_direct_message(server_name, username, text, recipients, sender_conn=conn, trace=trace)
+                        if missing:
+                            send_json(conn, create_message("system", {"message": f"Not online: {', '.join(missing)}"}))
+                        print(f"[DM] ({server_name}) {username} -> {', '.join(sorted(recipients))}")
+                    elif server_name:
+                        broadcast_to_server(server_name, username, text, sender_conn=conn, trace=trace)
                         print(f"[CHAT] ({server_name}) {username}: {text}")
                     else:
                         resp = create_message("system", {"message": "not_in_server"})
                         send_json(conn, resp)
 
+                elif ptype == "presence_sync":
+                    # client detected a presence version gap -> resend full snapshot
+                    if client_entry.server_name:
+                        presence.send_snapshot(conn, client_entry.server_name)
+
                 elif ptype in ("file_offer", "file_chunk", "file_complete"):
                     # Relay file messages to peers in same server
-                    file_transfer.handle_file_message(packet, client_entry, connected_clients, clients_lock)
+                    if ptype == "file_offer" and not pdata.get("transfer_id"):  # p2p fallback relays were indexed as p2p_offer
+                        index_file_offer(client_entry, pdata)
+                    file_transfer.handle_file_message(packet, client_entry, rooms, clients_lock)
+
+                elif ptype in ("p2p_offer", "p2p_fallback"):
+                    # Broker a direct sender -> receiver transfer (bytes bypass the server)
+                    if ptype == "p2p_offer" and not pdata.get("origin"):  # delta fallbacks were indexed as delta_offer
+                        index_file_offer(client_entry, pdata)
+                    p2p.handle_p2p_message(packet, client_entry, rooms, clients_lock)
+
+                elif ptype in multicast.VALID_MCAST_TYPES:
+                    # Broker a LAN multicast transfer (datagrams bypass the server, repairs are relayed)
+                    if ptype == "mcast_offer":
+                        index_file_offer(client_entry, pdata)
+                    multicast.handle_mcast_message(packet, client_entry, rooms, clients_lock)
+
+                elif ptype in delta.VALID_DELTA_TYPES:
+                    # Broker a delta transfer (signatures routed to the sender, the delta itself is relayed)
+                    if ptype == "delta_offer":
+                        index_file_offer(client_entry, pdata)
+                    delta.handle_delta_message(packet, client_entry, rooms, clients_lock)
+
+                elif ptype == "search":
+                    # full-text search over the room's chat and file names, one page per request
+                    search_room(conn, client_entry, pdata)
 
                 else:
                     # unknown but valid packet type - inform client once
@@ -183,33 +385,310 @@ def handle_client(conn, addr):
         print("[ERROR] Exception in client handler:", e)
         traceback.print_exc()
     finally:
+        if parked:
+            drain.leave((client_entry, buffer.pending()))
+        else:
+            _disconnect(conn, addr, client_entry)
+            drain.leave()
+
+
+def _disconnect(conn, addr, client_entry):
+    with clients_lock:
+        connected_clients[:] = [c for c in connected_clients if c.conn != conn]
+        rooms.remove(client_entry)
+    capture.closed(conn)
+
+    token = client_entry.resume_token
+    if token:
         with clients_lock:
-            connected_clients[:] = [c for c in connected_clients if c["conn"] != conn]
+            # a half-open old connection may die after the client already resumed
+            still_attached = any(c.resume_token == token for c in connected_clients)
+        if not still_attached:
+            sessions.detach(token)
 
-        if client_entry["username"] and client_entry["server_name"]:
-            broadcast_system_message(client_entry["server_name"], f"{client_entry['username']} has left.")
-            broadcast_client_list(client_entry["server_name"])
+    if client_entry.username and client_entry.server_name:
+        # join/leave notices are derived client-side from the presence delta
+        presence.mark_changed(client_entry.server_name)
 
-        conn.close()
-        print(f"[DISCONNECT] {addr}")
+    conn.close()
+    print(f"[DISCONNECT] {addr}")
+
+
+# ---------- control socket: restart handoff and admin commands (see server/handoff.py) ----------
+def _serve_control(server_sock, path):
+    """Wait for a new server process to take over, or for admin commands; runs on its own thread."""
+    try:
+        ctl = handoff.listen(path)
+    except OSError as e:
+        print(f"[HANDOFF] disabled, cannot listen on {path}: {e}")
+        return
+    print(f"[HANDOFF] a new server can take over (and admin commands run) via {path}")
+    while True:
+        conn, _ = ctl.accept()
+        try:
+            conn.settimeout(handoff.ACK_TIMEOUT)
+            request = handoff.recv_packet(conn)
+            if request.get("type") == "admin":
+                handoff.send_packet(conn, "admin_result", run_admin_command(request.get("data", {})))
+            elif _hand_over(conn, request, server_sock, ctl, path):
+                return
+        except Exception as e:
+            print("[HANDOFF] failed:", e)
+        finally:
+            conn.close()
+
+
+def run_admin_command(data):
+    """profile/trace/capture/memory commands from `hi_ena.py admin`."""
+    command = data.get("command")
+    if command == "profile_start":
+        interval = data.get("interval")
+        ok = profiler.start(interval) if isinstance(interval, (int, float)) and interval > 0 else profiler.start()
+        print(f"[PROFILE] {'started' if ok else 'already running'}")
+        return {"ok": ok, "message": "profiler started" if ok else "profiler already running"}
+    if command == "profile_stop":
+        path, summary = profiler.stop(data.get("path") or None)
+        if path:
+            print(f"[PROFILE] stopped, samples written to {path}")
+        return {"ok": path is not None, "path": path, "message": summary}
+    if command == "trace":
+        return {"ok": True, "message": tracer.report(), "hops": tracer.snapshot()}
+    if command == "trace_reset":
+        tracer.reset()
+        return {"ok": True, "message": "trace histograms cleared"}
+    if command == "capture_start":
+        path = data.get("path") or _default_capture_path()
+        ok = capture.start(path)
+        if ok:
+            print(f"[CAPTURE] recording inbound traffic to {path}")
+        return {"ok": ok, "path": path if ok else None,
+                "message": f"capturing to {path}" if ok else f"already capturing to {capture.path}"}
+    if command == "capture_stop":
+        path, size = capture.stop()
+        if path:
+            print(f"[CAPTURE] stopped, {size} bytes written to {path}")
+        return {"ok": path is not None, "path": path,
+                "message": f"captured {size} bytes" if path else "no capture running"}
+    if command == "memory":
+        report = memory_report(data.get("top") or memory.MEMORY_TOP)
+        return {"ok": True, "message": memory.format_report(report), "report": report}
+    return {"ok": False, "message": f"unknown command {command!r}"}
+
+
+def memory_report(top=memory.MEMORY_TOP):
+    """Buffered bytes per connection and the size of every room, largest first."""
+    with clients_lock:
+        entries = list(connected_clients)
+        room_members = rooms.room_sizes()
+    return memory.build_report(entries, room_members, history.sizes(), search_index.sizes(), len(sessions),
+                               relay_budget, top)
+
+
+def _default_capture_path():
+    return os.path.join(tempfile.gettempdir(), f"hiena-capture-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.cap")
+
+
+def _hand_over(conn, request, server_sock, ctl, path):
+    """Old process side. Returns True once the new process owns every socket."""
+    if request.get("type") != "handoff_request" or request.get("data", {}).get("version") != handoff.HANDOFF_VERSION:
+        handoff.send_packet(conn, "handoff_refused", {"reason": "unsupported request"})
+        return False
+
+    print("[HANDOFF] new server process is taking over; draining connections")
+    drain.request()
+    if not drain.wait_idle():
+        # a handler is stuck mid-frame (e.g. sending to a slow client): sharing its socket would corrupt it
+        _resume(drain.release(handed_over=False))
+        handoff.send_packet(conn, "handoff_refused", {"reason": "connections did not drain in time"})
+        print("[HANDOFF] aborted: connections did not drain in time")
+        return False
+
+    parked = drain.parked
+    state = {
+        "version": handoff.HANDOFF_VERSION,
+        "rooms": auth_mgr.snapshot(),
+        "presence": presence.snapshot(),
+        "history": history.snapshot(),
+        "sessions": sessions.snapshot({entry.resume_token for entry, _ in parked if entry.resume_token}),
+        "clients": [dict(entry.to_dict(), pending=base64.b64encode(pending).decode("ascii"))
+                    for entry, pending in parked],
+    }
+    fds = [server_sock.fileno()] + [entry.conn.fileno() for entry, _ in parked]
+    try:
+        handoff.send_packet(conn, "handoff_accept", {})
+        handoff.send_state(conn, state, fds)
+        ready = handoff.recv_packet(conn)
+        if ready.get("type") != "handoff_ready":
+            raise ConnectionError(f"unexpected reply {ready.get('type')}")
+        # past this point the new process serves the sockets; we must not touch them again
+        handoff.send_packet(conn, "handoff_commit", {})
+    except Exception as e:
+        _resume(drain.release(handed_over=False))
+        for name in state["presence"]:
+            presence.mark_changed(name)  # flushes cancelled by the snapshot
+        print("[HANDOFF] aborted, still serving:", e)
+        return False
+
+    # our copies of the descriptors go away; the connections live on in the new process
+    ctl.close()
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    print(f"[HANDOFF] handed {len(parked)} connection(s) to the new server process")
+    try:
+        # the new process serves already; it rebuilds the search index from this in the background
+        handoff.send_packet(conn, "handoff_released", {})
+        handoff.send_state(conn, {"search": search_index.snapshot()}, [])
+    except Exception as e:
+        print("[HANDOFF] search index not handed over:", e)
+    cap_path, _ = capture.stop()  # the connections continue in a process that is not capturing
+    if cap_path:
+        print(f"[CAPTURE] stopped for the handoff, written to {cap_path}")
+    for entry, _ in drain.release(handed_over=True):  # lets the accept loop return and the process exit
+        entry.conn.close()
+    return True
+
+
+def _resume(parked):
+    for entry, pending in parked:
+        _spawn_handler(entry.conn, entry.addr, entry, pending)
+
+
+def _take_over(path):
+    """
+    New process side: adopt the listening socket, connections and state of the
+    server listening on path. Returns the listening socket, or None when no
+    server is running there.
+    """
+    if not handoff.supported():
+        print("[HANDOFF] this platform cannot pass sockets between processes; starting fresh")
+        return None
+    ctl = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        ctl.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        ctl.close()
+        print(f"[HANDOFF] no running server at {path}; starting fresh")
+        return None
 
+    try:
+        handoff.send_packet(ctl, "handoff_request", {"version": handoff.HANDOFF_VERSION})
+        reply = handoff.recv_packet(ctl)
+        if reply.get("type") != "handoff_accept":
+            raise RuntimeError(f"old server refused the handoff: {reply.get('data', {}).get('reason')}")
+        state, fds = handoff.recv_state(ctl)
+        socks = [socket.socket(fileno=fd) for fd in fds]
+        handoff.send_packet(ctl, "handoff_ready", {"clients": len(socks) - 1})
+        if handoff.recv_packet(ctl).get("type") != "handoff_commit":
+            for s in socks:
+                s.close()
+            raise RuntimeError("old server did not commit the handoff")
+    except BaseException:
+        ctl.close()
+        raise
 
-def start_server(host=HOST, port=PORT):
-    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_sock.bind((host, port))
-    server_sock.listen()
-    print(f"[SERVER STARTED] Listening on {host}:{port}")
+    auth_mgr.restore(state["rooms"])
+    history.restore(state["history"])
+    search_index.begin_restore()  # messages indexed from now on go after the old documents
+    sessions.restore(state["sessions"])
+    adopted = []
+    with clients_lock:
+        for sock, c in zip(socks[1:], state["clients"]):
+            entry = ClientSession(ClientSocket(sock, relay_budget, drain), tuple(c["addr"]), c["username"], c["server_name"], c["resume_token"])
+            connected_clients.append(entry)
+            if entry.server_name:
+                rooms.add(entry)
+            adopted.append((entry, base64.b64decode(c["pending"])))
+    presence.restore(state["presence"])
+    for entry, pending in adopted:
+        _spawn_handler(entry.conn, entry.addr, entry, pending)
+
+    # the old process removes its handoff socket before releasing us, so ours can take the path
+    try:
+        released = handoff.recv_packet(ctl).get("type") == "handoff_released"
+    except (OSError, ValueError):
+        released = False
+    if released:
+        threading.Thread(target=_restore_search, args=(ctl,), daemon=True, name="search-restore").start()
+    else:
+        search_index.restore({})
+        ctl.close()
+
+    print(f"[HANDOFF] took over {len(adopted)} connection(s) and {len(state['rooms'])} room(s)")
+    return socks[0]
+
+
+def _restore_search(ctl):
+    """Rebuild the search index from the old process' documents while the adopted clients are served."""
+    snapshot = {}
+    try:
+        with ctl:
+            snapshot = handoff.recv_state(ctl)[0].get("search", {})
+    except Exception as e:
+        print("[HANDOFF] search index not handed over:", e)
+    start = time.monotonic()
+    search_index.restore(snapshot)
+    print(f"[HANDOFF] search index rebuilt ({sum(map(len, snapshot.values()))} documents) "
+          f"in {time.monotonic() - start:.1f}s")
+
+
+def start_server(host=HOST, port=PORT, takeover=False, handoff_socket=None, capture_path=None,
+                 relay_conn_budget=None, relay_total_budget=None, spill_dir=None, spill_budget=None):
+    """
+    Run the server. With takeover=True a server already running with the same
+    handoff socket hands its listening socket, connections and rooms over to
+    this process instead of this one binding the port. capture_path records
+    all inbound traffic from the start (see server/capture.py). The relay
+    budgets (bytes), spill_dir and spill_budget (bytes on disk) override the
+    server/relay.py defaults.
+    """
+    if relay_conn_budget is not None:
+        relay_budget.conn_limit = relay_conn_budget
+    if relay_total_budget is not None:
+        relay_budget.total_limit = relay_total_budget
+    if spill_dir:
+        relay_budget.spill_dir = spill_dir
+    if spill_budget is not None:
+        relay_budget.spill_limit = spill_budget
+    path = handoff_socket or handoff.handoff_path(port)
+    server_sock = None
+    if takeover:
+        try:
+            server_sock = _take_over(path)
+        except Exception as e:
+            print("[HANDOFF] takeover failed:", e)
+            return
+    if server_sock is None:
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_sock.bind((host, port))
+        server_sock.listen()
+    print(f"[SERVER STARTED] Listening on {server_sock.getsockname()[0]}:{server_sock.getsockname()[1]}")
+    if capture_path and capture.start(capture_path):
+        print(f"[CAPTURE] recording inbound traffic to {capture_path}")
+    if handoff.supported():
+        threading.Thread(target=_serve_control, args=(server_sock, path), daemon=True).start()
 
     try:
+        poller = drain.poller(server_sock)
+        drain.enter()
         while True:
+            if not drain.readable(poller):
+                drain.leave()
+                if not drain.wait_released():
+                    break  # handed over: the new process accepts from now on
+                drain.enter()
+                continue
             conn, addr = server_sock.accept()
-            thr = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-            thr.start()
+            _spawn_handler(ClientSocket(conn, relay_budget, drain), addr)
     except KeyboardInterrupt:
         print("\n[SHUTDOWN] Server shutting down.")
     finally:
         server_sock.close()
+        cap_path, _ = capture.stop()
+        if cap_path:
+            print(f"[CAPTURE] written to {cap_path}")
 
 if __name__ == "__main__":
     start_server()
\ No newline at end of file
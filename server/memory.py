@@ -0,0 +1,134 @@
+# server/memory.py
+"""
+Where the server's memory goes, per connection and per room.
+
+For every ClientSession the report counts the bytes buffered on its behalf:
+the partial frame in its LineBuffer, what the kernel holds in the socket's
+receive queue (not read yet) and send queue (sent but not yet acknowledged
+by the client, i.e. a slow reader), relay frames queued for it in memory or
+spilled to disk (server/relay.py), and the file relays it has open. Rooms
+show their members, replay history and search documents. The largest
+consumers are listed first; `hi_ena.py admin memory` prints it.
+
+The kernel queue sizes need the Linux SIOCINQ/SIOCOUTQ ioctls; elsewhere
+they are reported as 0.
+"""
+
+import array
+import os
+import sys
+import threading
+
+try:
+    import fcntl
+    import termios
+    _QUEUE_IOCTLS = (termios.FIONREAD, termios.TIOCOUTQ)  # SIOCINQ / SIOCOUTQ on sockets
+except (ImportError, AttributeError):
+    fcntl = None
+
+MEMORY_TOP = 10
+
+
+def socket_queues(sock):
+    """(bytes waiting to be read, bytes waiting to be acknowledged) for a connected socket."""
+    if fcntl is None or sock is None:
+        return 0, 0
+    sizes = []
+    for request in _QUEUE_IOCTLS:
+        buf = array.array("i", [0])
+        try:
+            fcntl.ioctl(sock.fileno(), request, buf, True)
+        except (OSError, ValueError):
+            return 0, 0
+        sizes.append(buf[0])
+    return tuple(sizes)
+
+
+def process_rss():
+    """Resident set size in bytes (0 if /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def session_usage(entry):
+    buffered = entry.buffer.buffered() if entry.buffer is not None else 0
+    kernel_in, kernel_out = socket_queues(entry.conn)
+    queued, other, spilled = entry.conn.relay_stats() if hasattr(entry.conn, "relay_stats") else (0, 0, 0)
+    transfers = entry.transfers or {}
+    return {
+        "username": entry.username,
+        "server_name": entry.server_name,
+        "addr": list(entry.addr) if entry.addr else None,
+        "input": buffered,
+        "kernel_in": kernel_in,
+        "kernel_out": kernel_out,
+        "queued": queued + other,
+        "spilled": spilled,
+        "transfers": len(transfers),
+        "relayed": sum(t[1] for t in transfers.values()),
+        "bytes_in": entry.bytes_in,
+        "total": buffered + kernel_in + kernel_out + queued + other + spilled,
+    }
+
+
+def build_report(entries, room_members, history_sizes, search_sizes, resumable, relay_budget, top=MEMORY_TOP):
+    """entries is a copy of connected_clients; room_members maps server_name -> member count."""
+    usage = [session_usage(e) for e in entries]
+    usage.sort(key=lambda u: u["total"], reverse=True)
+    rooms = [{"server_name": name, "members": count, "history": history_sizes.get(name, 0),
+              "search_docs": search_sizes.get(name, 0)}
+             for name, count in room_members.items()]
+    rooms.sort(key=lambda r: (r["members"], r["search_docs"]), reverse=True)
+    return {
+        "rss": process_rss(),
+        "threads": threading.active_count(),
+        "sessions": len(entries),
+        "session_object_bytes": sum(sys.getsizeof(e) for e in entries),
+        "resumable": resumable,
+        "input": sum(u["input"] for u in usage),
+        "kernel_in": sum(u["kernel_in"] for u in usage),
+        "kernel_out": sum(u["kernel_out"] for u in usage),
+        "queued": sum(u["queued"] for u in usage),
+        "relay_memory": relay_budget.memory,
+        "relay_budget": relay_budget.total_limit,
+        "spilled": relay_budget.spilled,
+        "spill_budget": relay_budget.spill_limit,
+        "spill_dir": relay_budget.spill_dir,
+        "spilled_total": relay_budget.spilled_total,
+        "transfers": sum(u["transfers"] for u in usage),
+        "top_sessions": usage[:top],
+        "top_rooms": rooms[:top],
+    }
+
+
+def _size(n):
+    if n < 1024:
+        return f"{n} B"
+    return f"{n / 1024:,.1f} KB" if n < 1024 * 1024 else f"{n / 1048576:,.1f} MB"
+
+
+def format_report(report):
+    lines = [
+        f"RSS {report['rss'] / 1048576:,.1f} MB, {report['threads']} threads, "
+        f"{report['sessions']} connections ({_size(report['session_object_bytes'])} of session objects), "
+        f"{report['resumable']} resumable sessions",
+        f"buffered: {_size(report['input'])} partial frames, {_size(report['kernel_in'])} unread, "
+        f"{_size(report['kernel_out'])} unacknowledged output, {report['transfers']} file relay(s) open",
+        f"relay queues: {_size(report['queued'])} in memory ({_size(report['relay_memory'])} of the "
+        f"{_size(report['relay_budget'])} chunk budget), {_size(report['spilled'])} spilled to disk "
+        f"(of {_size(report['spill_budget'])} in {report['spill_dir']}; {_size(report['spilled_total'])} since start)",
+        "",
+        f"{'connection':32} {'partial':>10} {'unread':>10} {'unacked':>10} {'queued':>10} {'spilled':>10} "
+        f"{'relays':>6} {'received':>12}",
+    ]
+    for u in report["top_sessions"]:
+        who = f"{u['username'] or '?'}@{u['server_name'] or '-'}"
+        lines.append(f"{who[:32]:32} {_size(u['input']):>10} {_size(u['kernel_in']):>10} {_size(u['kernel_out']):>10} "
+                     f"{_size(u['queued']):>10} {_size(u['spilled']):>10} {u['transfers']:6d} {_size(u['bytes_in']):>12}")
+    lines += ["", f"{'room':32} {'members':>8} {'history':>8} {'indexed':>10}"]
+    for r in report["top_rooms"]:
+        lines.append(f"{r['server_name'][:32]:32} {r['members']:8d} {r['history']:8d} {r['search_docs']:10d}")
+    return "\n".join(lines)
@@ -0,0 +1,65 @@
+# server/multicast.py
+"""
+Broker for multicast file distribution on the LAN (see client/multicast.py for
+the full flow).
+
+Like the p2p broker, the server never sees the multicast datagrams. It hands
+the offer (group, port, block size) to every receiver in the room or the
+users named in "target", tells the sender who was asked ("mcast_receivers"),
+and routes the receivers' answers (ready / nack / fallback) back to the
+sender and the sender's "mcast_done" to the receivers. Repairs of missing
+ranges and fallback copies are ordinary file_chunk relays.
+"""
+
+from server import brokering
+
+VALID_MCAST_TYPES = {"mcast_offer", "mcast_done", "mcast_ready", "mcast_nack", "mcast_fallback"}
+_TO_SENDER = {"mcast_ready", "mcast_nack", "mcast_fallback"}
+
+
+def handle_mcast_message(packet, client_entry, rooms, clients_lock):
+    try:
+        ptype = packet.get("type")
+        pdata = packet.get("data", {}) or {}
+
+        if ptype not in VALID_MCAST_TYPES:
+            print(f"[SERVER] Ignored unknown multicast packet type: {ptype}")
+            return
+
+        sender = client_entry.username
+        if not client_entry.server_name:
+            return
+
+        if ptype == "mcast_offer":
+            receivers, missing = brokering.resolve_audience(client_entry, rooms, clients_lock,
+                                                            pdata.get("target", "all"))
+            offer = dict(pdata, **{"from": sender})
+            offer.pop("target", None)
+            # the sender learns who to wait for before any receiver can answer
+            if not brokering.forward_offer(
+                    client_entry, "mcast_receivers",
+                    {"transfer_id": pdata.get("transfer_id"), "receivers": [c.username for c in receivers]},
+                    missing, "mcast_offer", [(c, offer) for c in receivers], "MCAST"):
+                return
+
+            print(f"[SERVER] {sender} multicasts '{pdata.get('filename')}' on {pdata.get('group')}:{pdata.get('port')} "
+                  f"to {len(receivers)} receiver(s)")
+
+        elif ptype == "mcast_done":
+            # end of the multicast pass -> every receiver reports what it is missing
+            receivers, _missing = brokering.resolve_audience(client_entry, rooms, clients_lock,
+                                                             pdata.get("target", "all"))
+            done = {"transfer_id": pdata.get("transfer_id"), "from": sender}
+            brokering.deliver([(c, done) for c in receivers], "mcast_done", "MCAST")
+
+        elif ptype in _TO_SENDER:
+            owner = pdata.get("from")
+            reply = {"transfer_id": pdata.get("transfer_id"), "username": sender}
+            if ptype == "mcast_nack":
+                reply["ranges"] = pdata.get("ranges", [])
+            brokering.route_to_owner(client_entry, rooms, clients_lock, owner, ptype, reply, "MCAST")
+            if ptype == "mcast_fallback":
+                print(f"[SERVER] {sender} falls back to relay for multicast {pdata.get('transfer_id')} from {owner}")
+
+    except Exception as e:
+        print(f"[SERVER ERROR] handle_mcast_message exception: {e}")
@@ -0,0 +1,62 @@
+# server/p2p.py
+"""
+Broker for direct LAN file transfers (see client/p2p.py for the full flow).
+
+The server never touches the file bytes here: it only hands every receiver in
+the room (or the users named in "target") the sender's endpoint and a one-time token, and forwards fallback
+requests back to the sender when a receiver cannot reach it directly.
+"""
+
+import secrets
+
+from server import brokering
+
+VALID_P2P_TYPES = {"p2p_offer", "p2p_fallback"}
+
+
+def handle_p2p_message(packet, client_entry, rooms, clients_lock):
+    try:
+        ptype = packet.get("type")
+        pdata = packet.get("data", {}) or {}
+
+        if ptype not in VALID_P2P_TYPES:
+            print(f"[SERVER] Ignored unknown p2p packet type: {ptype}")
+            return
+
+        sender = client_entry.username
+        if not client_entry.server_name:
+            return
+
+        if ptype == "p2p_offer":
+            transfer_id = pdata.get("transfer_id")
+            host = (client_entry.addr or ("",))[0]
+            receivers, missing = brokering.resolve_audience(client_entry, rooms, clients_lock,
+                                                            pdata.get("target", "all"))
+            tokens = {secrets.token_hex(16): c for c in receivers}
+            offer = {
+                "from": sender,
+                "transfer_id": transfer_id,
+                "filename": pdata.get("filename"),
+                "filesize": pdata.get("filesize", 0),
+                "host": host,
+                "port": pdata.get("port"),
+            }
+            # the sender learns the tokens first so early connects can be validated
+            if not brokering.forward_offer(
+                    client_entry, "p2p_tokens",
+                    {"transfer_id": transfer_id, "tokens": {tok: c.username for tok, c in tokens.items()}},
+                    missing, "p2p_offer", [(c, dict(offer, token=tok)) for tok, c in tokens.items()], "P2P"):
+                return
+
+            print(f"[SERVER] {sender} offers '{pdata.get('filename')}' directly from {host}:{pdata.get('port')} "
+                  f"to {len(tokens)} receiver(s)")
+
+        elif ptype == "p2p_fallback":
+            # a receiver could not pull directly -> ask the sender to relay to it
+            owner = pdata.get("from")
+            brokering.route_to_owner(client_entry, rooms, clients_lock, owner, "p2p_fallback",
+                                     {"transfer_id": pdata.get("transfer_id"), "username": sender}, "P2P")
+            print(f"[SERVER] {sender} falls back to relay for transfer {pdata.get('transfer_id')} from {owner}")
+
+    except Exception as e:
+        print(f"[SERVER ERROR] handle_p2p_message exception: {e}")
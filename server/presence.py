@@ -0,0 +1,137 @@
+# server/presence.py
+"""
+Versioned room presence with debounced join/leave deltas.
+
+Instead of pushing the full member list to every member on each join/leave
+(O(n^2) when a whole meeting joins at once), every room keeps a published
+member set and a version number. Joins and leaves only mark the room dirty;
+after PRESENCE_DEBOUNCE seconds a single "presence" delta is broadcast:
+
+    {"version": v, "base": v - 1, "joined": [...], "left": [...]}
+
+A full "clients" snapshot is only sent to a newly joined client or to a client
+that detected a version gap and asked for one with "presence_sync".
+
+Nothing is sent while the tracker's lock or clients_lock is held: a flush
+takes the room's member connections under the locks and writes after
+releasing them, so one slow member cannot stall joins, leaves or other
+rooms. Flushes of one room still run one at a time (the room's send lock),
+so every member sees the deltas in version order.
+"""
+
+import threading
+
+from core.utils import create_message
+
+PRESENCE_DEBOUNCE = 0.25  # seconds to collect a burst of joins/leaves into one delta
+
+
+class PresenceTracker:
+    def __init__(self, rooms, clients_lock, debounce=PRESENCE_DEBOUNCE):
+        self.rooms = rooms              # RoomIndex of the live members, guarded by clients_lock
+        self.clients_lock = clients_lock
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        # rooms: server_name -> {"version": int, "members": set(usernames), "timer": Timer or None,
+        #                        "send_lock": Lock held by the flush sending this room's delta}
+        self._rooms = {}
+
+    def _room(self, server_name):
+        room = self._rooms.get(server_name)
+        if room is None:
+            room = self._rooms[server_name] = _new_room()
+        return room
+
+    def send_snapshot(self, conn, server_name):
+        """
+        Send the published member list and its version to one connection. The
+        caller adds the connection to the room only afterwards, so no delta can
+        overtake the snapshot.
+        """
+        with self._lock:
+            room = self._rooms.get(server_name) or _new_room()
+            msg = create_message("clients", {"list": sorted(room["members"]), "version": room["version"]})
+        try:
+            conn.sendall((msg + "\n").encode("utf-8"))
+        except Exception:
+            pass
+
+    def snapshot(self):
+        """
+        Published versions/members for a restart handoff. Pending flushes are
+        cancelled here and flagged, so the new process sends them instead.
+        """
+        with self._lock:
+            snap = {}
+            for name, room in self._rooms.items():
+                if room["timer"] is not None:
+                    room["timer"].cancel()
+                    room["timer"] = None
+                snap[name] = {"version": room["version"], "members": sorted(room["members"])}
+            return snap
+
+    def restore(self, snapshot):
+        with self._lock:
+            for name, room in snapshot.items():
+                self._rooms[name] = _new_room(room["version"], room["members"])
+        # re-diff every room: clients the old process could not hand over are published as left
+        for name in snapshot:
+            self.mark_changed(name)
+
+    def mark_changed(self, server_name):
+        """Schedule a presence flush for server_name unless one is already pending."""
+        with self._lock:
+            room = self._room(server_name)
+            if room["timer"] is not None:
+                return
+            timer = threading.Timer(self.debounce, self.flush, args=(server_name,))
+            timer.daemon = True
+            room["timer"] = timer
+            timer.start()
+
+    def flush(self, server_name):
+        """Diff the live members against the published set and broadcast one delta."""
+        with self._lock:
+            room = self._rooms.get(server_name)
+            if room is None:
+                return
+
+        with room["send_lock"]:
+            with self._lock:
+                if self._rooms.get(server_name) is not room:
+                    return  # emptied and dropped meanwhile
+                room["timer"] = None
+                with self.clients_lock:
+                    members = self.rooms.members(server_name)
+                current = {c.username for c in members if c.username}
+                joined = sorted(current - room["members"])
+                left = sorted(room["members"] - current)
+                if not current:
+                    # nobody left to tell; a later join starts the room over at version 0
+                    del self._rooms[server_name]
+                if not joined and not left:
+                    return  # e.g. a quick leave + rejoin inside one window
+
+                room["version"] += 1
+                room["members"] = current
+                version = room["version"]
+
+            payload = (create_message("presence", {
+                "version": version,
+                "base": version - 1,
+                "joined": joined,
+                "left": left,
+            }) + "\n").encode("utf-8")
+            for c in members:
+                conn = c.conn
+                if conn is not None:
+                    try:
+                        conn.sendall(payload)
+                    except Exception:
+                        pass
+
+        print(f"[PRESENCE] ({server_name}) v{version} +{len(joined)} -{len(left)}")
+
+
+def _new_room(version=0, members=()):
+    return {"version": version, "members": set(members), "timer": None, "send_lock": threading.Lock()}
@@ -0,0 +1,371 @@
+# server/relay.py
+"""
+Outbound side of a client connection: whole frames from any thread, and a
+relay queue so file data never waits on the slowest receiver.
+
+Relayed file frames (file_offer/chunk/complete) to a receiver with nothing
+queued are written right away with a non-blocking send. Whatever does not
+fit in the socket buffer, and every frame behind it, goes to the receiver's
+queue, written by a writer thread that exists while the queue is non-empty,
+so the sender's handler never waits for a receiver. Chunk payloads are kept
+in memory while both budgets allow it:
+
+    per connection  RELAY_CONN_BUDGET bytes of queued chunks
+    whole server    RELAY_TOTAL_BUDGET bytes over all connections
+
+Above either, chunks are appended to temporary spill segments on disk
+(SPILL_SEGMENT_SIZE each, unlinked at creation) and read back with pread
+when their turn comes; a segment is closed as soon as its last frame went
+out. Offers and completions are never spilled, and the queue is FIFO
+whether a frame sits in memory or on disk, so every receiver sees
+offer -> chunks -> complete in order.
+
+Spill I/O never runs under a lock other threads wait on: relay() queues the
+frame first and writes it to the segment afterwards, and a writer that
+reaches the frame before it is on disk sends it from memory. At most
+RELAY_SPILL_BUDGET bytes are spilled over the whole server; a receiver that
+would need more is disconnected (and resumes its session when it
+reconnects). Spill segments go to the temp dir unless --spill-dir says
+otherwise; if that is a tmpfs (/tmp often is), spilling fills RAM, so point
+it at a real disk on servers that relay large files to slow receivers.
+
+Everything else (chat, presence, system, replies) goes through sendall().
+With no relay backlog it is written directly; while the writer is busy it
+is queued in memory ahead of the remaining file frames, so a chat line
+waits for at most the one relay frame being written, never for the
+backlog, and the thread broadcasting it does not block on a slow receiver
+(unless URGENT_LIMIT bytes of such frames are already waiting for it).
+A socket lock keeps frames from different threads from interleaving.
+
+Writer threads count as running for a restart handoff (tracker), so a
+handoff waits for relay backlogs to flush and is refused if they do not
+within handoff.PARK_TIMEOUT.
+"""
+
+import os
+import socket
+import tempfile
+import threading
+from collections import deque
+
+RELAY_CONN_BUDGET = 16 * 1024 * 1024     # queued chunk bytes in memory per receiver
+RELAY_TOTAL_BUDGET = 256 * 1024 * 1024   # ... and over all receivers
+RELAY_SPILL_BUDGET = 8 * 1024 * 1024 * 1024  # bytes on disk over all receivers
+SPILL_SEGMENT_SIZE = 64 * 1024 * 1024
+URGENT_LIMIT = 4 * 1024 * 1024           # chat/control bytes waiting behind a relay frame
+_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class RelayBudget:
+    """Server-wide accounting of relay bytes held in memory and on disk."""
+
+    def __init__(self, conn_limit=RELAY_CONN_BUDGET, total_limit=RELAY_TOTAL_BUDGET, spill_dir=None,
+                 spill_limit=RELAY_SPILL_BUDGET):
+        self._lock = threading.Lock()
+        self.conn_limit = conn_limit
+        self.total_limit = total_limit
+        self.spill_dir = spill_dir or tempfile.gettempdir()
+        self.spill_limit = spill_limit
+        self.memory = 0
+        self.spilled = 0
+        self.spilled_total = 0   # bytes ever written to disk
+
+    def reserve(self, nbytes, queued):
+        """Take nbytes of memory for a receiver already holding queued bytes; False = spill it."""
+        with self._lock:
+            if queued + nbytes > self.conn_limit or self.memory + nbytes > self.total_limit:
+                return False
+            self.memory += nbytes
+            return True
+
+    def release(self, nbytes):
+        with self._lock:
+            self.memory -= nbytes
+
+    def spill(self, nbytes):
+        """Take nbytes of disk; False once spill_limit is reached."""
+        with self._lock:
+            if self.spilled + nbytes > self.spill_limit:
+                return False
+            self.spilled += nbytes
+            self.spilled_total += nbytes
+            return True
+
+    def unspill(self, nbytes):
+        with self._lock:
+            self.spilled -= nbytes
+
+
+class _Segment:
+    __slots__ = ("fd", "size", "pending", "busy")
+
+    def __init__(self, directory):
+        fd, path = tempfile.mkstemp(prefix="hiena-spill-", suffix=".seg", dir=directory)
+        os.unlink(path)  # lives as long as the descriptor
+        self.fd = fd
+        self.size = 0
+        self.pending = 0    # queued frames stored in it
+        self.busy = 0       # pwrite()s in progress
+
+
+class _Spilled:
+    """A queued frame stored in a segment; data is kept until the pwrite is done."""
+    __slots__ = ("seg", "offset", "length", "data")
+
+    def __init__(self, seg, offset, data):
+        self.seg = seg
+        self.offset = offset
+        self.length = len(data)
+        self.data = data
+
+
+class ClientSocket:
+    """A client's socket: recv() as usual, sendall() for whole frames, relay() for file frames."""
+
+    def __init__(self, sock, budget, tracker=None):
+        self.sock = sock
+        self.budget = budget
+        self.tracker = tracker   # enter()/leave() around writer threads (the handoff Drain)
+        self._io = threading.Lock()           # held while a frame is being written
+        self._state = threading.Condition()   # guards everything below
+        self._urgent = deque()
+        self._urgent_bytes = 0
+        self._queue = deque()    # (data, budgeted) in memory, or _Spilled on disk
+        self._memory = 0         # chunk bytes of _queue held in memory (counted in the budget)
+        self._other = 0          # offer/complete bytes of _queue (never spilled, not budgeted)
+        self._spilled = 0
+        self._segment = None     # segment being appended to
+        self._partial = None     # rest of a frame relay() began writing; the writer owns _io for it
+        self._writing = False
+        self._closed = False
+
+    # ---- socket passthrough ----
+    def recv(self, bufsize):
+        return self.sock.recv(bufsize)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def close(self):
+        with self._state:
+            self._closed = True
+            fds = self._discard()
+            self._state.notify_all()
+        _close_all(fds)
+        self.sock.close()
+
+    # ---- sending ----
+    def sendall(self, data):
+        """Send one whole frame, or queue it ahead of the relay backlog while the writer is busy."""
+        with self._state:
+            if self._writing:
+                self._state.wait_for(lambda: self._urgent_bytes < URGENT_LIMIT or not self._writing or self._closed)
+                if self._closed:
+                    raise ConnectionError("connection closed")
+                if self._writing:
+                    self._urgent.append(data)
+                    self._urgent_bytes += len(data)
+                    return
+        with self._io:  # a writer started meanwhile just goes before or after this frame
+            self.sock.sendall(data)
+
+    def relay(self, data, bulk):
+        """Queue a relayed file frame; bulk (chunk) frames may be spilled to disk."""
+        spilled = full = None
+        with self._state:
+            if self._closed:
+                return
+            if _DONTWAIT and not self._writing and self._io.acquire(blocking=False):
+                try:
+                    sent = self.sock.send(data, _DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                except OSError:
+                    self._io.release()
+                    return  # the handler's recv() sees the error and disconnects
+                if sent == len(data):
+                    self._io.release()
+                    return
+                if sent:
+                    # mid-frame: the writer finishes it before anything else uses the socket
+                    self._partial = memoryview(data)[sent:]
+                    self._start_writer()
+                    return
+                self._io.release()
+            if not bulk:
+                self._queue.append((data, False))
+                self._other += len(data)
+            elif self.budget.reserve(len(data), self._memory):
+                self._queue.append((data, True))
+                self._memory += len(data)
+            else:
+                spilled = self._spill(data)
+                full = spilled is None
+                if spilled is not None:
+                    self._queue.append(spilled)
+            if not self._writing and not full:
+                self._start_writer()
+        if full:
+            print(f"[RELAY] spill budget of {self.budget.spill_limit // 1048576} MB used up; "
+                  f"disconnecting a receiver that cannot keep up")
+            self._broken()
+        elif spilled is not None:
+            self._write_spill(spilled)
+
+    def _start_writer(self):
+        self._writing = True
+        if self.tracker is not None:
+            self.tracker.enter()
+        threading.Thread(target=self._write_loop, name="relay-writer", daemon=True).start()
+
+    def _spill(self, data):
+        """Reserve room for data in a segment (caller holds _state); None over the spill budget."""
+        if not self.budget.spill(len(data)):
+            return None
+        seg = self._segment
+        if seg is None or seg.size >= SPILL_SEGMENT_SIZE:
+            seg = self._segment = _Segment(self.budget.spill_dir)
+        item = _Spilled(seg, seg.size, data)
+        seg.size += len(data)
+        seg.pending += 1
+        seg.busy += 1
+        self._spilled += len(data)
+        return item
+
+    def _write_spill(self, item):
+        """The pwrite of a frame _spill() queued, outside _state; the writer sends it from memory meanwhile."""
+        try:
+            os.pwrite(item.seg.fd, item.data, item.offset)
+            written = True
+        except OSError as e:
+            print(f"[RELAY] cannot spill to {self.budget.spill_dir}, keeping the chunk in memory: {e}")
+            written = False
+        with self._state:
+            if written:
+                item.data = None
+            item.seg.busy -= 1
+            fd = self._retire(item.seg)
+        _close_all([fd])
+
+    def _retire(self, seg):
+        """Caller holds _state. Returns seg's descriptor once nothing uses it any more (the caller closes it)."""
+        if seg.busy or seg.fd < 0 or (seg.pending and not self._closed):
+            return None
+        if seg is self._segment:
+            self._segment = None
+        fd, seg.fd = seg.fd, -1
+        return fd
+
+    def _next_frame(self):
+        """
+        Pop the next frame to write (urgent first) as (data, budgeted bytes,
+        _Spilled or None), or None when done. data is None for a frame the
+        caller has to pread from its segment (outside _state).
+        """
+        if self._urgent:
+            data = self._urgent.popleft()
+            self._urgent_bytes -= len(data)
+            self._state.notify_all()
+            return data, 0, None
+        if not self._queue:
+            return None
+        item = self._queue.popleft()
+        if not isinstance(item, _Spilled):
+            data, budgeted = item
+            if budgeted:
+                self._memory -= len(data)
+                return data, len(data), None  # released once written, so the budget covers it until then
+            self._other -= len(data)
+            return data, 0, None
+        item.seg.pending -= 1
+        self._spilled -= item.length
+        self.budget.unspill(item.length)
+        if item.data is not None:  # not on disk yet: sent from memory
+            return item.data, 0, None
+        item.seg.busy += 1         # the pread; the segment stays open until it is done
+        return None, 0, item
+
+    def _write_loop(self):
+        try:
+            if self._partial is not None:
+                partial, self._partial = self._partial, None
+                try:
+                    self.sock.sendall(partial)
+                except OSError:
+                    self._io.release()
+                    self._broken()
+                    return
+                self._io.release()
+            while True:
+                with self._state:
+                    frame = None if self._closed else self._next_frame()
+                    if frame is None:
+                        self._writing = False
+                        self._state.notify_all()
+                        return
+                data, budgeted, spilled = frame
+                if spilled is not None:
+                    try:
+                        data = os.pread(spilled.seg.fd, spilled.length, spilled.offset)
+                    except OSError as e:
+                        print(f"[RELAY] cannot read a spilled chunk back: {e}")
+                        data = None
+                    with self._state:
+                        spilled.seg.busy -= 1
+                        fd = self._retire(spilled.seg)
+                    _close_all([fd])
+                    if data is None:
+                        self._broken()
+                        return
+                try:
+                    with self._io:
+                        self.sock.sendall(data)
+                except OSError:
+                    self._broken()
+                    return
+                finally:
+                    if budgeted:
+                        self.budget.release(budgeted)
+        finally:
+            if self.tracker is not None:
+                self.tracker.leave()
+
+    def _broken(self):
+        # the handler's recv() returns b"" now and runs the usual disconnect
+        with self._state:
+            self._closed = True
+            self._writing = False
+            fds = self._discard()
+            self._state.notify_all()
+        _close_all(fds)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _discard(self):
+        """Drop the queue (caller holds _state, _closed is set). Returns segment descriptors to close."""
+        self.budget.release(self._memory)
+        self.budget.unspill(self._spilled)
+        segments = {item.seg for item in self._queue if isinstance(item, _Spilled)}
+        if self._segment is not None:
+            segments.add(self._segment)
+        self._queue.clear()
+        self._urgent.clear()
+        self._urgent_bytes = self._memory = self._other = self._spilled = 0
+        # a segment still being written to is closed when its pwrite returns
+        return [self._retire(seg) for seg in segments]
+
+    def relay_stats(self):
+        """(chunk bytes queued in memory, other queued bytes, bytes spilled to disk)."""
+        with self._state:
+            return self._memory, self._other + self._urgent_bytes, self._spilled
+
+
+def _close_all(fds):
+    for fd in fds:
+        if fd is not None:
+            os.close(fd)
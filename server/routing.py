@@ -0,0 +1,77 @@
+# server/routing.py
+"""
+Room membership index for routing packets to a room or to named users.
+
+connected_clients is a flat list of every connection on the server; scanning
+it for each chat line or file chunk costs O(all connections). RoomIndex keeps
+server_name -> username -> [ClientSession] so a packet costs the size of its
+audience, and a direct message or targeted file reaches only the named users.
+
+Like connected_clients, the index is guarded by clients_lock: every method
+expects the caller to hold it.
+"""
+
+
+def parse_targets(target):
+    """
+    Normalise a packet's "target"/"to" field: None means the whole room,
+    otherwise a set of usernames ("all" or a missing field mean the room; an
+    unusable value means nobody, never everybody).
+    """
+    if target is None or target == "all":
+        return None
+    if isinstance(target, str):
+        return {target}
+    if isinstance(target, (list, tuple)):
+        return {t for t in target if isinstance(t, str) and t}
+    return set()
+
+
+class RoomIndex:
+    def __init__(self):
+        # rooms: server_name -> {username: [ClientSession, ...]} (a user may briefly have two connections)
+        self._rooms = {}
+
+    def add(self, entry):
+        room = self._rooms.setdefault(entry.server_name, {})
+        room.setdefault(entry.username, []).append(entry)
+
+    def remove(self, entry):
+        room = self._rooms.get(entry.server_name)
+        if not room:
+            return
+        username = entry.username
+        conns = [c for c in room.get(username, ()) if c is not entry]
+        if conns:
+            room[username] = conns
+        else:
+            room.pop(username, None)
+        if not room:
+            del self._rooms[entry.server_name]
+
+    def members(self, server_name):
+        """Every connected entry in server_name."""
+        return [c for conns in self._rooms.get(server_name, {}).values() for c in conns]
+
+    def room_sizes(self):
+        """server_name -> number of connected members."""
+        return {name: sum(len(conns) for conns in room.values()) for name, room in self._rooms.items()}
+
+    def lookup(self, server_name, usernames):
+        """Entries for the named users in server_name, plus the names that are not online."""
+        room = self._rooms.get(server_name, {})
+        found = [c for name in usernames for c in room.get(name, ())]
+        missing = sorted(name for name in usernames if name not in room)
+        return found, missing
+
+    def audience(self, server_name, target, exclude=None):
+        """
+        Entries a packet for target (see parse_targets) should reach, without the
+        exclude entry (the sender). Returns (entries, missing usernames).
+        """
+        names = parse_targets(target)
+        if names is None:
+            entries, missing = self.members(server_name), []
+        else:
+            entries, missing = self.lookup(server_name, names)
+        return [c for c in entries if c is not exclude and c.conn is not None], missing
@@ -0,0 +1,232 @@
+# server/search.py
+"""
+Incremental full-text index over room chat and file names.
+
+Every chat message / file offer becomes a document with a per-room doc id
+(0, 1, 2, ... in arrival order). Each lowercased word maps to an array of the
+doc ids containing it; since ids only grow, appending keeps every postings
+list sorted and an update costs one append per distinct word.
+
+A query ANDs its words: it walks the shortest postings list from the newest
+doc backwards and checks the other lists by binary search, stopping once a
+page is full. A page therefore costs about page * words * log(postings),
+independent of how much history the room has. Results come newest first;
+"before" (the doc id of the last result) asks for the next page.
+
+Documents are kept in memory next to the postings, like the rest of the
+server state; a message costs its text plus roughly 4 bytes per word. Each
+room keeps its newest SEARCH_MAX_DOCS documents: once SEARCH_TRIM_SLACK more
+have arrived, the oldest are dropped from the documents and from every
+postings list in one pass, so the trimming cost is spread over many adds.
+Doc ids keep growing across trims ("base" is the id of the oldest one kept).
+
+After a restart handoff the index is rebuilt on a background thread while the
+adopted connections are already served (restore()); searches meanwhile miss
+the older documents, and messages indexed meanwhile are added after them.
+"""
+
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+SEARCH_PAGE = 20        # results per page unless the client asks for fewer
+SEARCH_MAX_PAGE = 100
+MAX_TERM_LEN = 64       # longer "words" (base64, hashes) are not indexed
+MAX_QUERY_TERMS = 8
+SEARCH_MAX_DOCS = 200000        # per room, about 50 MB of chat
+SEARCH_TRIM_SLACK = 20000       # documents over the cap before the oldest are dropped
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Distinct lowercased words of text (URLs split into host/path words)."""
+    return {w for w in _WORD.findall(text.lower()) if len(w) <= MAX_TERM_LEN}
+
+
+class _RoomDocs:
+    __slots__ = ("lock", "base", "postings", "seqs", "times", "senders", "texts", "kinds", "audience")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.base = 0                # doc id of texts[0]; the per-doc arrays are indexed by doc - base
+        self.postings = {}           # term -> array("I") of doc ids, ascending
+        self.seqs = array("Q")       # room seq (0 for file offers, which have none)
+        self.times = array("d")      # unix time
+        self.senders = []            # username (interned)
+        self.texts = []              # message text or filename
+        self.kinds = bytearray()     # 0 chat, 1 file
+        self.audience = {}           # doc id -> frozenset of usernames, for direct messages only
+
+    def trim(self, keep):
+        """Drop all but the newest keep documents. Caller holds lock."""
+        drop = len(self.texts) - keep
+        if drop <= 0:
+            return
+        self.base += drop
+        del self.seqs[:drop], self.times[:drop], self.senders[:drop], self.texts[:drop], self.kinds[:drop]
+        self.audience = {doc: who for doc, who in self.audience.items() if doc >= self.base}
+        for term in list(self.postings):
+            postings = self.postings[term]
+            i = bisect_left(postings, self.base)
+            if i == len(postings):
+                del self.postings[term]
+            elif i:
+                del postings[:i]
+
+
+_KINDS = ("chat", "file")
+
+
+class SearchIndex:
+    def __init__(self, max_docs=None):
+        self.max_docs = SEARCH_MAX_DOCS if max_docs is None else max_docs
+        self._lock = threading.Lock()
+        self._rooms = {}  # server_name -> _RoomDocs
+        self._restoring = False
+        self._backlog = []  # add() arguments held back while a restore runs
+
+    def _room(self, server_name):
+        with self._lock:
+            room = self._rooms.get(server_name)
+            if room is None:
+                room = self._rooms[server_name] = _RoomDocs()
+            return room
+
+    def add(self, server_name, sender, text, kind="chat", seq=0, audience=None, when=None):
+        """Index one chat message (kind "chat") or offered file name (kind "file")."""
+        if not isinstance(text, str) or not text:
+            return
+        with self._lock:
+            if self._restoring:
+                self._backlog.append((server_name, sender, text, kind, seq, audience, when or time.time()))
+                return
+        self._add(server_name, sender, text, kind, seq, audience, when)
+
+    def _add(self, server_name, sender, text, kind, seq, audience, when):
+        room = self._room(server_name)
+        terms = tokenize(text)
+        if kind == "file":
+            terms.add(text.lower())  # the whole name too, e.g. "report.pdf"
+        with room.lock:
+            doc = room.base + len(room.texts)
+            room.seqs.append(seq or 0)
+            room.times.append(when or time.time())
+            room.senders.append(sys.intern(sender or ""))  # one str per sender, not per message
+            room.texts.append(text)
+            room.kinds.append(_KINDS.index(kind))
+            if audience is not None:
+                room.audience[doc] = frozenset(audience)
+            for term in terms:
+                postings = room.postings.get(term)
+                if postings is None:
+                    postings = room.postings[term] = array("I")
+                postings.append(doc)
+            if len(room.texts) > self.max_docs + SEARCH_TRIM_SLACK:
+                room.trim(self.max_docs)
+
+    def search(self, server_name, username, query, before=None, limit=SEARCH_PAGE, sender=None, kind=None):
+        """
+        Newest documents matching every word of query that username may see.
+        Returns (results, next_before); next_before is None on the last page.
+        """
+        with self._lock:
+            room = self._rooms.get(server_name)
+        terms = list(tokenize(query or ""))[:MAX_QUERY_TERMS]
+        if room is None or not terms:
+            return [], None
+        limit = max(1, min(int(limit or SEARCH_PAGE), SEARCH_MAX_PAGE))
+        kind_code = _KINDS.index(kind) if kind in _KINDS else None
+
+        with room.lock:
+            lists = []
+            for term in terms:
+                postings = room.postings.get(term)
+                if postings is None:
+                    return [], None
+                lists.append(postings)
+            lists.sort(key=len)
+            first, others = lists[0], lists[1:]
+            end = len(first) if before is None else bisect_left(first, int(before))
+            base = room.base
+
+            results = []
+            i = end - 1
+            while i >= 0:
+                doc = first[i]
+                i -= 1
+                if not all(_contains(p, doc) for p in others):
+                    continue
+                at = doc - base
+                if kind_code is not None and room.kinds[at] != kind_code:
+                    continue
+                if sender and room.senders[at] != sender:
+                    continue
+                audience = room.audience.get(doc)
+                if audience is not None and username not in audience and room.senders[at] != username:
+                    continue
+                results.append({
+                    "id": doc,
+                    "seq": room.seqs[at],
+                    "from": room.senders[at],
+                    "kind": _KINDS[room.kinds[at]],
+                    "text": room.texts[at],
+                    "time": room.times[at],
+                    "private": audience is not None,
+                })
+                if len(results) == limit:
+                    break
+            more = i >= 0 and len(results) == limit
+            return results, (results[-1]["id"] if more else None)
+
+    def size(self, server_name):
+        with self._lock:
+            room = self._rooms.get(server_name)
+        return len(room.texts) if room else 0
+
+    def sizes(self):
+        """server_name -> number of indexed documents."""
+        with self._lock:
+            rooms = dict(self._rooms)
+        return {name: len(room.texts) for name, room in rooms.items()}
+
+    def snapshot(self):
+        """Documents as plain data for a restart handoff; the postings are rebuilt from them."""
+        with self._lock:
+            rooms = dict(self._rooms)
+        snap = {}
+        for name, room in rooms.items():
+            with room.lock:
+                snap[name] = [
+                    [room.seqs[d], room.times[d], room.senders[d], room.texts[d], _KINDS[room.kinds[d]],
+                     sorted(room.audience[room.base + d]) if room.base + d in room.audience else None]
+                    for d in range(len(room.texts))
+                ]
+        return snap
+
+    def begin_restore(self):
+        """Hold back add() until restore() has indexed the older documents first."""
+        with self._lock:
+            self._restoring = True
+
+    def restore(self, snapshot):
+        """Index the documents of a snapshot, then whatever add() held back meanwhile."""
+        for name, docs in snapshot.items():
+            for seq, when, sender, text, kind, audience in docs:
+                if isinstance(text, str) and text:
+                    self._add(name, sender, text, kind, seq, audience, when)
+        while True:
+            with self._lock:
+                backlog, self._backlog = self._backlog, []
+                if not backlog:
+                    self._restoring = False
+                    return
+            for args in backlog:
+                self._add(*args)
+
+
+def _contains(postings, doc):
+    i = bisect_left(postings, doc)
+    return i < len(postings) and postings[i] == doc
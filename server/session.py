@@ -0,0 +1,209 @@
+# server/session.py
+"""
+Connection sessions, resume tokens and per-room message history.
+
+A ClientSession is the server's record of one connection (see its docstring).
+
+Every chat/system broadcast in a room gets a room-wide sequence number ("seq"
+in the packet data) and is kept in a bounded replay buffer. On auth the
+client receives a resume token plus the room's current seq; after a dropped
+connection it sends "resume" {token, last_seq} and the server replays only
+what it missed instead of the client starting cold.
+"""
+
+import secrets
+import threading
+import time
+from collections import deque
+
+RESUME_TTL = 10 * 60    # seconds a disconnected session can still be resumed
+HISTORY_LIMIT = 1000    # broadcasts kept per room for replay
+
+
+class ClientSession:
+    """
+    One client connection: socket, identity and the bytes buffered for it.
+    __slots__ keeps the object at about 100 bytes with no per-instance dict
+    (the dict it replaces was about 180 bytes before its values). Identity
+    fields are changed under clients_lock; the counters belong to the
+    connection's handler thread.
+    """
+    __slots__ = ("conn", "addr", "username", "server_name", "resume_token",
+                 "connected_at", "buffer", "bytes_in", "transfers")
+
+    def __init__(self, conn, addr, username=None, server_name=None, resume_token=None):
+        self.conn = conn
+        self.addr = addr
+        self.username = username
+        self.server_name = server_name
+        self.resume_token = resume_token
+        self.connected_at = time.time()
+        self.buffer = None     # the handler's LineBuffer (partial frame received so far)
+        self.bytes_in = 0      # bytes received on this connection
+        self.transfers = None  # relayed file_offer filename -> [filesize, bytes relayed], until file_complete
+
+    def __repr__(self):
+        return f"<ClientSession {self.username}@{self.server_name} {self.addr}>"
+
+    def to_dict(self):
+        return {"addr": list(self.addr), "username": self.username, "server_name": self.server_name,
+                "resume_token": self.resume_token}
+
+    def relay_started(self, filename, filesize):
+        if self.transfers is None:
+            self.transfers = {}
+        self.transfers[filename] = [filesize, 0]
+
+    def relayed(self, filename, nbytes):
+        transfer = self.transfers.get(filename) if self.transfers else None
+        if transfer is not None:
+            transfer[1] += nbytes
+
+    def relay_finished(self, filename):
+        if self.transfers:
+            self.transfers.pop(filename, None)
+
+
+class _Log:
+    __slots__ = ("seq", "log")
+
+    def __init__(self, limit, seq=0):
+        self.seq = seq
+        self.log = deque(maxlen=limit)  # (seq, origin_username, ptype, data, audience)
+
+
+class _Resumable:
+    __slots__ = ("server_name", "username", "expires")
+
+    def __init__(self, server_name, username, expires=None):
+        self.server_name = server_name
+        self.username = username
+        self.expires = expires  # None while connected, else time.monotonic() deadline
+
+
+class RoomHistory:
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        # rooms: server_name -> _Log; a log entry's audience is None for room broadcasts,
+        # else the set of usernames a direct message went to
+        self._rooms = {}
+
+    def _room(self, server_name):
+        room = self._rooms.get(server_name)
+        if room is None:
+            room = self._rooms[server_name] = _Log(self.limit)
+        return room
+
+    def record(self, server_name, origin, ptype, data, audience=None):
+        """Assign the next seq to a broadcast (or DM), remember it and return the stamped data."""
+        with self._lock:
+            room = self._room(server_name)
+            room.seq += 1
+            stamped = dict(data, seq=room.seq)
+            room.log.append((room.seq, origin, ptype, stamped, audience))
+            return stamped
+
+    def snapshot(self):
+        """seq counters and replay buffers as plain data for a restart handoff."""
+        with self._lock:
+            return {
+                name: {"seq": room.seq, "log": [
+                    [seq, origin, ptype, data, sorted(audience) if audience is not None else None]
+                    for seq, origin, ptype, data, audience in room.log
+                ]}
+                for name, room in self._rooms.items()
+            }
+
+    def restore(self, snapshot):
+        with self._lock:
+            for name, room in snapshot.items():
+                log = self._rooms[name] = _Log(self.limit, room["seq"])
+                for seq, origin, ptype, data, audience in room["log"]:
+                    log.log.append((seq, origin, ptype, data, set(audience) if audience is not None else None))
+
+    def last_seq(self, server_name):
+        with self._lock:
+            return self._room(server_name).seq
+
+    def sizes(self):
+        """server_name -> number of entries kept for replay."""
+        with self._lock:
+            return {name: len(room.log) for name, room in self._rooms.items()}
+
+    def since(self, server_name, last_seq):
+        """
+        Return (entries, complete) for everything after last_seq.
+        complete is False when older entries were already evicted from the buffer.
+        """
+        with self._lock:
+            log = self._room(server_name).log
+            entries = [e for e in log if e[0] > last_seq]
+            complete = not log or log[0][0] <= last_seq + 1
+            return entries, complete
+
+
+class SessionRegistry:
+    def __init__(self, ttl=RESUME_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # sessions: token -> _Resumable
+        self._sessions = {}
+
+    def issue(self, server_name, username):
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._prune()
+            self._sessions[token] = _Resumable(server_name, username)
+        return token
+
+    def resume(self, token):
+        """Reattach a session. Returns (server_name, username) or None if unknown/expired."""
+        with self._lock:
+            self._prune()
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            session.expires = None
+            return session.server_name, session.username
+
+    def detach(self, token):
+        """Connection dropped: keep the session resumable for ttl seconds."""
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                session.expires = time.monotonic() + self.ttl
+
+    def snapshot(self, attached):
+        """
+        Sessions for a restart handoff, with expiry as seconds left. Connected
+        sessions whose token is not in attached (their connection is not being
+        handed over) become resumable for the full ttl.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune()
+            snap = {}
+            for token, s in self._sessions.items():
+                if s.expires is not None:
+                    left = s.expires - now
+                else:
+                    left = None if token in attached else self.ttl
+                snap[token] = {"server_name": s.server_name, "username": s.username, "expires_in": left}
+            return snap
+
+    def restore(self, snapshot):
+        now = time.monotonic()
+        with self._lock:
+            for token, s in snapshot.items():
+                expires = None if s["expires_in"] is None else now + s["expires_in"]
+                self._sessions[token] = _Resumable(s["server_name"], s["username"], expires)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _prune(self):
+        now = time.monotonic()
+        for token in [t for t, s in self._sessions.items() if s.expires is not None and s.expires < now]:
+            del self._sessions[token]
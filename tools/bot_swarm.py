@@ -0,0 +1,119 @@
+# tools/bot_swarm.py
+"""
+Run many AsyncClient bot sessions on one event loop against an in-process server.
+
+Every bot joins one room and says hello; the tool checks that each bot saw
+every other bot's message, then the host streams a file to the room and a few
+bots save it and compare checksums.
+
+    python tools/bot_swarm.py --bots 300 --file-mb 4 --file-receivers 3
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import main as server_main
+from client.async_client import AsyncClient
+
+
+async def _bot(port, name, kind, accept_files=False):
+    bot = AsyncClient("127.0.0.1", port, username=name, accept_files=accept_files)
+    await bot.connect()
+    ok, msg = await (bot.host if kind == "host" else bot.join)("swarm", "pw", timeout=30)
+    if not ok:
+        raise RuntimeError(f"{name}: {msg}")
+    return bot
+
+
+async def _collect_chat(bot, expected, timeout):
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while len(seen) < expected:
+        event = await bot.next_event(timeout=max(0.01, deadline - time.monotonic()))
+        if event is None:
+            break
+        if event["type"] == "chat":
+            seen.add(event["data"].get("from", "").replace(" (HOST)", ""))
+    return seen
+
+
+async def _receive_file(bot, work, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        event = await bot.next_event(timeout=max(0.01, deadline - time.monotonic()))
+        if event is None:
+            return None
+        if event["type"] == "file_offer":
+            dst = os.path.join(work, bot.username)
+            os.makedirs(dst, exist_ok=True)
+            return await event["file"].save(dst)
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            h.update(block)
+    return h.hexdigest()
+
+
+async def run(args):
+    start = time.monotonic()
+    host = await _bot(args.port, "host", "host")
+    bots = await asyncio.gather(*(_bot(args.port, f"bot{i}", "join", i < args.file_receivers)
+                                  for i in range(args.bots)))
+    print(f"{len(bots) + 1} sessions joined in {time.monotonic() - start:.2f}s")
+
+    start = time.monotonic()
+    everyone = [host] + list(bots)
+    collectors = [asyncio.create_task(_collect_chat(b, len(everyone) - 1, args.timeout)) for b in everyone]
+    await asyncio.gather(*(b.send(f"hello from {b.username}") for b in everyone))
+    seen = await asyncio.gather(*collectors)
+    short = [b.username for b, s in zip(everyone, seen) if len(s) < len(everyone) - 1]
+    print(f"{len(everyone)} x {len(everyone) - 1} chat deliveries in {time.monotonic() - start:.2f}s, "
+          f"{len(short)} sessions missing messages")
+
+    failed = len(short)
+    if args.file_receivers:
+        work = tempfile.mkdtemp(prefix="hiena-swarm-")
+        src = os.path.join(work, "payload.bin")
+        with open(src, "wb") as f:
+            f.write(os.urandom(args.file_mb * 1024 * 1024))
+        want = _digest(src)
+
+        start = time.monotonic()
+        receivers = [asyncio.create_task(_receive_file(b, work, args.timeout)) for b in bots[:args.file_receivers]]
+        await host.send_file(src)
+        paths = await asyncio.gather(*receivers)
+        good = sum(1 for p in paths if p and _digest(p) == want)
+        print(f"file {args.file_mb} MB to {len(paths)} receivers in {time.monotonic() - start:.2f}s, {good} intact")
+        failed += len(paths) - good
+
+    await asyncio.gather(*(b.close() for b in everyone))
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AsyncClient bot swarm check")
+    parser.add_argument("--port", type=int, default=5598)
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--file-mb", type=int, default=4)
+    parser.add_argument("--file-receivers", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    threading.Thread(target=server_main.start_server, kwargs={"host": "127.0.0.1", "port": args.port}, daemon=True).start()
+    time.sleep(0.3)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# tools/delta_bench.py
+"""
+Bytes saved by delta transfers (client/delta.py) on typical edit patterns.
+
+A synthetic file plays the receiver's prior version; each pattern edits a
+copy the way re-shared datasets, builds and decks change. For every pattern
+the delta is computed, its frames are built exactly as send_file_delta sends
+them and fed through a real FileReceiver with the prior version as basis,
+and the rebuilt file is checked against the new version.
+
+Wire bytes are frame bytes as relayed by the server: the receiver's
+signatures on the way up plus the delta frames on the way down, against the
+file_chunk frames of a whole-file relay.
+
+    python tools/delta_bench.py --size-mb 64
+    python tools/delta_bench.py --size-mb 16 --content text --json
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils import create_message, create_blob_message, parse_message
+from client.delta import Signatures, delta_ops, file_sha256
+from client.file_transfer import FileReceiver, CHUNK_SIZE, MAX_CHUNK_SIZE
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def _content(size, kind, rng):
+    if kind == "random":
+        return rng.randbytes(size)
+    words = [b"sample", b"value", b"delta", b"row", b"slide", b"build", b"release", b"metric", b"note"]
+    out = bytearray()
+    while len(out) < size:
+        out += b"%d,%s,%s,%.4f\n" % (len(out), rng.choice(words), rng.choice(words), rng.random())
+    return bytes(out[:size])
+
+
+def _patterns(base, kind, rng):
+    """name -> edited copy of base."""
+    size = len(base)
+    fresh = lambda n: _content(n, kind, rng)
+    scattered = bytearray(base)
+    for _ in range(10):
+        at = rng.randrange(size - 100)
+        scattered[at:at + 100] = fresh(100)
+    rewritten = bytearray(base)
+    for _ in range(max(1, size // (10 * 64 * KB))):
+        at = rng.randrange(size - 64 * KB)
+        rewritten[at:at + 64 * KB] = fresh(64 * KB)
+    mid, section = size // 2, min(MB, size // 8)
+    moved = base[:mid] + base[mid + section:]
+    moved = moved[:size // 8] + base[mid:mid + section] + moved[size // 8:]
+    return {
+        "identical": base,
+        "append 1%": base + fresh(size // 100),
+        "10 small edits": bytes(scattered),
+        "insert at start": fresh(KB) + base,
+        "delete 256 KB": base[:mid] + base[mid + 256 * KB:],
+        "move 1 MB": moved,
+        "truncate 10%": base[:size - size // 10],
+        "rewrite 10%": bytes(rewritten),
+        "unrelated": fresh(size),
+    }
+
+
+def _whole_file_bytes(path, filename, filesize):
+    """file_chunk frames of a relayed whole file (the relay grows chunks up to MAX_CHUNK_SIZE on fast links)."""
+    total = 0
+    with open(path, "rb") as f:
+        while data := f.read(MAX_CHUNK_SIZE):
+            packet = {"filename": filename, "filesize": filesize, "target": "all"}
+            total += len(create_blob_message("file_chunk", packet, "chunk", base64.b64encode(data).decode("ascii"))) + 1
+    return total
+
+
+def _run_pattern(work, basis, name, new_data):
+    new = os.path.join(work, "new.bin")
+    with open(new, "wb") as f:
+        f.write(new_data)
+    filename = "deck.bin"
+    filesize = len(new_data)
+
+    start = time.perf_counter()
+    sigs = Signatures.of_file(basis)
+    sig_ms = (time.perf_counter() - start) * 1000
+    sig_bytes = len(create_message("delta_signatures", dict(sigs.to_dict(), transfer_id="0" * 16, **{"from": "s"}))) + 1
+
+    # build the frames send_file_delta would send, then replay them into a receiver
+    start = time.perf_counter()
+    frames = []
+    literal = copied = 0
+    for op in delta_ops(new, sigs):
+        packet = {"filename": filename, "filesize": filesize, "target": "all", "offset": op[1]}
+        if op[0] == "copy":
+            packet["copy"] = [op[2], op[3]]
+            frames.append(create_message("file_chunk", packet))
+            copied += op[3]
+        else:
+            frames.append(create_blob_message("file_chunk", packet, "chunk", base64.b64encode(op[2]).decode("ascii")))
+            literal += len(op[2])
+    delta_ms = (time.perf_counter() - start) * 1000
+    delta_bytes = sum(len(f) + 1 for f in frames)
+
+    out_dir = os.path.join(work, "rebuilt")
+    receiver = FileReceiver(out_dir)
+    offer = {"from": "s", "filename": filename, "filesize": filesize, "delta": True}
+    start = time.perf_counter()
+    receiver.handle_offer(offer, basis=basis)
+    for frame in frames:
+        receiver.receive_chunk(dict(parse_message(frame)["data"], **{"from": "s"}))
+    saved = {}
+    receiver.finalize_file(offer, on_saved=lambda path: saved.setdefault("path", path))
+    receiver.writer.flush()
+    rebuild_ms = (time.perf_counter() - start) * 1000
+    ok = "path" in saved and file_sha256(saved["path"]) == hashlib.sha256(new_data).hexdigest()
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    whole = _whole_file_bytes(new, filename, filesize)
+    wire = sig_bytes + delta_bytes
+    return {
+        "pattern": name, "size": filesize, "block": sigs.block, "literal": literal, "copied": copied,
+        "signature_bytes": sig_bytes, "delta_bytes": delta_bytes, "wire_bytes": wire, "whole_bytes": whole,
+        "saved_pct": round(100 * (1 - wire / whole), 2) if whole else 0.0,
+        "signature_ms": round(sig_ms, 1), "delta_ms": round(delta_ms, 1), "rebuild_ms": round(rebuild_ms, 1),
+        "ok": ok,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta transfer savings on typical edit patterns")
+    parser.add_argument("--size-mb", type=float, default=32)
+    parser.add_argument("--content", choices=("random", "text"), default="random",
+                        help="random bytes (builds, media) or CSV-like text (datasets)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base = _content(int(args.size_mb * MB), args.content, rng)
+    work = tempfile.mkdtemp(prefix="hiena-delta-")
+    basis = os.path.join(work, "basis.bin")
+    with open(basis, "wb") as f:
+        f.write(base)
+
+    results = []
+    try:
+        for name, data in _patterns(base, args.content, rng).items():
+            results.append(_run_pattern(work, basis, name, data))
+            if not args.json:
+                r = results[-1]
+                print(f"{r['pattern']:16} {r['size'] / MB:7.1f} MB  new {r['literal'] / KB:9.0f} KB  "
+                      f"wire {r['wire_bytes'] / KB:9.0f} KB vs {r['whole_bytes'] / KB:9.0f} KB  "
+                      f"saved {r['saved_pct']:6.2f}%  delta {r['delta_ms']:7.0f} ms  "
+                      f"rebuild {r['rebuild_ms']:6.0f} ms  {'OK' if r['ok'] else 'MISMATCH'}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        block = results[0]["block"] if results else 0
+        sig = results[0]["signature_bytes"] if results else 0
+        print(f"block {block // KB} KB, signatures {sig / KB:.0f} KB per answer, whole-file frames sent in "
+              f"{MAX_CHUNK_SIZE // KB} KB chunks (first relay chunk {CHUNK_SIZE // KB} KB)")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
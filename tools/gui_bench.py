@@ -0,0 +1,449 @@
+# tools/gui_bench.py
+"""
+Offscreen GUI benchmark: the chat view, the user list and file progress with
+large rooms, on Qt's "offscreen" platform (no display needed).
+
+Scenarios (each on a fresh app_state and a fresh MainWindow):
+
+    messages_N   N messages in app_state (every 50th a file offer):
+                 store_bytes_per_msg  Python heap of app_state per message (tracemalloc)
+                 view_bytes_per_row   Python heap of the window (model, delegate caches) per shown row
+                 first_paint_ms       MainWindow() until the chat view's first paint
+                 refresh_one_ms       one new message -> refresh_messages() -> painted (best of --repeat)
+                 refresh_batch_ms     500 new messages at once -> painted (best of --repeat)
+                 scroll_top_ms        jump to the top (pages older messages in) -> painted (best of --repeat)
+    presence_U   U online users:
+                 clients_reset_ms     Sidebar.refresh_clients() -> painted (best of --repeat)
+                 presence_delta_ms    5 joins + 5 leaves via apply_presence() -> painted (best of --repeat)
+    transfers_T  T file bubbles whose progress all moves by 1%:
+                 progress_frame_ms    T set_progress() calls -> painted (best of --repeat)
+    busy         10k messages, U users, T transfers, and for a few seconds a
+                 network thread adding 1000 messages/s, presence deltas and
+                 progress updates through the real GuiBridge path:
+                 loop_lag_p50/p99/max_ms  how late a 5 ms QTimer fires
+                 deliver_ms           last message added -> shown in the view
+
+Every metric is "lower is better", and the best of --runs full passes is
+kept, which evens out a busy machine. --save-baseline stores the results,
+--compare checks a run against stored results and exits 1 when a metric got
+worse by more than --tolerance (plus a small absolute slack, so sub-millisecond
+noise does not count; loop_lag_p50/max_ms are only reported). Baselines depend on the machine: compare runs on the
+same box (the stored "machine" block says where a baseline came from).
+
+    python tools/gui_bench.py                          # print the results
+    python tools/gui_bench.py --save-baseline          # store them in tools/gui_bench_baseline.json
+    python tools/gui_bench.py --compare                # CI: fail on regressions
+    python tools/gui_bench.py --messages 1000 --quick  # small smoke run
+"""
+
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QEvent, QTimer, QEventLoop, PYQT_VERSION_STR, QT_VERSION_STR
+
+from client.state import app_state
+from client.message_store import MessageStore
+from gui.main import MainWindow, gui_bridge, GUI_FRAME_INTERVAL_MS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui_bench_baseline.json")
+MESSAGE_COUNTS = (1000, 10000, 100000)
+USERS = 1000
+TRANSFERS = 50
+BUSY_SECONDS = 3.0
+BUSY_RATE = 1000          # messages/s added by the busy scenario's network thread
+LOOP_TICK_MS = 5
+PAINT_TIMEOUT = 5.0       # seconds to wait for a repaint before giving up
+REGRESSION_TOLERANCE = 0.5   # timings on a shared box vary by a third between runs
+# absolute slack per unit, so tiny values do not trip the relative tolerance
+_SLACK = {"_ms": 2.0, "_msg": 32, "_row": 64}
+INFORMATIONAL = {"loop_lag_p50_ms", "loop_lag_max_ms"}   # reported, too noisy to fail a comparison
+
+_rng = random.Random(1)
+_WORDS = "the build deploy failed passed review lunch meeting report please thanks today release".split()
+
+
+class PaintCounter(QObject):
+    """Counts paint events of a widget (a view's viewport)."""
+
+    def __init__(self, widget):
+        super().__init__(widget)
+        self.count = 0
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            self.count += 1
+        return False
+
+    def wait(self, app, since):
+        """Process events until a paint after the since-th one; returns the time it took."""
+        start = time.perf_counter()
+        while self.count <= since and time.perf_counter() - start < PAINT_TIMEOUT:
+            app.processEvents(QEventLoop.AllEvents, 10)
+        return time.perf_counter() - start
+
+
+def _text():
+    return " ".join(_rng.choices(_WORDS, k=_rng.randint(3, 40)))
+
+
+def _fill(count, files_every=50):
+    for i in range(count):
+        user = "me" if i % 5 == 0 else f"user{i % 37}"
+        if i % files_every == 0:
+            app_state.add_message(user, {"type": "file", "filename": f"file-{i}.bin", "filesize": 1024 * i})
+        else:
+            app_state.add_message(user, _text())
+
+
+def _reset_state():
+    gc.collect()
+    app_state.messages.close()
+    app_state.messages = MessageStore()
+    app_state.system_logs.clear()
+    app_state.set_clients([], version=None)
+    app_state.set_username("me")
+
+
+def _settle(app):
+    """Let the GuiBridge deliver what app_state changes are still pending."""
+    end = time.perf_counter() + 2 * GUI_FRAME_INTERVAL_MS / 1000
+    while time.perf_counter() < end:
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+def _open_window(app):
+    window = MainWindow(None)
+    painted = PaintCounter(window.chat_frame.view.viewport())
+    window.show()
+    painted.wait(app, 0)
+    return window, painted
+
+
+def _close_window(app, window):
+    # the bridge outlives the window: drop its connections before the widgets go
+    for signal in (gui_bridge.messages_appended, gui_bridge.logs_appended,
+                   gui_bridge.clients_reset, gui_bridge.presence_changed):
+        try:
+            signal.disconnect()
+        except TypeError:
+            pass
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def _best_ms(samples):
+    # the fastest sample is the cost of the work itself; slower ones add scheduler noise
+    return round(min(samples) * 1000, 3)
+
+
+def bench_messages(app, count, repeat):
+    _reset_state()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    _fill(count)
+    _settle(app)
+    gc.collect()
+    store_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    window, _painted = _open_window(app)
+    gc.collect()
+    view_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    rows = window.chat_frame.model.rowCount()
+
+    first_paint = []
+    for _ in range(max(3, repeat // 3)):
+        _close_window(app, window)
+        start = time.perf_counter()
+        window, painted = _open_window(app)
+        first_paint.append(time.perf_counter() - start)
+    chat = window.chat_frame
+
+    one = []
+    for _ in range(repeat * 3):
+        since = painted.count
+        start = time.perf_counter()
+        app_state.add_message("user1", _text())
+        chat.refresh_messages()
+        painted.wait(app, since)
+        one.append(time.perf_counter() - start)
+
+    batch = []
+    for _ in range(repeat):
+        since = painted.count
+        start = time.perf_counter()
+        _fill(500)
+        chat.refresh_messages()
+        painted.wait(app, since)
+        batch.append(time.perf_counter() - start)
+
+    top = []
+    scrollbar = chat.view.verticalScrollBar()
+    for _ in range(repeat):
+        since = painted.count
+        start = time.perf_counter()
+        scrollbar.setValue(scrollbar.minimum())
+        painted.wait(app, since)
+        top.append(time.perf_counter() - start)
+        scrollbar.setValue(scrollbar.maximum())
+        painted.wait(app, painted.count)
+
+    _close_window(app, window)
+    return {
+        "store_bytes_per_msg": round(store_bytes / count, 1),
+        "view_bytes_per_row": round(view_bytes / max(rows, 1), 1),
+        "first_paint_ms": _best_ms(first_paint),
+        "refresh_one_ms": _best_ms(one),
+        "refresh_batch_ms": _best_ms(batch),
+        "scroll_top_ms": _best_ms(top),
+    }
+
+
+def bench_presence(app, users, repeat):
+    _reset_state()
+    names = [f"user{i:05d}" for i in range(users)]
+    app_state.set_clients(names, version=0)
+    window, _painted = _open_window(app)
+    sidebar = window.sidebar
+    painted = PaintCounter(sidebar.clients_list.viewport())
+
+    reset = []
+    for _ in range(repeat):
+        since = painted.count
+        start = time.perf_counter()
+        sidebar.refresh_clients()
+        painted.wait(app, since)
+        reset.append(time.perf_counter() - start)
+
+    delta = []
+    version = 0
+    for i in range(repeat * 2):
+        joined = [f"new{i}-{k}" for k in range(5)]
+        left = [names[(i * 5 + k) % users] for k in range(5)]
+        app_state.apply_presence(version + 1, version, joined, left)
+        version += 1
+        since = painted.count
+        start = time.perf_counter()
+        sidebar.apply_presence(joined, left)
+        painted.wait(app, since)
+        delta.append(time.perf_counter() - start)
+
+    _close_window(app, window)
+    return {"clients_reset_ms": _best_ms(reset), "presence_delta_ms": _best_ms(delta)}
+
+
+def bench_transfers(app, transfers, repeat):
+    _reset_state()
+    _fill(200)
+    files = [f"transfer-{i}.bin" for i in range(transfers)]
+    for name in files:
+        app_state.add_message("user1", {"type": "file", "filename": name, "filesize": 512 * 1024 * 1024})
+    window, painted = _open_window(app)
+    model = window.chat_frame.model
+
+    frames = []
+    for pct in range(min(100, repeat * 10)):
+        since = painted.count
+        start = time.perf_counter()
+        for name in files:
+            model.set_progress(name, pct)
+        painted.wait(app, since)
+        frames.append(time.perf_counter() - start)
+
+    _close_window(app, window)
+    return {"progress_frame_ms": _best_ms(frames)}
+
+
+def bench_busy(app, users, transfers, seconds):
+    _reset_state()
+    _fill(10000)
+    names = [f"user{i:05d}" for i in range(users)]
+    app_state.set_clients(names, version=0)
+    files = [f"transfer-{i}.bin" for i in range(transfers)]
+    for name in files:
+        app_state.add_message("user1", {"type": "file", "filename": name, "filesize": 512 * 1024 * 1024})
+    app.processEvents()
+    window, painted = _open_window(app)
+    chat = window.chat_frame
+
+    stop = threading.Event()
+    last_added = [None, 0.0]   # message id, time
+
+    def network():
+        # what the listener thread does while a busy room streams in
+        version, tick = 0, 0
+        while not stop.is_set():
+            for _ in range(BUSY_RATE // 100):
+                app_state.add_message(f"user{tick % 37}", _text())
+            last_added[:] = [len(app_state.messages) - 1, time.perf_counter()]
+            if tick % 10 == 0:
+                joined, left = [f"new{tick}"], [names[tick % users]]
+                if app_state.apply_presence(version + 1, version, joined, left):
+                    version += 1
+            if tick % 5 == 0:
+                for i, name in enumerate(files):
+                    chat.receive_progress.emit(name, (tick // 5 + i) % 100)
+            tick += 1
+            time.sleep(0.01)
+
+    lags = []
+    expected = [time.perf_counter() + LOOP_TICK_MS / 1000]
+
+    def on_tick():
+        now = time.perf_counter()
+        lags.append(max(0.0, now - expected[0]))
+        expected[0] = now + LOOP_TICK_MS / 1000
+
+    timer = QTimer()
+    timer.setInterval(LOOP_TICK_MS)
+    timer.timeout.connect(on_tick)
+    feeder = threading.Thread(target=network, daemon=True)
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    expected[0] = time.perf_counter() + LOOP_TICK_MS / 1000
+    timer.start()
+    feeder.start()
+    loop.exec_()
+    stop.set()
+    feeder.join()
+    timer.stop()
+
+    # the last message must reach the view (bridge frame + refresh + paint)
+    target, added = last_added
+    while chat.model.rowCount() and chat.model.first_id + chat.model.rowCount() <= target \
+            and time.perf_counter() - added < PAINT_TIMEOUT:
+        app.processEvents(QEventLoop.AllEvents, 10)
+    painted.wait(app, painted.count)
+    deliver = time.perf_counter() - added
+
+    _close_window(app, window)
+    lags.sort()
+    return {
+        "loop_lag_p50_ms": round(lags[len(lags) // 2] * 1000, 3),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 3),
+        "loop_lag_max_ms": round(lags[-1] * 1000, 3),
+        "deliver_ms": round(deliver * 1000, 3),
+    }
+
+
+def run(app, args):
+    # one throw-away window, so Qt's one-time setup (fonts, styles) is not charged to the first scenario
+    _reset_state()
+    _close_window(app, _open_window(app)[0])
+    # like timeit: no cyclic GC pauses inside the measurements (collected between scenarios)
+    gc.disable()
+    results = {}
+    for count in args.messages:
+        results[f"messages_{count}"] = bench_messages(app, count, args.repeat)
+        print(f"[BENCH] messages_{count}: {results[f'messages_{count}']}")
+    results[f"presence_{args.users}"] = bench_presence(app, args.users, args.repeat)
+    print(f"[BENCH] presence_{args.users}: {results[f'presence_{args.users}']}")
+    results[f"transfers_{args.transfers}"] = bench_transfers(app, args.transfers, args.repeat)
+    print(f"[BENCH] transfers_{args.transfers}: {results[f'transfers_{args.transfers}']}")
+    if args.busy_seconds > 0:
+        results["busy"] = bench_busy(app, args.users, args.transfers, args.busy_seconds)
+        print(f"[BENCH] busy: {results['busy']}")
+    app_state.messages.close()
+    gc.enable()
+    return results
+
+
+def machine():
+    return {"platform": platform.platform(), "python": platform.python_version(), "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR, "cpus": os.cpu_count(), "qpa": os.environ.get("QT_QPA_PLATFORM")}
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every metric against the baseline, and the number of regressions."""
+    lines, regressions = [], 0
+    for scenario, metrics in results.items():
+        for name, value in metrics.items():
+            base = baseline.get(scenario, {}).get(name)
+            if base is None:
+                lines.append(f"  {scenario}.{name:22} {value:>12}   (no baseline)")
+                continue
+            slack = next((s for suffix, s in _SLACK.items() if name.endswith(suffix)), 0)
+            worse = name not in INFORMATIONAL and value > base * (1 + tolerance) + slack
+            regressions += worse
+            change = (value - base) / base * 100 if base else 0.0
+            lines.append(f"  {scenario}.{name:22} {value:>12} vs {base:>12} ({change:+6.1f}%)"
+                         f"{'  REGRESSION' if worse else ''}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offscreen GUI benchmark")
+    parser.add_argument("--messages", default=",".join(map(str, MESSAGE_COUNTS)),
+                        help="comma-separated message counts (default %(default)s)")
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--transfers", type=int, default=TRANSFERS)
+    parser.add_argument("--runs", type=int, default=3, help="run the whole suite this often, keep each metric's best")
+    parser.add_argument("--repeat", type=int, default=10, help="samples per timing (the best one counts)")
+    parser.add_argument("--busy-seconds", type=float, default=BUSY_SECONDS, help="0 skips the busy scenario")
+    parser.add_argument("--quick", action="store_true", help="fewer samples and a short busy run")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, default=None, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, default=None, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="allowed relative slowdown before --compare fails (default %(default)s)")
+    parser.add_argument("--json", default=None, metavar="PATH", help="also write the results to PATH")
+    args = parser.parse_args()
+    args.messages = [int(n) for n in args.messages.split(",") if n]
+    if args.quick:
+        args.runs = 1
+        args.repeat = 3
+        args.busy_seconds = min(args.busy_seconds, 1.0)
+
+    app = QApplication(["gui_bench"])
+    results = {}
+    for i in range(args.runs):
+        if args.runs > 1:
+            print(f"[BENCH] run {i + 1}/{args.runs}")
+        for scenario, metrics in run(app, args).items():
+            best = results.setdefault(scenario, {})
+            for name, value in metrics.items():
+                best[name] = min(best.get(name, value), value)
+    report = {"machine": machine(), "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print(f"[BENCH] note: baseline was recorded on {baseline.get('machine')}")
+        lines, regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        print("\n".join(lines))
+        print(f"[BENCH] {regressions} regression(s) beyond {args.tolerance:.0%}")
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"[BENCH] baseline written to {args.save_baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# tools/multicast_loopback.py
+"""
+Loopback check for multicast file distribution.
+
+Starts a server and several clients in one process on 127.0.0.1, has the host
+multicast a random file over the loopback device and verifies every receiver
+ends up with an identical copy. Some receivers can be made to misbehave:
+
+    --lossy N     the first N receivers drop --loss of the datagrams, so
+                  their copies are completed by NACK repairs over the server
+    --deaf N      the next N receivers listen on the wrong group and hear
+                  nothing, so they must fall back to the normal relay
+    --blocked N   the next N receivers cannot join at all (immediate fallback)
+    --silent N    the next N receivers never answer the offer, so the sender
+                  relays them the whole file once MCAST_READY_WAIT is over
+
+    python tools/multicast_loopback.py --receivers 6 --size-mb 50 --lossy 2 --deaf 1 --blocked 1 --silent 1
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import main as server_main
+from client.main import Client, sha256_hex
+from client.file_transfer import FileReceiver
+from client.multicast import MulticastReceiver, MCAST_RATE
+
+
+class LoopbackClient(Client):
+    """Client that remembers which files its writer thread has finished saving."""
+    loss = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saved = []
+
+    def _on_file_saved(self, sender, saved_path):
+        super()._on_file_saved(sender, saved_path)
+        self.saved.append(saved_path)
+
+    def _open_multicast(self, pdata, on_data):
+        return MulticastReceiver(pdata, self._local_address(), on_data, drop=self.loss)
+
+
+class DeafClient(LoopbackClient):
+    """Joins a group nobody sends to (multicast not routed to it)."""
+    def _open_multicast(self, pdata, on_data):
+        return super()._open_multicast(dict(pdata, group="239.255.255.254"), on_data)
+
+
+class BlockedClient(LoopbackClient):
+    """Cannot join the group at all."""
+    def _open_multicast(self, pdata, on_data):
+        raise OSError("multicast blocked")
+
+
+class SilentClient(LoopbackClient):
+    """Ignores multicast offers (like a client that predates multicast)."""
+    def _receive_multicast(self, pdata):
+        pass
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _join(cls, port, kind, username, save_dir):
+    c = cls("127.0.0.1", port)
+    c.username = username
+    c.file_receiver = FileReceiver(save_dir)
+    c.connect()
+    c.authenticate(kind, {"server_name": "loopback", "password_hash": sha256_hex("pw"), "username": username})
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multicast transfer loopback check")
+    parser.add_argument("--port", type=int, default=5596)
+    parser.add_argument("--receivers", type=int, default=4)
+    parser.add_argument("--lossy", type=int, default=1)
+    parser.add_argument("--loss", type=float, default=0.05, help="fraction of datagrams the lossy receivers drop")
+    parser.add_argument("--deaf", type=int, default=0)
+    parser.add_argument("--blocked", type=int, default=0)
+    parser.add_argument("--silent", type=int, default=0)
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=MCAST_RATE / 1048576, help="multicast rate in MB/s")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    threading.Thread(target=server_main.start_server, kwargs={"host": "127.0.0.1", "port": args.port}, daemon=True).start()
+    time.sleep(0.3)
+
+    work = tempfile.mkdtemp(prefix="hiena-mcast-")
+    src = os.path.join(work, "payload.bin")
+    with open(src, "wb") as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+    want = _digest(src)
+
+    host = _join(LoopbackClient, args.port, "host", "sender", os.path.join(work, "sender"))
+    host.multicast_enabled = True
+    host.multicast_rate = int(args.rate * 1048576)
+    time.sleep(0.3)
+    receivers = []
+    kinds = ["lossy"] * args.lossy + ["deaf"] * args.deaf + ["blocked"] * args.blocked + ["silent"] * args.silent
+    for i in range(args.receivers):
+        kind = kinds[i] if i < len(kinds) else "clean"
+        cls = {"deaf": DeafClient, "blocked": BlockedClient, "silent": SilentClient}.get(kind, LoopbackClient)
+        c = _join(cls, args.port, "join", f"r{i}-{kind}", os.path.join(work, f"r{i}"))
+        if kind == "lossy":
+            c.loss = args.loss
+        receivers.append(c)
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    if not host.offer_multicast(src):
+        print("multicast offer failed")
+        return 1
+
+    pending = {c.username: os.path.join(c.file_receiver.save_dir, "payload.bin") for c in receivers}
+    while pending and time.monotonic() - start < args.timeout:
+        for name, path in list(pending.items()):
+            owner = next(c for c in receivers if c.username == name)
+            if path in owner.saved:
+                print(f"{name}: {'OK' if _digest(path) == want else 'CORRUPT'} after {time.monotonic() - start:.2f}s")
+                del pending[name]
+        time.sleep(0.05)
+
+    for c in [host] + receivers:
+        c.close()
+    if pending:
+        print("missing:", ", ".join(sorted(pending)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
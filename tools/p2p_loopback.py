@@ -0,0 +1,124 @@
+# tools/p2p_loopback.py
+"""
+Loopback check for brokered direct file transfer.
+
+Starts a server and several clients in one process on 127.0.0.1, has the host
+offer a random file directly and verifies every receiver ends up with an
+identical copy. Receivers listed with --unreachable get a bogus endpoint, so
+they must fall back to the server relay. Receivers listed with --silent
+ignore the offer, so the sender relays to them once --claim-wait is over.
+
+    python tools/p2p_loopback.py --receivers 5 --size-mb 20 --unreachable 2 --silent 1
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import main as server_main
+from client import p2p
+from client.main import Client, sha256_hex
+from client.file_transfer import FileReceiver
+
+
+class LoopbackClient(Client):
+    """Client that remembers which files its writer thread has finished saving."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saved = []
+
+    def _on_file_saved(self, sender, saved_path):
+        super()._on_file_saved(sender, saved_path)
+        self.saved.append(saved_path)
+
+
+class UnreachableClient(LoopbackClient):
+    """Receiver that can never reach the sender directly (forces the relay fallback)."""
+    def _fetch_direct(self, pdata):
+        super()._fetch_direct(dict(pdata, port=1))
+
+
+class SilentClient(LoopbackClient):
+    """Ignores direct offers (like a client that predates direct transfer)."""
+    def _fetch_direct(self, pdata):
+        pass
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _join(cls, port, kind, username, save_dir):
+    c = cls("127.0.0.1", port)
+    c.username = username
+    c.file_receiver = FileReceiver(save_dir)
+    c.connect()
+    c.authenticate(kind, {"server_name": "loopback", "password_hash": sha256_hex("pw"), "username": username})
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Direct transfer loopback check")
+    parser.add_argument("--port", type=int, default=5599)
+    parser.add_argument("--receivers", type=int, default=4)
+    parser.add_argument("--unreachable", type=int, default=1)
+    parser.add_argument("--silent", type=int, default=0)
+    parser.add_argument("--claim-wait", type=float, default=3.0, help="seconds before silent receivers get the relay")
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    p2p.P2P_CLAIM_WAIT = args.claim_wait
+
+    threading.Thread(target=server_main.start_server, kwargs={"host": "127.0.0.1", "port": args.port}, daemon=True).start()
+    time.sleep(0.3)
+
+    work = tempfile.mkdtemp(prefix="hiena-p2p-")
+    src = os.path.join(work, "payload.bin")
+    with open(src, "wb") as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+    want = _digest(src)
+
+    host = _join(LoopbackClient, args.port, "host", "sender", os.path.join(work, "sender"))
+    time.sleep(0.3)
+    receivers = []
+    for i in range(args.receivers):
+        cls = UnreachableClient if i < args.unreachable else LoopbackClient
+        if args.unreachable <= i < args.unreachable + args.silent:
+            cls = SilentClient
+        receivers.append(_join(cls, args.port, "join", f"r{i}", os.path.join(work, f"r{i}")))
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    if not host.offer_direct(src):
+        print("direct offer failed")
+        return 1
+
+    pending = {c.username: os.path.join(c.file_receiver.save_dir, "payload.bin") for c in receivers}
+    while pending and time.monotonic() - start < args.timeout:
+        for name, path in list(pending.items()):
+            owner = next(c for c in receivers if c.username == name)
+            if path in owner.saved:
+                print(f"{name}: {'OK' if _digest(path) == want else 'CORRUPT'} after {time.monotonic() - start:.2f}s")
+                del pending[name]
+        time.sleep(0.05)
+
+    for c in [host] + receivers:
+        c.close()
+    if pending:
+        print("missing:", ", ".join(sorted(pending)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
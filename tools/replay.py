@@ -0,0 +1,189 @@
+# tools/replay.py
+"""
+Replay a traffic capture (see server/capture.py) against a fresh server.
+
+Every captured connection is opened again and sent the same bytes, in the same
+recv()-sized pieces, at the captured times scaled by --speed (1 = real time,
+10 = ten times faster, 0 = as fast as possible). Replies are read and counted
+but not interpreted, so the server never blocks on a full socket buffer.
+
+By default a new server process is started on --port for each run, so the
+replay begins from an empty server exactly like the captured one did; --target
+replays against a server that is already running instead.
+
+    python hi_ena.py server --capture office.cap          # record a busy day
+    python tools/replay.py office.cap --speed 10
+    python tools/replay.py office.cap --speed 0 --trace    # plus the server's trace histograms
+
+Order is kept per connection and the records are sent in capture order. A
+connection that sends host/join/resume waits for the server's auth_result
+before the replay moves on, so at any speed every room exists before its
+members join and the same users end up in the same rooms; beyond that two
+connections' bytes can reach the server in a different order than they
+originally did (more likely at high speeds). Resume frames carry tokens of
+the captured server and are refused by the new one.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.capture import read_capture, OPENED, DATA, CLOSED
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTH_WAIT = 5.0   # seconds to wait for the auth_result of a replayed host/join/resume
+_AUTH_FRAME = re.compile(rb'"type": "(host|join|resume)"')
+
+
+class _Conn:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.received = 0
+        self.frames = 0
+        self.authed = asyncio.Event()
+        self.task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        try:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    return
+                self.received += len(chunk)
+                self.frames += chunk.count(b"\n")
+                if b'"auth_result"' in chunk:
+                    self.authed.set()
+        except (ConnectionError, OSError):
+            return
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def replay(path, host, port, speed, settle):
+    conns = {}     # capture connection id -> _Conn
+    closed = []
+    stats = {"connections": 0, "records": 0, "sent": 0, "failed": 0, "max_late": 0.0, "captured_s": 0.0,
+             "auth_timeouts": 0}
+    start = time.perf_counter()
+
+    for kind, cid, offset, payload in read_capture(path):
+        stats["records"] += 1
+        stats["captured_s"] = max(stats["captured_s"], offset)
+        if speed > 0:
+            delay = start + offset / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                stats["max_late"] = max(stats["max_late"], -delay)
+
+        if kind == OPENED:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as e:
+                print(f"[REPLAY] connection {cid} ({json.loads(payload).get('addr')}) failed: {e}")
+                stats["failed"] += 1
+                continue
+            conns[cid] = _Conn(reader, writer)
+            stats["connections"] += 1
+        elif kind == DATA:
+            conn = conns.get(cid)
+            if conn is None:
+                continue
+            auth = _AUTH_FRAME.search(payload) is not None
+            if auth:
+                conn.authed.clear()
+            conn.writer.write(payload)
+            stats["sent"] += len(payload)
+            try:
+                await conn.writer.drain()  # only waits when the server stops reading this connection
+                if auth:
+                    await asyncio.wait_for(conn.authed.wait(), AUTH_WAIT)
+            except asyncio.TimeoutError:
+                stats["auth_timeouts"] += 1
+            except (ConnectionError, OSError):
+                conns.pop(cid)
+                closed.append(conn)
+        elif kind == CLOSED:
+            conn = conns.pop(cid, None)
+            if conn is not None:
+                await conn.close()
+                closed.append(conn)
+
+    stats["replay_s"] = time.perf_counter() - start
+    await asyncio.sleep(settle)  # let the last replies arrive
+    for conn in conns.values():
+        await conn.close()
+    everyone = closed + list(conns.values())
+    for conn in everyone:
+        conn.task.cancel()
+    stats["received"] = sum(c.received for c in everyone)
+    stats["frames_received"] = sum(c.frames for c in everyone)
+    return stats
+
+
+def _admin(sock_path, action):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "hi_ena.py"), "admin", action,
+                           "--handoff-socket", sock_path], capture_output=True, text=True).stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a Hi-ena traffic capture")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale; 0 = as fast as possible")
+    parser.add_argument("--port", type=int, default=5597, help="port for the fresh server")
+    parser.add_argument("--target", default=None, metavar="HOST:PORT", help="replay against a running server instead")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait for replies after the last record")
+    parser.add_argument("--trace", action="store_true", help="print the fresh server's trace histograms afterwards")
+    parser.add_argument("--server-log", default=os.devnull, help="where the fresh server's output goes")
+    args = parser.parse_args()
+
+    server = None
+    sock_path = os.path.join(tempfile.mkdtemp(prefix="hiena-replay-"), "h.sock")
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", args.port
+        log = open(args.server_log, "w")
+        server = subprocess.Popen([sys.executable, "-u", os.path.join(ROOT, "hi_ena.py"), "server", "--host", host,
+                                   "--port", str(port), "--handoff-socket", sock_path],
+                                  stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 10
+        while not os.path.exists(sock_path) and time.time() < deadline:
+            time.sleep(0.05)
+
+    try:
+        stats = asyncio.run(replay(args.capture, host, port, args.speed, args.settle))
+        speedup = stats["captured_s"] / stats["replay_s"] if stats["replay_s"] else 0.0
+        print(f"replayed {stats['records']} records over {stats['connections']} connection(s) "
+              f"({stats['failed']} failed to connect, {stats['auth_timeouts']} auth replies timed out)")
+        print(f"  sent {stats['sent']:,} bytes in {stats['replay_s']:.2f}s "
+              f"(captured span {stats['captured_s']:.2f}s, {speedup:.1f}x)")
+        print(f"  received {stats['received']:,} bytes in {stats['frames_received']:,} frames")
+        if args.speed > 0:
+            print(f"  fell behind the schedule by at most {stats['max_late'] * 1000:.1f} ms")
+        if args.trace and server is not None:
+            print(_admin(sock_path, "trace"))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# tools/restart_probe.py
+"""
+Restart the server under chat load and count what the clients lost.
+
+Starts a server process, connects AsyncClient bots that each send a numbered
+message every --interval seconds, then starts a second server process with
+--takeover halfway through and waits for the first one to exit. At the end
+every bot must have received every other bot's messages, and no bot may have
+been disconnected. The longest gap between two deliveries shows the pause.
+
+    python tools/restart_probe.py --bots 50 --seconds 6 --restarts 2
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client.async_client import AsyncClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_server(port, sock_path, takeover, log):
+    cmd = [sys.executable, "-u", os.path.join(ROOT, "hi_ena.py"), "server", "--host", "127.0.0.1",
+           "--port", str(port), "--handoff-socket", sock_path]
+    if takeover:
+        cmd.append("--takeover")
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _bot(port, name, kind):
+    bot = AsyncClient("127.0.0.1", port, username=name)
+    await bot.connect()
+    ok, msg = await (bot.host if kind == "host" else bot.join)("probe", "pw", timeout=30)
+    if not ok:
+        raise RuntimeError(f"{name}: {msg}")
+    return bot
+
+
+async def _talk(bot, count, interval):
+    for i in range(count):
+        await bot.send(f"{bot.username}:{i}")
+        await asyncio.sleep(interval)
+
+
+async def _listen(bot, received, gaps, stop):
+    last = None
+    while True:
+        event = await bot.next_event(timeout=0.5)
+        if event is None:
+            if not bot.connected or stop.is_set():
+                return
+            continue
+        if event["type"] != "chat":
+            continue
+        received.add(event["data"].get("message"))
+        now = time.monotonic()
+        if last is not None:
+            gaps.append(now - last)
+        last = now
+
+
+async def run(args, restart):
+    bots = [await _bot(args.port, "bot0", "host")]
+    bots += await asyncio.gather(*(_bot(args.port, f"bot{i}", "join") for i in range(1, args.bots)))
+    await asyncio.sleep(0.5)
+
+    count = int(args.seconds / args.interval)
+    received = {b.username: set() for b in bots}
+    gaps = {b.username: [] for b in bots}
+    stop = asyncio.Event()
+    listeners = [asyncio.create_task(_listen(b, received[b.username], gaps[b.username], stop)) for b in bots]
+    talkers = [asyncio.create_task(_talk(b, count, args.interval)) for b in bots]
+
+    pauses = []
+    for n in range(args.restarts):
+        await asyncio.sleep(args.seconds / (args.restarts + 1))
+        pauses.append(await asyncio.get_running_loop().run_in_executor(None, restart))
+        print(f"restart {n + 1}: old server exited {pauses[-1]:.3f}s after the new one started")
+
+    await asyncio.gather(*talkers)
+    await asyncio.sleep(2.0)
+    stop.set()
+    await asyncio.gather(*listeners)
+
+    expected = (len(bots) - 1) * count
+    dropped = sum(expected - len(r) for r in received.values())
+    disconnected = [b.username for b in bots if not b.connected]
+    worst = max((max(g) for g in gaps.values() if g), default=0.0)
+    print(f"{len(bots)} bots x {count} messages: {dropped} of {expected * len(bots)} deliveries dropped, "
+          f"{len(disconnected)} bots disconnected, longest delivery gap {worst * 1000:.0f} ms "
+          f"(send interval {args.interval * 1000:.0f} ms)")
+    await asyncio.gather(*(b.close() for b in bots))
+    return 1 if dropped or disconnected else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero-downtime restart probe")
+    parser.add_argument("--port", type=int, default=5599)
+    parser.add_argument("--bots", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--restarts", type=int, default=1)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="hiena-restart-")
+    sock_path = os.path.join(work, "handoff.sock")
+    log = open(os.path.join(work, "server.log"), "wb")
+    servers = [_start_server(args.port, sock_path, False, log)]
+    time.sleep(0.5)
+
+    def restart():
+        start = time.monotonic()
+        servers.append(_start_server(args.port, sock_path, True, log))
+        servers[-2].wait(60)
+        return time.monotonic() - start
+
+    try:
+        status = asyncio.run(run(args, restart))
+    finally:
+        for s in servers:
+            if s.poll() is None:
+                s.terminate()
+        log.close()
+    print(f"server output: {log.name}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
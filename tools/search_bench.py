@@ -0,0 +1,131 @@
+# tools/search_bench.py
+"""
+Index a synthetic room history and time search pages.
+
+Messages are drawn from a Zipf-like vocabulary with occasional links and file
+offers, so there are very common, mid-frequency and rare words. Reports the
+indexing rate, the process' peak memory and per-query latency for first pages
+and for paging back.
+
+    python tools/search_bench.py --messages 2000000
+    python tools/search_bench.py --messages 200000 --server   # through a live server and the protocol
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.search import SearchIndex
+
+QUERIES = [
+    "the",                 # in most messages
+    "build",               # common
+    "deploy failed",       # two mid-frequency words
+    "github com",          # links
+    "report pdf",          # file names
+    "zebra42",             # rare
+    "the zebra42",         # rare AND common
+    "nosuchword",          # no match
+]
+
+
+def _vocabulary(size):
+    words = ["the", "a", "to", "is", "build", "deploy", "failed", "passed", "review", "lunch", "meeting",
+             "report", "github", "com", "link", "please", "thanks", "today", "tomorrow", "release"]
+    words += [f"w{i}" for i in range(size - len(words) - 1)] + ["zebra42"]
+    return words, list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+
+
+def _messages(count, seed=7):
+    rng = random.Random(seed)
+    words, cum_weights = _vocabulary(50000)
+    for i in range(count):
+        if i % 500 == 0:
+            yield "file", f"report-{i}.pdf"
+            continue
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 15)))
+        if i % 97 == 0:
+            text += f" https://github.com/team/repo/pull/{i}"
+        yield "chat", text
+
+
+def _time_queries(search, pages):
+    for query in QUERIES:
+        start = time.perf_counter()
+        results, cursor = search(query, None)
+        first = (time.perf_counter() - start) * 1000
+        slowest, total = first, len(results)
+        for _ in range(pages - 1):
+            if cursor is None:
+                break
+            start = time.perf_counter()
+            results, cursor = search(query, cursor)
+            slowest = max(slowest, (time.perf_counter() - start) * 1000)
+            total += len(results)
+        print(f"  {query!r:18} first page {first:7.2f} ms, slowest of {pages} pages {slowest:7.2f} ms, {total} results")
+
+
+def run_local(args):
+    index = SearchIndex(max_docs=args.messages)  # the whole history, not just the newest SEARCH_MAX_DOCS
+    start = time.perf_counter()
+    for i, (kind, text) in enumerate(_messages(args.messages)):
+        index.add("bench", f"user{i % 50}", text, kind=kind, seq=i + 1)
+    elapsed = time.perf_counter() - start
+    print(f"indexed {args.messages} messages in {elapsed:.1f}s ({args.messages / elapsed:,.0f}/s), "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    _time_queries(lambda q, before: index.search("bench", "user0", q, before=before), args.pages)
+
+
+async def run_server(args):
+    from server import main as server_main
+    from client.async_client import AsyncClient
+
+    server_main.search_index.max_docs = max(server_main.search_index.max_docs, args.messages)
+    for i, (kind, text) in enumerate(_messages(args.messages)):
+        server_main.search_index.add("bench", f"user{i % 50}", text, kind=kind, seq=i + 1)
+    bot = AsyncClient("127.0.0.1", args.port, username="user0")
+    await bot.connect()
+    ok, msg = await bot.host("bench", "pw")
+    if not ok:
+        raise SystemExit(msg)
+
+    def search(query, before):
+        # runs on an executor thread; the timing in _time_queries is the full round trip
+        reply = asyncio.run_coroutine_threadsafe(bot.search(query, before), loop).result()
+        return reply["results"], reply["next"]
+
+    loop = asyncio.get_running_loop()
+    print(f"{args.messages} messages indexed in the server; round trips over the protocol:")
+    await loop.run_in_executor(None, _time_queries, search, args.pages)
+    await bot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index benchmark")
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--server", action="store_true", help="query an in-process server over TCP")
+    parser.add_argument("--port", type=int, default=5596)
+    args = parser.parse_args()
+
+    if args.server:
+        from server import main as server_main
+        threading.Thread(target=server_main.start_server, kwargs={"host": "127.0.0.1", "port": args.port},
+                         daemon=True).start()
+        time.sleep(0.3)
+        asyncio.run(run_server(args))
+    else:
+        run_local(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# tools/send_bench.py
+"""
+Sustained relay send rate: one sender pushes a file through the server to one
+receiver and the rate is measured from the first frame to the receiver's
+on_saved callback.
+
+Loopback (starts its own server process):
+    python tools/send_bench.py --size-mb 512
+LAN (server already running elsewhere; sender and receiver both connect to it):
+    python tools/send_bench.py --host 192.168.1.20 --port 5555 --size-mb 512
+Many small files as one streamed archive (same total size):
+    python tools/send_bench.py --size-mb 256 --files 5000
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client.main import Client, sha256_hex
+from client.file_transfer import FileReceiver, send_file_chunks, send_archive_chunks
+
+
+class BenchClient(Client):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saved = threading.Event()
+        self.saved_path = None
+
+    def _on_file_saved(self, sender, saved_path):
+        self.saved_path = saved_path
+        self.saved.set()
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(d, f) for d, _dirs, files in os.walk(path) for f in files)
+    for p in paths:
+        h.update(os.path.relpath(p, path).encode("utf-8") if p != path else b"")
+        with open(p, "rb") as f:
+            while block := f.read(1024 * 1024):
+                h.update(block)
+    return h.hexdigest()
+
+
+def _join(host, port, kind, username, save_dir, room):
+    c = BenchClient(host, port)
+    c.username = username
+    c.p2p_enabled = False
+    c.file_receiver = FileReceiver(save_dir)
+    if not c.connect():
+        raise SystemExit(f"cannot connect to {host}:{port}")
+    ok, msg = c.authenticate(kind, {"server_name": room, "password_hash": sha256_hex("bench"), "username": username})
+    if not ok:
+        raise SystemExit(f"{username}: {msg}")
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay send throughput benchmark")
+    parser.add_argument("--host", default=None, help="existing server (default: start one on 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=5597)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--files", type=int, default=0, help="split the payload into this many files in a folder")
+    parser.add_argument("--verify", action="store_true", help="sha256 the received copy")
+    args = parser.parse_args()
+
+    host = args.host or "127.0.0.1"
+    server = None
+    if args.host is None:
+        # a separate process, as in real use, so the relay does not share our GIL
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        server = subprocess.Popen([sys.executable, os.path.join(root, "hi_ena.py"), "server",
+                                   "--host", host, "--port", str(args.port)], stdout=subprocess.DEVNULL)
+        time.sleep(0.5)
+
+    work = tempfile.mkdtemp(prefix="hiena-bench-")
+    if args.files:
+        src = os.path.join(work, "payload")
+        per_file = args.size_mb * 1024 * 1024 // args.files
+        for i in range(args.files):
+            sub = os.path.join(src, f"d{i // 500}")
+            os.makedirs(sub, exist_ok=True)
+            with open(os.path.join(sub, f"f{i}.bin"), "wb") as f:
+                f.write(os.urandom(per_file))
+        send = lambda: send_archive_chunks(sender, [src])
+    else:
+        src = os.path.join(work, "payload.bin")
+        with open(src, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        send = lambda: send_file_chunks(sender, src)
+
+    room = f"bench-{os.getpid()}"
+    sender = _join(host, args.port, "host", "sender", os.path.join(work, "sender"), room)
+    receiver = _join(host, args.port, "join", "receiver", os.path.join(work, "receiver"), room)
+    time.sleep(0.3)
+
+    rates = []
+    for run in range(args.runs):
+        receiver.saved.clear()
+        start = time.monotonic()
+        send()
+        sent = time.monotonic() - start
+        if not receiver.saved.wait(600):
+            raise SystemExit("receiver never finished")
+        elapsed = time.monotonic() - start
+        rates.append(args.size_mb / elapsed)
+        note = ""
+        if args.verify:
+            note = " OK" if _digest(receiver.saved_path) == _digest(src) else " CORRUPT"
+        print(f"run {run + 1}: {args.size_mb} MB in {elapsed:.2f}s = {rates[-1]:.1f} MB/s "
+              f"(sender done after {sent:.2f}s){note}")
+        if os.path.isdir(receiver.saved_path):
+            shutil.rmtree(receiver.saved_path)
+        else:
+            os.remove(receiver.saved_path)
+
+    print(f"best {max(rates):.1f} MB/s, median {sorted(rates)[len(rates) // 2]:.1f} MB/s")
+    sender.close()
+    receiver.close()
+    if server:
+        server.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())